@@ -8,12 +8,13 @@ import argparse
 from easydict import EasyDict as edict
 from tqdm import trange
 # from sklearn.model_selection import KFold
-from sklearn.linear_model import LogisticRegression
 
 YOUR_PATH = os.environ['YOUR_PATH']
 sys.path.insert(0, os.path.join(YOUR_PATH, 'fNIRS-mental-workload-classifiers/helpers'))
 import models
 import brain_data
+from model_bundles import featurizer_config, data_fingerprint, save_model_bundle
+from logistic_regression_path import fit_logistic_regression_path
 from utils import seed_everything, featurize, makedir_if_not_exist, plot_confusion_matrix, save_pickle, write_performance_info_FixedTrainValSplit
 
 parser = argparse.ArgumentParser()
@@ -88,6 +89,9 @@ def train_classifier(args_dict):
     #cross validation
     Cs = np.logspace(-5,5,11)
     
+    #the whole C grid as one warm-started regularization path, fitted on the first pass (the cv split is the same for every C)
+    path_model_dict = None
+    
     for C in Cs:
         experiment_name = 'C{}'.format(C)
         #derived args
@@ -155,8 +159,10 @@ def train_classifier(args_dict):
         sub_cv_val_feature_array = transformed_sub_train_feature_array[val_index]
         sub_cv_val_label_array = sub_train_label_array[val_index]
 
-        #create Logistic Regression object
-        model = LogisticRegression(C=C, random_state=0, max_iter=5000, solver='lbfgs').fit(sub_cv_train_feature_array, sub_cv_train_label_array)
+        #Logistic Regression object of this C
+        if path_model_dict is None:
+            path_model_dict = fit_logistic_regression_path(sub_cv_train_feature_array, sub_cv_train_label_array, Cs, max_iter=5000)
+        model = path_model_dict[C]
 
         # val performance 
         val_accuracy = model.score(sub_cv_val_feature_array, sub_cv_val_label_array) * 100
@@ -179,6 +185,9 @@ def train_classifier(args_dict):
         #write performance to txt file
         write_performance_info_FixedTrainValSplit('NA', result_save_subject_resultanalysisdir, val_accuracy, test_accuracy)
         
+        #save the fitted pipeline (see model_bundles.py)
+        save_model_bundle(result_save_subject_checkpointdir, model, featurizer_config(classification_task, window_size), data_fingerprint(sub_cv_train_feature_array, sub_cv_train_label_array))
+        
     
     
 if __name__=='__main__':
@@ -6,12 +6,13 @@ import argparse
 from easydict import EasyDict as edict
 from tqdm import trange
 # from sklearn.model_selection import KFold
-from sklearn.ensemble import RandomForestClassifier as rfc
 
 YOUR_PATH = os.environ['YOUR_PATH']
 sys.path.insert(0, os.path.join(YOUR_PATH, 'fNIRS-mental-workload-classifiers/helpers'))
 import models
 import brain_data
+from model_bundles import featurizer_config, data_fingerprint, save_model_bundle
+from random_forest_grid import random_forest_hyper_settings, run_random_forest_grid, accuracy_from_probabilities
 from utils import seed_everything, featurize, makedir_if_not_exist, plot_confusion_matrix, save_pickle, write_performance_info_FixedTrainValSplit
 
 parser = argparse.ArgumentParser()
@@ -22,6 +23,8 @@ parser.add_argument('--window_size', default=200, type=int, help='window size')
 parser.add_argument('--result_save_rootdir', default='./experiments', help='folder to the result')
 parser.add_argument('--SubjectId_of_interest', default='1', help='which subject of interest')
 parser.add_argument('--classification_task', default='four_class', help='binary or four-class classification')
+parser.add_argument('--num_workers', default=0, type=int, help='forests fitted in parallel, 0: one per hyper setting up to the cpu budget')
+parser.add_argument('--cpu_budget', default=0, type=int, help='cpus shared by the parallel forests, 0: all cpus')
 
 def train_classifier(args_dict):
     
@@ -83,102 +86,106 @@ def train_classifier(args_dict):
     transformed_sub_train_feature_array = featurize(sub_train_feature_array, classification_task)
     transformed_sub_test_feature_array = featurize(sub_test_feature_array, classification_task)
     
-    #cross validation
-    max_features_list = [0.166, 0.333, 0.667, 0.1]
-    min_samples_leaf_list = [4, 16, 64]   
-    
-    for max_features in max_features_list:
-        for min_samples_leaf in min_samples_leaf_list:
-            experiment_name = 'MaxFeatures{}_MinSamplesLeaf{}'.format(max_features, min_samples_leaf)
-            #derived args
-            result_save_subjectdir = os.path.join(result_save_rootdir, SubjectId_of_interest, experiment_name)
-            result_save_subject_checkpointdir = os.path.join(result_save_subjectdir, 'checkpoint')
-            result_save_subject_predictionsdir = os.path.join(result_save_subjectdir, 'predictions')
-            result_save_subject_resultanalysisdir = os.path.join(result_save_subjectdir, 'result_analysis')
-            result_save_subject_trainingcurvedir = os.path.join(result_save_subjectdir, 'trainingcurve')
-
-            makedir_if_not_exist(result_save_subjectdir)
-            makedir_if_not_exist(result_save_subject_checkpointdir)
-            makedir_if_not_exist(result_save_subject_predictionsdir)
-            makedir_if_not_exist(result_save_subject_resultanalysisdir)
-            makedir_if_not_exist(result_save_subject_trainingcurvedir)
-
-            result_save_dict = dict()
-
-            if classification_task == 'binary':
-                if window_size == 200:
-                    total_number_train_chunks = 304
-                    total_index = np.arange(total_number_train_chunks)
-                    train_index = total_index[:152]
-                    val_index = total_index[152:]
-        
-                elif window_size == 150:
-                    total_number_train_chunks = 368
-                    total_index = np.arange(total_number_train_chunks)
-                    train_index = total_index[:184]
-                    val_index = total_index[184:]
-        
-                elif window_size == 100:
-                    total_number_train_chunks = 436
-                    total_index = np.arange(total_number_train_chunks)
-                    train_index = total_index[:218]
-                    val_index = total_index[218:]
-        
-                elif window_size == 50:
-                    total_number_train_chunks = 504
-                    total_index = np.arange(total_number_train_chunks)
-                    train_index = total_index[:252]
-                    val_index = total_index[252:]
-                
-                elif window_size == 25:
-                    total_number_train_chunks = 536
-                    total_index = np.arange(total_number_train_chunks)
-                    train_index = total_index[:268]
-                    val_index = total_index[268:]
-        
-                elif window_size == 10:
-                    total_number_train_chunks = 556
-                    total_index = np.arange(total_number_train_chunks)
-                    train_index = total_index[:278]
-                    val_index = total_index[278:]
+    if classification_task == 'binary':
+        if window_size == 200:
+            total_number_train_chunks = 304
+            total_index = np.arange(total_number_train_chunks)
+            train_index = total_index[:152]
+            val_index = total_index[152:]
+
+        elif window_size == 150:
+            total_number_train_chunks = 368
+            total_index = np.arange(total_number_train_chunks)
+            train_index = total_index[:184]
+            val_index = total_index[184:]
+
+        elif window_size == 100:
+            total_number_train_chunks = 436
+            total_index = np.arange(total_number_train_chunks)
+            train_index = total_index[:218]
+            val_index = total_index[218:]
+
+        elif window_size == 50:
+            total_number_train_chunks = 504
+            total_index = np.arange(total_number_train_chunks)
+            train_index = total_index[:252]
+            val_index = total_index[252:]
         
-                else:
-                    raise NameError('not supported window size') 
-            else:
-                raise NameError('not implemented classification task')
-            
+        elif window_size == 25:
+            total_number_train_chunks = 536
+            total_index = np.arange(total_number_train_chunks)
+            train_index = total_index[:268]
+            val_index = total_index[268:]
+
+        elif window_size == 10:
+            total_number_train_chunks = 556
+            total_index = np.arange(total_number_train_chunks)
+            train_index = total_index[:278]
+            val_index = total_index[278:]
+
+        else:
+            raise NameError('not supported window size') 
+    else:
+        raise NameError('not implemented classification task')
+    
 
-            #only do 1 fold cross validation:
-            #dataset object
-            sub_cv_train_feature_array = transformed_sub_train_feature_array[train_index]
-            sub_cv_train_label_array = sub_train_label_array[train_index]
+    #only do 1 fold cross validation:
+    #dataset object
+    sub_cv_train_feature_array = transformed_sub_train_feature_array[train_index]
+    sub_cv_train_label_array = sub_train_label_array[train_index]
 
-            sub_cv_val_feature_array = transformed_sub_train_feature_array[val_index]
-            sub_cv_val_label_array = sub_train_label_array[val_index]
+    sub_cv_val_feature_array = transformed_sub_train_feature_array[val_index]
+    sub_cv_val_label_array = sub_train_label_array[val_index]
 
-            #create Logistic Regression object
-            model = rfc(max_features=max_features, min_samples_leaf=min_samples_leaf).fit(sub_cv_train_feature_array, sub_cv_train_label_array)
-            # val performance 
-            val_accuracy = model.score(sub_cv_val_feature_array, sub_cv_val_label_array) * 100
-            result_save_dict['bestepoch_val_accuracy'] = val_accuracy
+    #cross validation: all the hyper settings in parallel, one predict_proba per model and evaluation set
+    grid_results = run_random_forest_grid(sub_cv_train_feature_array, sub_cv_train_label_array, {'val': sub_cv_val_feature_array, 'test': transformed_sub_test_feature_array}, random_forest_hyper_settings(), num_workers=args_dict.num_workers, cpu_budget=args_dict.cpu_budget, return_models=True)
 
-            # test performance
-            test_accuracy = model.score(transformed_sub_test_feature_array, sub_test_label_array) * 100
-            test_logits = model.predict_proba(transformed_sub_test_feature_array)
-            test_class_predictions = test_logits.argmax(1)
+    #every fitted pipeline is saved as a model bundle (see model_bundles.py)
+    bundle_featurizer_config = featurizer_config(classification_task, window_size)
+    train_fingerprint = data_fingerprint(sub_cv_train_feature_array, sub_cv_train_label_array)
+    
+    for experiment_name, _ in random_forest_hyper_settings():
+        #derived args
+        result_save_subjectdir = os.path.join(result_save_rootdir, SubjectId_of_interest, experiment_name)
+        result_save_subject_checkpointdir = os.path.join(result_save_subjectdir, 'checkpoint')
+        result_save_subject_predictionsdir = os.path.join(result_save_subjectdir, 'predictions')
+        result_save_subject_resultanalysisdir = os.path.join(result_save_subjectdir, 'result_analysis')
+        result_save_subject_trainingcurvedir = os.path.join(result_save_subjectdir, 'trainingcurve')
 
-            result_save_dict['bestepoch_test_accuracy'] = test_accuracy
-            result_save_dict['bestepoch_test_logits'] = test_logits.copy()
-            result_save_dict['bestepoch_test_class_labels'] = sub_test_label_array.copy()
+        makedir_if_not_exist(result_save_subjectdir)
+        makedir_if_not_exist(result_save_subject_checkpointdir)
+        makedir_if_not_exist(result_save_subject_predictionsdir)
+        makedir_if_not_exist(result_save_subject_resultanalysisdir)
+        makedir_if_not_exist(result_save_subject_trainingcurvedir)
 
+        result_save_dict = dict()
 
-            plot_confusion_matrix(test_class_predictions, sub_test_label_array, confusion_matrix_figure_labels, result_save_subject_resultanalysisdir, 'test_confusion_matrix.png')
-        
-            save_pickle(result_save_subject_predictionsdir, 'result_save_dict.pkl', result_save_dict)
-        
-            #write performance to txt file
-            write_performance_info_FixedTrainValSplit('NA', result_save_subject_resultanalysisdir, val_accuracy, test_accuracy)
-        
+        classes = grid_results[experiment_name]['classes']
+        probabilities_dict = grid_results[experiment_name]['probabilities']
+
+        # val performance 
+        val_accuracy = accuracy_from_probabilities(classes, probabilities_dict['val'], sub_cv_val_label_array)
+        result_save_dict['bestepoch_val_accuracy'] = val_accuracy
+
+        # test performance
+        test_logits = probabilities_dict['test']
+        test_accuracy = accuracy_from_probabilities(classes, test_logits, sub_test_label_array)
+        test_class_predictions = test_logits.argmax(1)
+
+        result_save_dict['bestepoch_test_accuracy'] = test_accuracy
+        result_save_dict['bestepoch_test_logits'] = test_logits.copy()
+        result_save_dict['bestepoch_test_class_labels'] = sub_test_label_array.copy()
+
+
+        plot_confusion_matrix(test_class_predictions, sub_test_label_array, confusion_matrix_figure_labels, result_save_subject_resultanalysisdir, 'test_confusion_matrix.png')
+    
+        save_pickle(result_save_subject_predictionsdir, 'result_save_dict.pkl', result_save_dict)
+    
+        #write performance to txt file
+        write_performance_info_FixedTrainValSplit('NA', result_save_subject_resultanalysisdir, val_accuracy, test_accuracy)
+
+        #save the fitted pipeline
+        save_model_bundle(result_save_subject_checkpointdir, grid_results[experiment_name]['model'], bundle_featurizer_config, train_fingerprint)
     
     
 if __name__=='__main__':
@@ -193,6 +200,8 @@ if __name__=='__main__':
     result_save_rootdir = args.result_save_rootdir
     SubjectId_of_interest = args.SubjectId_of_interest
     classification_task = args.classification_task
+    num_workers = args.num_workers
+    cpu_budget = args.cpu_budget
     
     #sanity check 
     print('type(data_dir): {}'.format(type(data_dir)))
@@ -201,6 +210,8 @@ if __name__=='__main__':
     print('type(SubjectId_of_interest): {}'.format(type(SubjectId_of_interest)))
     print('type(result_save_rootdir): {}'.format(type(result_save_rootdir)))
     print('type(classification_task): {}'.format(type(classification_task)))
+    print('type(num_workers): {}'.format(type(num_workers)))
+    print('type(cpu_budget): {}'.format(type(cpu_budget)))
     
     args_dict = edict()
     args_dict.data_dir = data_dir
@@ -209,6 +220,8 @@ if __name__=='__main__':
     args_dict.result_save_rootdir = result_save_rootdir
     args_dict.SubjectId_of_interest = SubjectId_of_interest
     args_dict.classification_task = classification_task
+    args_dict.num_workers = num_workers
+    args_dict.cpu_budget = cpu_budget
     
     seed_everything(seed)
     train_classifier(args_dict)
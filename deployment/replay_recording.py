@@ -0,0 +1,76 @@
+#replay the recordings of subject csv files as a live stream (one line per sample), to drive run_streaming_classifier.py locally
+
+import os
+import sys
+import time
+import socket
+import argparse
+
+YOUR_PATH = os.environ['YOUR_PATH']
+sys.path.insert(0, os.path.join(YOUR_PATH, 'fNIRS-mental-workload-classifiers/helpers'))
+import brain_data
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--data_dir', default='../data/Leon/Visual/size_30sec_150ts_stride_3ts/', help='folder to the dataset')
+parser.add_argument('--subjects', default='86', help='comma separated subject ids, their samples are interleaved')
+parser.add_argument('--num_chunk_this_window_size', default=1488, type=int, help='number of chunks in each subject csv')
+parser.add_argument('--stride', default=3, type=int, help='stride of the sliding windows in the csv files')
+parser.add_argument('--sampling_rate', default=5.0, type=float, help='samples per second per subject (150 timesteps = 30 sec); 0 means as fast as possible')
+parser.add_argument('--target', default='socket', help='socket or file')
+parser.add_argument('--socket_address', default='127.0.0.1:5555', help="'host:port' or path of a unix socket")
+parser.add_argument('--output_file', default='None', help='file to append the samples to when target is file')
+
+
+def load_recordings(data_dir, subjects, num_chunk_this_window_size, stride):
+    recordings = dict()
+    for subject in subjects:
+        sub_feature_array, _ = brain_data.read_subject_csv_binary(os.path.join(data_dir, 'sub_{}.csv'.format(subject)), num_chunk_this_window_size=num_chunk_this_window_size)
+        recording_list, _ = brain_data.stitch_chunks_to_recordings(sub_feature_array, stride)
+        recordings[subject] = [sample for recording in recording_list for sample in recording]
+        print('subject {}: {} samples in {} recordings'.format(subject, len(recordings[subject]), len(recording_list)), flush=True)
+    
+    return recordings
+
+
+def replay(recordings, write_line, sampling_rate):
+    num_samples = max(len(samples) for samples in recordings.values())
+    start_time = time.time()
+    
+    for i in range(num_samples):
+        for subject, samples in recordings.items():
+            if i < len(samples):
+                write_line('{},{}\n'.format(subject, ','.join(repr(float(value)) for value in samples[i])))
+        
+        if sampling_rate > 0:
+            time.sleep(max(0.0, start_time + (i + 1) / sampling_rate - time.time()))
+    
+    write_line('END\n')
+
+
+if __name__=='__main__':
+    
+    args = parser.parse_args()
+    subjects = args.subjects.split(',')
+    
+    recordings = load_recordings(args.data_dir, subjects, args.num_chunk_this_window_size, args.stride)
+    
+    if args.target == 'socket':
+        if ':' in args.socket_address:
+            host, port = args.socket_address.rsplit(':', 1)
+            client_socket = socket.create_connection((host, int(port)))
+        else:
+            client_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            client_socket.connect(args.socket_address)
+        
+        with client_socket:
+            replay(recordings, lambda line: client_socket.sendall(line.encode()), args.sampling_rate)
+    
+    elif args.target == 'file':
+        with open(args.output_file, 'a') as f:
+            def write_line(line):
+                f.write(line)
+                f.flush()
+            replay(recordings, write_line, args.sampling_rate)
+    
+    else:
+        raise NameError('not supported target')
@@ -0,0 +1,179 @@
+import os
+import sys
+import csv
+import numpy as np
+
+import argparse
+
+from easydict import EasyDict as edict
+from sklearn.ensemble import RandomForestClassifier as rfc
+
+YOUR_PATH = os.environ['YOUR_PATH']
+sys.path.insert(0, os.path.join(YOUR_PATH, 'fNIRS-mental-workload-classifiers/helpers'))
+import brain_data
+from utils import generic_GetTrainValTestSubjects, seed_everything, featurize, makedir_if_not_exist
+from compiled_forest import compile_forest, benchmark_predict_proba
+from model_bundles import BUNDLE_FILENAME, featurizer_config, load_model_bundle
+from inference_backends import SklearnBackend, CompiledForestBackend, check_parity
+
+#checks the array layout of compiled_forest.py against sklearn's predict_proba on the test half of every test subject of a bucket, and
+#times both at batch size 1 (streaming path) and 1000
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--seed', default=0, type=int, help='random seed')
+parser.add_argument('--data_dir', default='../data/Leon/Visual/size_30sec_150ts_stride_3ts/', help='folder to the dataset')
+parser.add_argument('--window_size', default=150, type=int, help='window size')
+parser.add_argument('--classification_task', default='binary', help='binary or four-class classification')
+parser.add_argument('--experiment_name', default='MaxFeatures0.166_MinSamplesLeaf4', help='hyper setting of the forest to compile')
+parser.add_argument('--experiment_dir', default='None', help='result_save_rootdir of a generic_models/run_RandomForest.py run of this bucket: compile its saved model bundle instead of refitting the forest')
+parser.add_argument('--max_depth', default=0, type=int, help='also check a layout truncated at this depth, 0: no truncation')
+parser.add_argument('--batch_sizes', default=[1, 1000], type=int, nargs='+', help='batch sizes to benchmark')
+parser.add_argument('--num_repeats', default=100, type=int, help='calls per benchmark')
+parser.add_argument('--result_save_rootdir', default='./experiments/compiled_forest_parity', help='folder to save the compiled forest and the parity summary')
+parser.add_argument('--setting', default='64vs4_TestBucket1', help='which predefined train val test split scenario')
+
+
+def check_subjects(args_dict, train_subjects, test_subjects):
+
+    #convert to string list
+    train_subjects = [str(i) for i in train_subjects]
+    test_subjects = [str(i) for i in test_subjects]
+
+    #parse args:
+    data_dir = args_dict.data_dir
+    classification_task = args_dict.classification_task
+    experiment_name = args_dict.experiment_name
+    experiment_dir = args_dict.experiment_dir
+    max_depth = args_dict.max_depth
+    batch_sizes = args_dict.batch_sizes
+    num_repeats = args_dict.num_repeats
+    result_save_rootdir = args_dict.result_save_rootdir
+
+    num_chunk_this_window_size = 1488
+
+    if classification_task == 'binary':
+        data_loading_function = brain_data.read_subject_csv_binary
+
+    else:
+        raise NameError('not supported classification type')
+
+    makedir_if_not_exist(result_save_rootdir)
+
+    if experiment_dir != 'None':
+        #the generic forest is the same for every test subject of the bucket, its bundle is saved under each of them
+        bundle = load_model_bundle(os.path.join(experiment_dir, test_subjects[0], experiment_name, 'checkpoint', BUNDLE_FILENAME), expected_featurizer_config=featurizer_config(classification_task, args_dict.window_size))
+        classifier = bundle['classifier']
+
+    else:
+        #no saved model bundle: refit the requested hyper setting on the bucket's train subjects
+        group_model_sub_train_feature_list = []
+        group_model_sub_train_label_list = []
+
+        for subject in train_subjects:
+            sub_feature, sub_label = data_loading_function(os.path.join(data_dir, 'sub_{}.csv'.format(subject)), num_chunk_this_window_size=num_chunk_this_window_size)
+
+            group_model_sub_train_feature_list.append(sub_feature)
+            group_model_sub_train_label_list.append(sub_label)
+
+        group_model_sub_train_feature_array = np.concatenate(group_model_sub_train_feature_list, axis=0).astype(np.float32)
+        group_model_sub_train_label_array = np.concatenate(group_model_sub_train_label_list, axis=0)
+
+        transformed_group_model_sub_train_feature_array = featurize(group_model_sub_train_feature_array, classification_task)
+
+        max_features = float(experiment_name.split('MaxFeatures')[-1].split('_')[0])
+        min_samples_leaf = int(experiment_name.split('MinSamplesLeaf')[-1])
+        classifier = rfc(max_features=max_features, min_samples_leaf=min_samples_leaf).fit(transformed_group_model_sub_train_feature_array, group_model_sub_train_label_array)
+
+    featurize_function = lambda feature_array: featurize(feature_array, classification_task)
+    reference_backend = SklearnBackend(classifier, featurize_function)
+
+    #the layouts to check
+    compiled_forest_dict = dict()
+    compiled_forest_dict['float64'] = compile_forest(classifier, dtype=np.float64)
+    compiled_forest_dict['float32'] = compile_forest(classifier, dtype=np.float32)
+    if max_depth > 0:
+        compiled_forest_dict['float32_depth{}'.format(max_depth)] = compile_forest(classifier, dtype=np.float32, max_depth=max_depth)
+
+    for layout, compiled_forest in compiled_forest_dict.items():
+        compiled_forest.save(os.path.join(result_save_rootdir, 'RandomForest_{}_{}.npz'.format(experiment_name, layout)))
+        print('{} layout: {} nodes, {} traversal rounds, {} MB'.format(layout, compiled_forest.num_nodes, compiled_forest.max_depth, round(sum(array.nbytes for array in [compiled_forest.feature, compiled_forest.threshold, compiled_forest.left, compiled_forest.right, compiled_forest.value]) / 2**20, 2)), flush=True)
+
+    summary_filename = os.path.join(result_save_rootdir, 'parity_summary.csv')
+    fieldnames = ['subject_id', 'experiment_name', 'layout', 'max_abs_difference', 'prediction_agreement', 'reference_accuracy', 'candidate_accuracy', 'reference_time', 'candidate_time'] + ['sklearn_seconds_batch{}'.format(batch_size) for batch_size in batch_sizes] + ['compiled_seconds_batch{}'.format(batch_size) for batch_size in batch_sizes]
+
+    with open(summary_filename, mode='w') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+        writer.writeheader()
+
+        for test_subject in test_subjects:
+            #load this subject's test data
+            sub_feature_array, sub_label_array = data_loading_function(os.path.join(data_dir, 'sub_{}.csv'.format(test_subject)), num_chunk_this_window_size=num_chunk_this_window_size)
+
+            sub_data_len = len(sub_label_array)
+            assert sub_data_len == int(num_chunk_this_window_size/2), 'subject {} len is not {} for binary classification'.format(test_subject, int(num_chunk_this_window_size/2))
+            half_sub_data_len = int(sub_data_len/2)
+
+            sub_test_feature_array = sub_feature_array[half_sub_data_len:]
+            sub_test_label_array = sub_label_array[half_sub_data_len:]
+
+            #the benchmarks time the classifiers only, on the featurized chunks
+            transformed_sub_test_feature_array = featurize_function(sub_test_feature_array)
+
+            for layout, compiled_forest in compiled_forest_dict.items():
+                parity_dict = check_parity(reference_backend, CompiledForestBackend(compiled_forest, featurize_function), sub_test_feature_array, sub_test_label_array)
+
+                for batch_size in batch_sizes:
+                    parity_dict['sklearn_seconds_batch{}'.format(batch_size)] = benchmark_predict_proba(classifier.predict_proba, transformed_sub_test_feature_array, batch_size, num_repeats)
+                    parity_dict['compiled_seconds_batch{}'.format(batch_size)] = benchmark_predict_proba(compiled_forest.predict_proba, transformed_sub_test_feature_array, batch_size, num_repeats)
+
+                print('subject {} {} parity: {}'.format(test_subject, layout, parity_dict), flush=True)
+
+                parity_dict.update(subject_id=test_subject, experiment_name=experiment_name, layout=layout)
+                writer.writerow(parity_dict)
+
+
+
+if __name__=='__main__':
+
+    #parse args
+    args = parser.parse_args()
+
+    seed = args.seed
+    data_dir = args.data_dir
+    window_size = args.window_size
+    classification_task = args.classification_task
+    experiment_name = args.experiment_name
+    experiment_dir = args.experiment_dir
+    max_depth = args.max_depth
+    batch_sizes = args.batch_sizes
+    num_repeats = args.num_repeats
+    result_save_rootdir = args.result_save_rootdir
+    setting = args.setting
+
+    test_subjects, train_subjects, _ = generic_GetTrainValTestSubjects(setting)
+
+    #sanity check:
+    print('data_dir: {}, type: {}'.format(data_dir, type(data_dir)))
+    print('window_size: {}, type: {}'.format(window_size, type(window_size)))
+    print('classification_task: {}, type: {}'.format(classification_task, type(classification_task)))
+    print('experiment_name: {}, type: {}'.format(experiment_name, type(experiment_name)))
+    print('experiment_dir: {}, type: {}'.format(experiment_dir, type(experiment_dir)))
+    print('max_depth: {}, type: {}'.format(max_depth, type(max_depth)))
+    print('batch_sizes: {}, type: {}'.format(batch_sizes, type(batch_sizes)))
+    print('num_repeats: {}, type: {}'.format(num_repeats, type(num_repeats)))
+    print('result_save_rootdir: {}, type: {}'.format(result_save_rootdir, type(result_save_rootdir)))
+    print('setting: {} type: {}'.format(setting, type(setting)))
+
+    args_dict = edict()
+    args_dict.data_dir = data_dir
+    args_dict.window_size = window_size
+    args_dict.classification_task = classification_task
+    args_dict.experiment_name = experiment_name
+    args_dict.experiment_dir = experiment_dir
+    args_dict.max_depth = max_depth
+    args_dict.batch_sizes = batch_sizes
+    args_dict.num_repeats = num_repeats
+    args_dict.result_save_rootdir = result_save_rootdir
+
+    seed_everything(seed)
+    check_subjects(args_dict, train_subjects, test_subjects)
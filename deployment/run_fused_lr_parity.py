@@ -0,0 +1,145 @@
+import os
+import sys
+import csv
+import numpy as np
+
+import argparse
+
+from easydict import EasyDict as edict
+
+YOUR_PATH = os.environ['YOUR_PATH']
+sys.path.insert(0, os.path.join(YOUR_PATH, 'fNIRS-mental-workload-classifiers/helpers'))
+import brain_data
+from utils import generic_GetTrainValTestSubjects, seed_everything, makedir_if_not_exist, load_pickle
+from model_bundles import BUNDLE_FILENAME, featurizer_config, load_model_bundle, bundle_featurize_function
+from fused_logistic_regression import fuse_model_bundle
+from compiled_forest import benchmark_predict_proba
+from inference_backends import SklearnBackend, FusedLogisticRegressionBackend, check_parity
+
+#checks the fused featurize + Logistic Regression (+ CORAL) scoring function of fused_logistic_regression.py against the saved sklearn
+#pipeline on the test half of every test subject of a bucket, and times both per raw window at batch size 1 (streaming path) and 1000
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--seed', default=0, type=int, help='random seed')
+parser.add_argument('--data_dir', default='../data/Leon/Visual/size_30sec_150ts_stride_3ts/', help='folder to the dataset')
+parser.add_argument('--window_size', default=150, type=int, help='window size')
+parser.add_argument('--classification_task', default='binary', help='binary or four-class classification')
+parser.add_argument('--experiment_dir', default='./experiments/generic_models/LogisticRegression/binary/64vs4/TestBucket1', help='result_save_rootdir of a Logistic Regression run (generic_models, subject_specific_models or the CORAL runners) whose model bundles are fused')
+parser.add_argument('--experiment_name', default='C1.0', help='hyper setting to fuse')
+parser.add_argument('--batch_sizes', default=[1, 1000], type=int, nargs='+', help='batch sizes to benchmark')
+parser.add_argument('--num_repeats', default=100, type=int, help='calls per benchmark')
+parser.add_argument('--result_save_rootdir', default='./experiments/fused_lr_parity', help='folder to save the fused weights and the parity summary')
+parser.add_argument('--setting', default='64vs4_TestBucket1', help='which predefined train val test split scenario')
+
+
+def check_subjects(args_dict, test_subjects):
+
+    #convert to string list
+    test_subjects = [str(i) for i in test_subjects]
+
+    #parse args:
+    data_dir = args_dict.data_dir
+    window_size = args_dict.window_size
+    classification_task = args_dict.classification_task
+    experiment_dir = args_dict.experiment_dir
+    experiment_name = args_dict.experiment_name
+    batch_sizes = args_dict.batch_sizes
+    num_repeats = args_dict.num_repeats
+    result_save_rootdir = args_dict.result_save_rootdir
+
+    num_chunk_this_window_size = 1488
+
+    if classification_task == 'binary':
+        data_loading_function = brain_data.read_subject_csv_binary
+
+    else:
+        raise NameError('not supported classification type')
+
+    makedir_if_not_exist(result_save_rootdir)
+
+    summary_filename = os.path.join(result_save_rootdir, 'parity_summary.csv')
+    fieldnames = ['subject_id', 'experiment_name', 'coral_mode', 'max_abs_difference', 'stored_max_abs_difference', 'prediction_agreement', 'reference_accuracy', 'candidate_accuracy', 'reference_time', 'candidate_time'] + ['sklearn_seconds_batch{}'.format(batch_size) for batch_size in batch_sizes] + ['fused_seconds_batch{}'.format(batch_size) for batch_size in batch_sizes]
+
+    with open(summary_filename, mode='w') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+        writer.writeheader()
+
+        for test_subject in test_subjects:
+            result_save_subjectdir = os.path.join(experiment_dir, test_subject, experiment_name)
+
+            #the saved pipeline: classifier, featurizer config and CORAL alignment of this subject (see model_bundles.py)
+            bundle = load_model_bundle(os.path.join(result_save_subjectdir, 'checkpoint', BUNDLE_FILENAME), expected_featurizer_config=featurizer_config(classification_task, window_size))
+            reference_backend = SklearnBackend(bundle['classifier'], bundle_featurize_function(bundle))
+
+            fused_model = fuse_model_bundle(bundle)
+            fused_model.save(os.path.join(result_save_rootdir, 'LogisticRegression_{}_sub{}.npz'.format(experiment_name, test_subject)))
+            candidate_backend = FusedLogisticRegressionBackend(fused_model)
+
+            #load this subject's test data
+            sub_feature_array, sub_label_array = data_loading_function(os.path.join(data_dir, 'sub_{}.csv'.format(test_subject)), num_chunk_this_window_size=num_chunk_this_window_size)
+
+            sub_data_len = len(sub_label_array)
+            half_sub_data_len = int(sub_data_len/2)
+
+            sub_test_feature_array = sub_feature_array[half_sub_data_len:]
+            sub_test_label_array = sub_label_array[half_sub_data_len:]
+
+            parity_dict = check_parity(reference_backend, candidate_backend, sub_test_feature_array, sub_test_label_array)
+
+            #the test logits the runner saved for this subject
+            result_save_dict = load_pickle(os.path.join(result_save_subjectdir, 'predictions'), 'result_save_dict.pkl')
+            parity_dict['stored_max_abs_difference'] = float(np.max(np.abs(result_save_dict['bestepoch_test_logits'] - candidate_backend.predict(sub_test_feature_array))))
+
+            #both time the whole pipeline, from the raw windows
+            for batch_size in batch_sizes:
+                parity_dict['sklearn_seconds_batch{}'.format(batch_size)] = benchmark_predict_proba(reference_backend.predict, sub_test_feature_array, batch_size, num_repeats)
+                parity_dict['fused_seconds_batch{}'.format(batch_size)] = benchmark_predict_proba(candidate_backend.predict, sub_test_feature_array, batch_size, num_repeats)
+
+            print('subject {} parity: {}'.format(test_subject, parity_dict), flush=True)
+
+            parity_dict.update(subject_id=test_subject, experiment_name=experiment_name, coral_mode=bundle['extra'].get('coral_mode', 'None'))
+            writer.writerow(parity_dict)
+
+
+
+if __name__=='__main__':
+
+    #parse args
+    args = parser.parse_args()
+
+    seed = args.seed
+    data_dir = args.data_dir
+    window_size = args.window_size
+    classification_task = args.classification_task
+    experiment_dir = args.experiment_dir
+    experiment_name = args.experiment_name
+    batch_sizes = args.batch_sizes
+    num_repeats = args.num_repeats
+    result_save_rootdir = args.result_save_rootdir
+    setting = args.setting
+
+    test_subjects, _, _ = generic_GetTrainValTestSubjects(setting)
+
+    #sanity check:
+    print('data_dir: {}, type: {}'.format(data_dir, type(data_dir)))
+    print('window_size: {}, type: {}'.format(window_size, type(window_size)))
+    print('classification_task: {}, type: {}'.format(classification_task, type(classification_task)))
+    print('experiment_dir: {}, type: {}'.format(experiment_dir, type(experiment_dir)))
+    print('experiment_name: {}, type: {}'.format(experiment_name, type(experiment_name)))
+    print('batch_sizes: {}, type: {}'.format(batch_sizes, type(batch_sizes)))
+    print('num_repeats: {}, type: {}'.format(num_repeats, type(num_repeats)))
+    print('result_save_rootdir: {}, type: {}'.format(result_save_rootdir, type(result_save_rootdir)))
+    print('setting: {} type: {}'.format(setting, type(setting)))
+
+    args_dict = edict()
+    args_dict.data_dir = data_dir
+    args_dict.window_size = window_size
+    args_dict.classification_task = classification_task
+    args_dict.experiment_dir = experiment_dir
+    args_dict.experiment_name = experiment_name
+    args_dict.batch_sizes = batch_sizes
+    args_dict.num_repeats = num_repeats
+    args_dict.result_save_rootdir = result_save_rootdir
+
+    seed_everything(seed)
+    check_subjects(args_dict, test_subjects)
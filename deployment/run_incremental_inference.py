@@ -0,0 +1,137 @@
+import os
+import sys
+import csv
+import torch
+
+import argparse
+
+from easydict import EasyDict as edict
+
+YOUR_PATH = os.environ['YOUR_PATH']
+sys.path.insert(0, os.path.join(YOUR_PATH, 'fNIRS-mental-workload-classifiers/helpers'))
+import models
+import brain_data
+from utils import generic_GetTrainValTestSubjects, seed_everything, makedir_if_not_exist
+from inference_backends import TorchBackend, IncrementalBackend, check_parity
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--seed', default=0, type=int, help='random seed')
+parser.add_argument('--data_dir', default='../data/Leon/Visual/size_30sec_150ts_stride_3ts/', help='folder to the dataset')
+parser.add_argument('--window_size', default=150, type=int, help='window size')
+parser.add_argument('--stride', default=3, type=int, help='stride of the sliding windows in the csv files')
+parser.add_argument('--classification_task', default='binary', help='binary or four-class classification')
+parser.add_argument('--model_name', default='EEGNet', help='EEGNet or DeepConvNet')
+parser.add_argument('--experiment_dir', default='./experiments/generic_models/EEGNet/binary/64vs4/TestBucket1', help='result_save_rootdir of the generic model run')
+parser.add_argument('--experiment_name', default='lr0.001_dropout0.25', help='hyper setting to load, e.g. lr0.001_dropout0.25')
+parser.add_argument('--result_save_rootdir', default='./experiments/incremental_inference', help='folder to save the summary')
+parser.add_argument('--setting', default='64vs4_TestBucket1', help='which predefined train val test split scenario')
+
+
+def check_subjects(args_dict, test_subjects):
+
+    #convert to string list
+    test_subjects = [str(i) for i in test_subjects]
+
+    #parse args:
+    data_dir = args_dict.data_dir
+    window_size = args_dict.window_size
+    stride = args_dict.stride
+    classification_task = args_dict.classification_task
+    model_name = args_dict.model_name
+    experiment_dir = args_dict.experiment_dir
+    experiment_name = args_dict.experiment_name
+    result_save_rootdir = args_dict.result_save_rootdir
+
+    num_chunk_this_window_size = 1488
+
+    if classification_task == 'binary':
+        data_loading_function = brain_data.read_subject_csv_binary
+
+    else:
+        raise NameError('not supported classification type')
+
+    if model_name == 'EEGNet':
+        model_to_use = models.EEGNet150
+
+    elif model_name == 'DeepConvNet':
+        model_to_use = models.DeepConvNet150
+
+    else:
+        raise NameError('not supported model_name')
+
+    makedir_if_not_exist(result_save_rootdir)
+
+    summary_filename = os.path.join(result_save_rootdir, 'incremental_summary.csv')
+    fieldnames = ['subject_id', 'model_name', 'experiment_name', 'max_abs_difference', 'prediction_agreement', 'reference_accuracy', 'candidate_accuracy', 'reference_time', 'candidate_time']
+
+    with open(summary_filename, mode='w') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+        writer.writeheader()
+
+        for test_subject in test_subjects:
+            #load this subject's test data
+            sub_feature_array, sub_label_array = data_loading_function(os.path.join(data_dir, 'sub_{}.csv'.format(test_subject)), num_chunk_this_window_size=num_chunk_this_window_size)
+
+            sub_data_len = len(sub_label_array)
+            assert sub_data_len == int(num_chunk_this_window_size/2), 'subject {} len is not {} for binary classification'.format(test_subject, int(num_chunk_this_window_size/2))
+            half_sub_data_len = int(sub_data_len/2)
+
+            sub_test_feature_array = sub_feature_array[half_sub_data_len:]
+            sub_test_label_array = sub_label_array[half_sub_data_len:]
+
+            checkpoint_path = os.path.join(experiment_dir, test_subject, experiment_name, 'checkpoint', 'best_model.statedict')
+            print('loading checkpoint: {}'.format(checkpoint_path))
+
+            model = model_to_use()
+            model.load_state_dict(torch.load(checkpoint_path, map_location=torch.device('cpu')))
+
+            #reference: every chunk through model.forward, candidate: one front-end pass per stitched recording
+            parity_dict = check_parity(TorchBackend(model), IncrementalBackend(model, num_timesteps=window_size, stride=stride), sub_test_feature_array, sub_test_label_array)
+            print('subject {} incremental vs forward: {}'.format(test_subject, parity_dict), flush=True)
+
+            parity_dict.update(subject_id=test_subject, model_name=model_name, experiment_name=experiment_name)
+            writer.writerow(parity_dict)
+
+
+
+if __name__=='__main__':
+
+    #parse args
+    args = parser.parse_args()
+
+    seed = args.seed
+    data_dir = args.data_dir
+    window_size = args.window_size
+    stride = args.stride
+    classification_task = args.classification_task
+    model_name = args.model_name
+    experiment_dir = args.experiment_dir
+    experiment_name = args.experiment_name
+    result_save_rootdir = args.result_save_rootdir
+    setting = args.setting
+
+    test_subjects, _, _ = generic_GetTrainValTestSubjects(setting)
+
+    #sanity check:
+    print('data_dir: {}, type: {}'.format(data_dir, type(data_dir)))
+    print('window_size: {}, type: {}'.format(window_size, type(window_size)))
+    print('stride: {}, type: {}'.format(stride, type(stride)))
+    print('classification_task: {}, type: {}'.format(classification_task, type(classification_task)))
+    print('model_name: {}, type: {}'.format(model_name, type(model_name)))
+    print('experiment_dir: {}, type: {}'.format(experiment_dir, type(experiment_dir)))
+    print('experiment_name: {}, type: {}'.format(experiment_name, type(experiment_name)))
+    print('result_save_rootdir: {}, type: {}'.format(result_save_rootdir, type(result_save_rootdir)))
+    print('setting: {} type: {}'.format(setting, type(setting)))
+
+    args_dict = edict()
+    args_dict.data_dir = data_dir
+    args_dict.window_size = window_size
+    args_dict.stride = stride
+    args_dict.classification_task = classification_task
+    args_dict.model_name = model_name
+    args_dict.experiment_dir = experiment_dir
+    args_dict.experiment_name = experiment_name
+    args_dict.result_save_rootdir = result_save_rootdir
+
+    seed_everything(seed)
+    check_subjects(args_dict, test_subjects)
@@ -0,0 +1,343 @@
+#local inference server: many sessions send single windows, the MicroBatcher (helpers/micro_batching.py) coalesces them into batches
+#
+#http:  POST /predict {"subject_id": "86", "window": [[8 values] x 150]} -> {"subject_id", "scores", "predicted_class"}
+#       GET /stats, POST /shutdown
+#unix:  one JSON object per line, same request/reply as http, plus {"command": "stats"} and {"command": "shutdown"}
+#
+#every reply carries a "status" (200, 400 bad request, 503 overloaded, 504 timed out, 500 model error)
+
+import os
+import sys
+import json
+import queue
+import socketserver
+import threading
+
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from easydict import EasyDict as edict
+
+YOUR_PATH = os.environ['YOUR_PATH']
+sys.path.insert(0, os.path.join(YOUR_PATH, 'fNIRS-mental-workload-classifiers/helpers'))
+import models
+from utils import makedir_if_not_exist
+from inference_backends import TorchBackend, IncrementalBackend, SklearnBackend, CompiledForestBackend, FusedLogisticRegressionBackend
+from model_bundles import BUNDLE_FILENAME, load_model_bundle, bundle_featurize_function
+from compiled_forest import compile_forest
+from fused_logistic_regression import fuse_model_bundle
+from micro_batching import MicroBatcher
+from model_registry import ModelRegistry, index_best_checkpoints, load_state_dict
+from adapters import load_adapted_model
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--model_name', default='EEGNet', help='EEGNet, DeepConvNet, LogisticRegression or RandomForest')
+parser.add_argument('--backend', default='torch', help='torch or incremental for EEGNet/DeepConvNet, sklearn, compiled_forest (RandomForest only) or fused_lr (LogisticRegression only) for the model bundles of the sklearn runners')
+parser.add_argument('--experiment_dir', default='./experiments/generic_models/EEGNet/binary/64vs4/TestBucket1', help='result_save_rootdir of the run whose <subject>/<experiment_name>/checkpoint/best_model.statedict are served')
+parser.add_argument('--experiment_name', default='best', help="hyper setting to serve, e.g. lr0.001_dropout0.25; 'best' serves each subject's best validation setting from its hypersearch summary")
+parser.add_argument('--backbone_file', default='None', help='generic model xxx.statedict: serve the per-subject adapters (checkpoint/best_adapter.statedict) of run_adapter_finetuning.py on top of it')
+parser.add_argument('--max_models', default=8, type=int, help='number of live models kept in the LRU model registry')
+parser.add_argument('--prefetch_subjects', default='', help='comma separated subject ids to load before serving')
+parser.add_argument('--window_size', default=150, type=int, help='window size')
+parser.add_argument('--max_batch_size', default=32, type=int, help='max number of requests coalesced into one batch')
+parser.add_argument('--max_wait_ms', default=5.0, type=float, help='max time a batch waits for more requests after its first one')
+parser.add_argument('--max_queue_size', default=1024, type=int, help='requests queued beyond this are rejected as overloaded')
+parser.add_argument('--request_timeout', default=10.0, type=float, help='seconds a request may take before it is answered as timed out')
+parser.add_argument('--server_type', default='http', help='http or unix')
+parser.add_argument('--address', default='127.0.0.1:8000', help="'host:port' for http, path of the socket for unix")
+parser.add_argument('--result_save_rootdir', default='./experiments/inference_server', help='folder to save the serving stats at shutdown')
+
+
+def create_bundle_loader(model_name, backend_name, window_size):
+    '''
+    the sklearn runners save checkpoint/model_bundle.joblib (see model_bundles.py), memory mapped at load
+    '''
+
+    if backend_name not in ['sklearn', 'compiled_forest', 'fused_lr'] or (backend_name == 'compiled_forest' and model_name != 'RandomForest') or (backend_name == 'fused_lr' and model_name != 'LogisticRegression'):
+        raise NameError('not supported backend')
+
+    def load_model(subject_id, checkpoint_path):
+        print('loading model bundle: {}'.format(checkpoint_path), flush=True)
+
+        bundle = load_model_bundle(checkpoint_path, expected_featurizer_config={'window_size': window_size})
+        featurize_function = bundle_featurize_function(bundle)
+
+        if backend_name == 'fused_lr':
+            return FusedLogisticRegressionBackend(fuse_model_bundle(bundle))
+        if backend_name == 'compiled_forest':
+            return CompiledForestBackend(compile_forest(bundle['classifier']), featurize_function)
+        return SklearnBackend(bundle['classifier'], featurize_function)
+
+    return load_model
+
+
+def create_model_loader(model_name, backend_name, window_size, backbone_state_dict=None):
+
+    if model_name in ['LogisticRegression', 'RandomForest']:
+        return create_bundle_loader(model_name, backend_name, window_size)
+
+    elif model_name == 'EEGNet':
+        model_to_use = models.EEGNet150
+
+    elif model_name == 'DeepConvNet':
+        model_to_use = models.DeepConvNet150
+
+    else:
+        raise NameError('not supported model_name')
+
+    if backend_name not in ['torch', 'incremental']:
+        raise NameError('not supported backend')
+
+    def load_model(subject_id, checkpoint_path):
+        print('loading checkpoint: {}'.format(checkpoint_path), flush=True)
+
+        if backbone_state_dict is not None:
+            #adapter checkpoint: a few KB, folded into the shared backbone
+            model = load_adapted_model(model_to_use, backbone_state_dict, checkpoint_path)
+        else:
+            model = model_to_use()
+            model.load_state_dict(load_state_dict(checkpoint_path))
+
+        if backend_name == 'incremental':
+            return IncrementalBackend(model, num_timesteps=window_size)
+        return TorchBackend(model)
+
+    return load_model
+
+
+def handle_request(batcher, request_dict, request_timeout):
+    '''
+    returns the reply dict of one predict request
+    '''
+
+    try:
+        subject_id = str(request_dict['subject_id'])
+        window = request_dict['window']
+        future = batcher.submit(subject_id, window)
+    except (KeyError, TypeError, ValueError) as exception:
+        return {'status': 400, 'error': 'bad request: {}'.format(exception)}
+    except queue.Full:
+        return {'status': 503, 'error': 'overloaded'}
+
+    try:
+        scores = future.result(request_timeout)
+    except FutureTimeoutError:
+        return {'status': 504, 'error': 'timed out'}
+    except Exception as exception:
+        return {'status': 500, 'error': str(exception)}
+
+    return {'status': 200, 'subject_id': subject_id, 'scores': scores.tolist(), 'predicted_class': int(scores.argmax())}
+
+
+class InferenceHTTPRequestHandler(BaseHTTPRequestHandler):
+    #keep-alive, so a session does not open a connection per window
+    protocol_version = 'HTTP/1.1'
+
+    def _send_json(self, reply_dict):
+        body = json.dumps(reply_dict).encode()
+
+        self.send_response(reply_dict.get('status', 200))
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._send_json(self.server.serving_summary())
+        else:
+            self._send_json({'status': 404, 'error': 'not found'})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        if self.path == '/predict':
+            try:
+                request_dict = json.loads(body)
+            except ValueError:
+                self._send_json({'status': 400, 'error': 'invalid json'})
+                return
+
+            if not isinstance(request_dict, dict):
+                self._send_json({'status': 400, 'error': 'expected a json object'})
+                return
+
+            self._send_json(handle_request(self.server.batcher, request_dict, self.server.request_timeout))
+
+        elif self.path == '/shutdown':
+            self._send_json({'status': 200})
+            threading.Thread(target=self.server.shutdown).start()
+
+        else:
+            self._send_json({'status': 404, 'error': 'not found'})
+
+    def log_message(self, format, *args):
+        #no stderr line per request
+        pass
+
+
+class InferenceLineRequestHandler(socketserver.StreamRequestHandler):
+
+    def _send_json(self, reply_dict):
+        self.wfile.write((json.dumps(reply_dict) + '\n').encode())
+        self.wfile.flush()
+
+    def handle(self):
+        for line in self.rfile:
+            if line.strip() == b'':
+                continue
+
+            try:
+                request_dict = json.loads(line)
+            except ValueError:
+                self._send_json({'status': 400, 'error': 'invalid json'})
+                continue
+
+            if not isinstance(request_dict, dict):
+                self._send_json({'status': 400, 'error': 'expected a json object'})
+                continue
+
+            command = request_dict.get('command', 'predict')
+            if command == 'predict':
+                self._send_json(handle_request(self.server.batcher, request_dict, self.server.request_timeout))
+            elif command == 'stats':
+                self._send_json(self.server.serving_summary())
+            elif command == 'shutdown':
+                self._send_json({'status': 200})
+                threading.Thread(target=self.server.shutdown).start()
+                return
+            else:
+                self._send_json({'status': 400, 'error': 'unknown command {}'.format(command)})
+
+
+class ThreadingUnixInferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(server_type, address):
+
+    if server_type == 'http':
+        host, port = address.rsplit(':', 1)
+        server = ThreadingHTTPServer((host, int(port)), InferenceHTTPRequestHandler)
+
+    elif server_type == 'unix':
+        if os.path.exists(address):
+            os.remove(address)
+        server = ThreadingUnixInferenceServer(address, InferenceLineRequestHandler)
+
+    else:
+        raise NameError('not supported server_type')
+
+    server.daemon_threads = True
+
+    return server
+
+
+def serve(args_dict):
+
+    #parse args:
+    model_name = args_dict.model_name
+    backend_name = args_dict.backend
+    experiment_dir = args_dict.experiment_dir
+    experiment_name = args_dict.experiment_name
+    backbone_file = args_dict.backbone_file
+    max_models = args_dict.max_models
+    prefetch_subjects = args_dict.prefetch_subjects
+    window_size = args_dict.window_size
+    max_batch_size = args_dict.max_batch_size
+    max_wait_ms = args_dict.max_wait_ms
+    max_queue_size = args_dict.max_queue_size
+    request_timeout = args_dict.request_timeout
+    server_type = args_dict.server_type
+    address = args_dict.address
+    result_save_rootdir = args_dict.result_save_rootdir
+
+    makedir_if_not_exist(result_save_rootdir)
+
+    if model_name in ['LogisticRegression', 'RandomForest']:
+        backbone_state_dict = None
+        checkpoint_filename = BUNDLE_FILENAME
+    elif backbone_file != 'None':
+        #the backbone is loaded once, every subject only adds its adapter
+        print('loading backbone: {}'.format(backbone_file), flush=True)
+        backbone_state_dict = load_state_dict(backbone_file)
+        checkpoint_filename = 'best_adapter.statedict'
+    else:
+        backbone_state_dict = None
+        checkpoint_filename = 'best_model.statedict'
+
+    checkpoint_index = index_best_checkpoints(experiment_dir, None if experiment_name == 'best' else experiment_name, checkpoint_filename)
+    print('indexed checkpoints of {} subjects'.format(len(checkpoint_index)), flush=True)
+
+    model_registry = ModelRegistry(checkpoint_index, create_model_loader(model_name, backend_name, window_size, backbone_state_dict), max_models=max_models)
+    model_registry.prefetch(prefetch_subjects)
+
+    batcher = MicroBatcher(model_registry, max_batch_size=max_batch_size, max_wait=max_wait_ms/1000, max_queue_size=max_queue_size, window_shape=(window_size, 8)).start()
+
+    def serving_summary():
+        summary_dict = batcher.stats.summary()
+        summary_dict['model_registry'] = model_registry.summary()
+        summary_dict['status'] = 200
+        return summary_dict
+
+    server = create_server(server_type, address)
+    server.batcher = batcher
+    server.request_timeout = request_timeout
+    server.serving_summary = serving_summary
+
+    print('serving {} ({} backend) on {} {}'.format(model_name, backend_name, server_type, address), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.stop()
+
+    summary_dict = serving_summary()
+    print('serving stats: {}'.format(summary_dict), flush=True)
+
+    #write serving stats to json file
+    with open(os.path.join(result_save_rootdir, 'serving_stats.json'), 'w') as f:
+        json.dump(summary_dict, f, indent=4)
+
+
+
+if __name__=='__main__':
+
+    #parse args
+    args = parser.parse_args()
+
+    #sanity check:
+    print('model_name: {}, type: {}'.format(args.model_name, type(args.model_name)))
+    print('backend: {}, type: {}'.format(args.backend, type(args.backend)))
+    print('experiment_dir: {}, type: {}'.format(args.experiment_dir, type(args.experiment_dir)))
+    print('experiment_name: {}, type: {}'.format(args.experiment_name, type(args.experiment_name)))
+    print('backbone_file: {}, type: {}'.format(args.backbone_file, type(args.backbone_file)))
+    print('max_models: {}, type: {}'.format(args.max_models, type(args.max_models)))
+    print('max_batch_size: {}, type: {}'.format(args.max_batch_size, type(args.max_batch_size)))
+    print('max_wait_ms: {}, type: {}'.format(args.max_wait_ms, type(args.max_wait_ms)))
+    print('max_queue_size: {}, type: {}'.format(args.max_queue_size, type(args.max_queue_size)))
+    print('server_type: {}, type: {}'.format(args.server_type, type(args.server_type)))
+    print('address: {}, type: {}'.format(args.address, type(args.address)))
+    print('result_save_rootdir: {}, type: {}'.format(args.result_save_rootdir, type(args.result_save_rootdir)))
+
+    args_dict = edict()
+    args_dict.model_name = args.model_name
+    args_dict.backend = args.backend
+    args_dict.experiment_dir = args.experiment_dir
+    args_dict.experiment_name = args.experiment_name
+    args_dict.backbone_file = args.backbone_file
+    args_dict.max_models = args.max_models
+    args_dict.prefetch_subjects = [subject for subject in args.prefetch_subjects.split(',') if subject != '']
+    args_dict.window_size = args.window_size
+    args_dict.max_batch_size = args.max_batch_size
+    args_dict.max_wait_ms = args.max_wait_ms
+    args_dict.max_queue_size = args.max_queue_size
+    args_dict.request_timeout = args.request_timeout
+    args_dict.server_type = args.server_type
+    args_dict.address = args.address
+    args_dict.result_save_rootdir = args.result_save_rootdir
+
+    serve(args_dict)
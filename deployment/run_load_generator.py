@@ -0,0 +1,225 @@
+#local load generator for run_inference_server.py: num_sessions concurrent sessions, each sending the test windows of one subject
+
+import os
+import sys
+import json
+import time
+import socket
+import threading
+import http.client
+import numpy as np
+
+import argparse
+
+from easydict import EasyDict as edict
+
+YOUR_PATH = os.environ['YOUR_PATH']
+sys.path.insert(0, os.path.join(YOUR_PATH, 'fNIRS-mental-workload-classifiers/helpers'))
+import brain_data
+from utils import makedir_if_not_exist
+from streaming import LatencyRecorder
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--data_dir', default='../data/Leon/Visual/size_30sec_150ts_stride_3ts/', help='folder to the dataset')
+parser.add_argument('--subjects', default='86,56,72,79', help='comma separated subject ids, sessions are assigned to them round robin')
+parser.add_argument('--num_sessions', default=16, type=int, help='number of concurrent sessions')
+parser.add_argument('--requests_per_session', default=200, type=int, help='windows sent by each session')
+parser.add_argument('--request_rate', default=0.0, type=float, help='requests per second per session; 0 sends the next request as soon as the reply arrives')
+parser.add_argument('--server_type', default='http', help='http or unix')
+parser.add_argument('--address', default='127.0.0.1:8000', help="'host:port' for http, path of the socket for unix")
+parser.add_argument('--shutdown_server', action='store_true', help='ask the server to shut down at the end')
+parser.add_argument('--result_save_rootdir', default='./experiments/load_test', help='folder to save the load test summary')
+
+
+class HTTPClient():
+
+    def __init__(self, address):
+        host, port = address.rsplit(':', 1)
+        self.connection = http.client.HTTPConnection(host, int(port))
+
+    def request(self, method, path, request_dict=None):
+        body = json.dumps(request_dict) if request_dict is not None else None
+        self.connection.request(method, path, body=body, headers={'Content-Type': 'application/json'})
+
+        return json.loads(self.connection.getresponse().read())
+
+    def predict(self, request_dict):
+        return self.request('POST', '/predict', request_dict)
+
+    def stats(self):
+        return self.request('GET', '/stats')
+
+    def shutdown(self):
+        return self.request('POST', '/shutdown')
+
+    def close(self):
+        self.connection.close()
+
+
+class UnixSocketClient():
+
+    def __init__(self, address):
+        self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.connection.connect(address)
+        self.connection_file = self.connection.makefile('rwb')
+
+    def request(self, request_dict):
+        self.connection_file.write((json.dumps(request_dict) + '\n').encode())
+        self.connection_file.flush()
+
+        return json.loads(self.connection_file.readline())
+
+    def predict(self, request_dict):
+        return self.request(request_dict)
+
+    def stats(self):
+        return self.request({'command': 'stats'})
+
+    def shutdown(self):
+        return self.request({'command': 'shutdown'})
+
+    def close(self):
+        self.connection_file.close()
+        self.connection.close()
+
+
+def create_client(server_type, address):
+
+    if server_type == 'http':
+        return HTTPClient(address)
+
+    elif server_type == 'unix':
+        return UnixSocketClient(address)
+
+    else:
+        raise NameError('not supported server_type')
+
+
+def run_session(server_type, address, subject_id, feature_array, label_array, num_requests, request_rate, session_result):
+    client = create_client(server_type, address)
+
+    interval = 1.0/request_rate if request_rate > 0 else 0
+    next_send_time = time.perf_counter()
+
+    for i in range(num_requests):
+        if interval > 0:
+            time.sleep(max(0, next_send_time - time.perf_counter()))
+            next_send_time += interval
+
+        index = i % len(feature_array)
+        request_start_time = time.perf_counter()
+        reply_dict = client.predict({'subject_id': subject_id, 'window': feature_array[index].tolist()})
+        session_result['latencies'].append(time.perf_counter() - request_start_time)
+
+        status = reply_dict['status']
+        session_result['status_counts'][status] = session_result['status_counts'].get(status, 0) + 1
+        if status == 200:
+            session_result['num_correct'] += int(reply_dict['predicted_class'] == label_array[index])
+
+    client.close()
+
+
+def load_test(args_dict):
+
+    #parse args:
+    data_dir = args_dict.data_dir
+    subjects = args_dict.subjects
+    num_sessions = args_dict.num_sessions
+    requests_per_session = args_dict.requests_per_session
+    request_rate = args_dict.request_rate
+    server_type = args_dict.server_type
+    address = args_dict.address
+    shutdown_server = args_dict.shutdown_server
+    result_save_rootdir = args_dict.result_save_rootdir
+
+    makedir_if_not_exist(result_save_rootdir)
+
+    #test half of each subject, same as the experiment scripts
+    subject_data = dict()
+    for subject in subjects:
+        sub_feature_array, sub_label_array = brain_data.read_subject_csv_binary(os.path.join(data_dir, 'sub_{}.csv'.format(subject)), num_chunk_this_window_size=1488)
+        half_sub_data_len = int(len(sub_label_array)/2)
+        subject_data[subject] = (sub_feature_array[half_sub_data_len:], sub_label_array[half_sub_data_len:])
+
+    session_results = []
+    session_threads = []
+    for session_index in range(num_sessions):
+        subject = subjects[session_index % len(subjects)]
+        session_result = {'latencies': [], 'status_counts': dict(), 'num_correct': 0}
+        session_results.append(session_result)
+
+        session_threads.append(threading.Thread(target=run_session, args=(server_type, address, subject, subject_data[subject][0], subject_data[subject][1], requests_per_session, request_rate, session_result)))
+
+    start_time = time.perf_counter()
+    for session_thread in session_threads:
+        session_thread.start()
+    for session_thread in session_threads:
+        session_thread.join()
+    elapsed = time.perf_counter() - start_time
+
+    latency_recorder = LatencyRecorder()
+    status_counts = dict()
+    num_correct = 0
+    for session_result in session_results:
+        for latency in session_result['latencies']:
+            latency_recorder.update(latency)
+        for status, count in session_result['status_counts'].items():
+            status_counts[status] = status_counts.get(status, 0) + count
+        num_correct += session_result['num_correct']
+
+    num_ok = status_counts.get(200, 0)
+
+    summary_dict = dict()
+    summary_dict['num_sessions'] = num_sessions
+    summary_dict['num_requests'] = num_sessions * requests_per_session
+    summary_dict['status_counts'] = {str(status): count for status, count in status_counts.items()}
+    summary_dict['elapsed_seconds'] = elapsed
+    summary_dict['throughput_per_sec'] = num_ok / elapsed
+    summary_dict['accuracy'] = num_correct / num_ok * 100 if num_ok > 0 else 0
+    summary_dict['client_latency'] = latency_recorder.summary()
+
+    client = create_client(server_type, address)
+    summary_dict['server_stats'] = client.stats()
+    if shutdown_server:
+        client.shutdown()
+    client.close()
+
+    print('load test summary: {}'.format(summary_dict), flush=True)
+
+    #write load test summary to json file
+    with open(os.path.join(result_save_rootdir, 'load_test_summary.json'), 'w') as f:
+        json.dump(summary_dict, f, indent=4)
+
+
+
+if __name__=='__main__':
+
+    #parse args
+    args = parser.parse_args()
+
+    subjects = args.subjects.split(',')
+    shutdown_server = args.shutdown_server
+
+    #sanity check:
+    print('data_dir: {}, type: {}'.format(args.data_dir, type(args.data_dir)))
+    print('subjects: {}, type: {}'.format(subjects, type(subjects)))
+    print('num_sessions: {}, type: {}'.format(args.num_sessions, type(args.num_sessions)))
+    print('requests_per_session: {}, type: {}'.format(args.requests_per_session, type(args.requests_per_session)))
+    print('request_rate: {}, type: {}'.format(args.request_rate, type(args.request_rate)))
+    print('server_type: {}, type: {}'.format(args.server_type, type(args.server_type)))
+    print('address: {}, type: {}'.format(args.address, type(args.address)))
+    print('shutdown_server: {}, type: {}'.format(shutdown_server, type(shutdown_server)))
+    print('result_save_rootdir: {}, type: {}'.format(args.result_save_rootdir, type(args.result_save_rootdir)))
+
+    args_dict = edict()
+    args_dict.data_dir = args.data_dir
+    args_dict.subjects = subjects
+    args_dict.num_sessions = args.num_sessions
+    args_dict.requests_per_session = args.requests_per_session
+    args_dict.request_rate = args.request_rate
+    args_dict.server_type = args.server_type
+    args_dict.address = args.address
+    args_dict.shutdown_server = shutdown_server
+    args_dict.result_save_rootdir = args.result_save_rootdir
+
+    load_test(args_dict)
@@ -0,0 +1,193 @@
+import os
+import sys
+import csv
+import numpy as np
+import torch
+
+import time
+import argparse
+
+from easydict import EasyDict as edict
+from sklearn.linear_model import LogisticRegression
+from sklearn.ensemble import RandomForestClassifier as rfc
+
+YOUR_PATH = os.environ['YOUR_PATH']
+sys.path.insert(0, os.path.join(YOUR_PATH, 'fNIRS-mental-workload-classifiers/helpers'))
+import models
+import brain_data
+from utils import generic_GetTrainValTestSubjects, seed_everything, featurize, makedir_if_not_exist
+from onnx_export import export_deep_model_to_onnx, export_sklearn_pipeline_to_onnx
+from inference_backends import TorchBackend, SklearnBackend, OnnxRuntimeBackend, check_parity
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--seed', default=0, type=int, help='random seed')
+parser.add_argument('--data_dir', default='../data/Leon/Visual/size_30sec_150ts_stride_3ts/', help='folder to the dataset')
+parser.add_argument('--window_size', default=150, type=int, help='window size')
+parser.add_argument('--classification_task', default='binary', help='binary or four-class classification')
+parser.add_argument('--model_name', default='EEGNet', help='EEGNet, DeepConvNet, LogisticRegression or RandomForest')
+parser.add_argument('--experiment_dir', default='./experiments/generic_models/EEGNet/binary/64vs4/TestBucket1', help='result_save_rootdir of the generic model run (only used for EEGNet/DeepConvNet)')
+parser.add_argument('--experiment_name', default='lr0.001_dropout0.25', help='hyper setting to export, e.g. lr0.001_dropout0.25, C1.0 or MaxFeatures0.166_MinSamplesLeaf4')
+parser.add_argument('--result_save_rootdir', default='./experiments/onnx_parity', help='folder to save the onnx models and the parity summary')
+parser.add_argument('--setting', default='64vs4_TestBucket1', help='which predefined train val test split scenario')
+
+
+def fit_sklearn_classifier(model_name, experiment_name, transformed_train_feature_array, train_label_array):
+    '''
+    The sklearn runners do not save their fitted models, so refit the requested hyper setting on the bucket's train subjects
+    '''
+    
+    if model_name == 'LogisticRegression':
+        C = float(experiment_name.split('C')[-1])
+        classifier = LogisticRegression(C=C, random_state=0, max_iter=10000, solver='lbfgs')
+        
+    elif model_name == 'RandomForest':
+        max_features = float(experiment_name.split('MaxFeatures')[-1].split('_')[0])
+        min_samples_leaf = int(experiment_name.split('MinSamplesLeaf')[-1])
+        classifier = rfc(max_features=max_features, min_samples_leaf=min_samples_leaf)
+    
+    else:
+        raise NameError('not supported model_name')
+    
+    return classifier.fit(transformed_train_feature_array, train_label_array)
+
+
+def check_subjects(args_dict, train_subjects, test_subjects):
+    
+    #convert to string list
+    train_subjects = [str(i) for i in train_subjects]
+    test_subjects = [str(i) for i in test_subjects]
+    
+    #parse args:
+    data_dir = args_dict.data_dir
+    window_size = args_dict.window_size
+    classification_task = args_dict.classification_task
+    model_name = args_dict.model_name
+    experiment_dir = args_dict.experiment_dir
+    experiment_name = args_dict.experiment_name
+    result_save_rootdir = args_dict.result_save_rootdir
+    
+    num_chunk_this_window_size = 1488
+    
+    if classification_task == 'binary':
+        data_loading_function = brain_data.read_subject_csv_binary
+    
+    else:
+        raise NameError('not supported classification type')
+    
+    makedir_if_not_exist(result_save_rootdir)
+    
+    #the sklearn pipelines are shared by all test subjects of the bucket
+    if model_name in ['LogisticRegression', 'RandomForest']:
+        group_model_sub_train_feature_list = []
+        group_model_sub_train_label_list = []
+        
+        for subject in train_subjects:
+            sub_feature, sub_label = data_loading_function(os.path.join(data_dir, 'sub_{}.csv'.format(subject)), num_chunk_this_window_size=num_chunk_this_window_size)
+            
+            group_model_sub_train_feature_list.append(sub_feature)
+            group_model_sub_train_label_list.append(sub_label)
+        
+        group_model_sub_train_feature_array = np.concatenate(group_model_sub_train_feature_list, axis=0).astype(np.float32)
+        group_model_sub_train_label_array = np.concatenate(group_model_sub_train_label_list, axis=0)
+        
+        transformed_group_model_sub_train_feature_array = featurize(group_model_sub_train_feature_array, classification_task)
+        
+        classifier = fit_sklearn_classifier(model_name, experiment_name, transformed_group_model_sub_train_feature_array, group_model_sub_train_label_array)
+        
+        onnx_path = os.path.join(result_save_rootdir, '{}_{}.onnx'.format(model_name, experiment_name))
+        export_sklearn_pipeline_to_onnx(classifier, onnx_path, num_timesteps=window_size)
+        
+        reference_backend = SklearnBackend(classifier, lambda feature_array: featurize(feature_array, classification_task))
+    
+    elif model_name == 'EEGNet':
+        model_to_use = models.EEGNet150
+    
+    elif model_name == 'DeepConvNet':
+        model_to_use = models.DeepConvNet150
+    
+    else:
+        raise NameError('not supported model_name')
+    
+    summary_filename = os.path.join(result_save_rootdir, 'parity_summary.csv')
+    fieldnames = ['subject_id', 'model_name', 'experiment_name', 'max_abs_difference', 'prediction_agreement', 'reference_accuracy', 'candidate_accuracy', 'reference_time', 'candidate_time', 'onnx_session_startup_time', 'onnx_path']
+    
+    with open(summary_filename, mode='w') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+        writer.writeheader()
+        
+        for test_subject in test_subjects:
+            #load this subject's test data
+            sub_feature_array, sub_label_array = data_loading_function(os.path.join(data_dir, 'sub_{}.csv'.format(test_subject)), num_chunk_this_window_size=num_chunk_this_window_size)
+            
+            sub_data_len = len(sub_label_array)
+            assert sub_data_len == int(num_chunk_this_window_size/2), 'subject {} len is not {} for binary classification'.format(test_subject, int(num_chunk_this_window_size/2))
+            half_sub_data_len = int(sub_data_len/2)
+            
+            sub_test_feature_array = sub_feature_array[half_sub_data_len:]
+            sub_test_label_array = sub_label_array[half_sub_data_len:]
+            
+            #deep models: each test subject has its own copy of the best checkpoint
+            if model_name in ['EEGNet', 'DeepConvNet']:
+                checkpoint_path = os.path.join(experiment_dir, test_subject, experiment_name, 'checkpoint', 'best_model.statedict')
+                print('loading checkpoint: {}'.format(checkpoint_path))
+                
+                model = model_to_use()
+                model.load_state_dict(torch.load(checkpoint_path, map_location=torch.device('cpu')))
+                
+                result_save_subjectdir = os.path.join(result_save_rootdir, test_subject)
+                makedir_if_not_exist(result_save_subjectdir)
+                onnx_path = os.path.join(result_save_subjectdir, '{}_{}.onnx'.format(model_name, experiment_name))
+                export_deep_model_to_onnx(model, onnx_path, num_timesteps=window_size)
+                
+                reference_backend = TorchBackend(model)
+            
+            startup_start_time = time.time()
+            candidate_backend = OnnxRuntimeBackend(onnx_path)
+            startup_time = time.time() - startup_start_time
+            
+            parity_dict = check_parity(reference_backend, candidate_backend, sub_test_feature_array, sub_test_label_array)
+            print('subject {} parity: {}'.format(test_subject, parity_dict), flush=True)
+            
+            parity_dict.update(subject_id=test_subject, model_name=model_name, experiment_name=experiment_name, onnx_session_startup_time=startup_time, onnx_path=onnx_path)
+            writer.writerow(parity_dict)
+
+
+
+if __name__=='__main__':
+    
+    #parse args
+    args = parser.parse_args()
+    
+    seed = args.seed
+    data_dir = args.data_dir
+    window_size = args.window_size
+    classification_task = args.classification_task
+    model_name = args.model_name
+    experiment_dir = args.experiment_dir
+    experiment_name = args.experiment_name
+    result_save_rootdir = args.result_save_rootdir
+    setting = args.setting
+    
+    test_subjects, train_subjects, _ = generic_GetTrainValTestSubjects(setting)
+    
+    #sanity check:
+    print('data_dir: {}, type: {}'.format(data_dir, type(data_dir)))
+    print('window_size: {}, type: {}'.format(window_size, type(window_size)))
+    print('classification_task: {}, type: {}'.format(classification_task, type(classification_task)))
+    print('model_name: {}, type: {}'.format(model_name, type(model_name)))
+    print('experiment_dir: {}, type: {}'.format(experiment_dir, type(experiment_dir)))
+    print('experiment_name: {}, type: {}'.format(experiment_name, type(experiment_name)))
+    print('result_save_rootdir: {}, type: {}'.format(result_save_rootdir, type(result_save_rootdir)))
+    print('setting: {} type: {}'.format(setting, type(setting)))
+    
+    args_dict = edict()
+    args_dict.data_dir = data_dir
+    args_dict.window_size = window_size
+    args_dict.classification_task = classification_task
+    args_dict.model_name = model_name
+    args_dict.experiment_dir = experiment_dir
+    args_dict.experiment_name = experiment_name
+    args_dict.result_save_rootdir = result_save_rootdir
+    
+    seed_everything(seed)
+    check_subjects(args_dict, train_subjects, test_subjects)
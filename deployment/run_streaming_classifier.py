@@ -0,0 +1,148 @@
+import os
+import sys
+import csv
+import torch
+
+import argparse
+
+from easydict import EasyDict as edict
+
+YOUR_PATH = os.environ['YOUR_PATH']
+sys.path.insert(0, os.path.join(YOUR_PATH, 'fNIRS-mental-workload-classifiers/helpers'))
+import models
+from utils import featurize, load_pickle, makedir_if_not_exist
+from inference_backends import TorchBackend, SklearnBackend, CompiledForestBackend, FusedLogisticRegressionBackend, OnnxRuntimeBackend, IncrementalBackend
+from compiled_forest import compile_forest, load_compiled_forest
+from fused_logistic_regression import load_fused_logistic_regression, fuse_model_bundle
+from model_bundles import load_model_bundle
+from streaming import StreamingClassifier, socket_sample_reader, file_tail_reader
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--model_name', default='EEGNet', help='EEGNet, DeepConvNet, LogisticRegression or RandomForest')
+parser.add_argument('--backend', default='torch', help='torch or incremental (EEGNet/DeepConvNet statedict), sklearn (pickled fitted classifier), compiled_forest (pickled RandomForestClassifier or .npz saved by compiled_forest.py), fused_lr (Logistic Regression model_bundle.joblib or .npz saved by run_fused_lr_parity.py) or onnxruntime (exported by run_onnx_parity.py)')
+parser.add_argument('--model_path', default='None', help='best_model.statedict, pickled sklearn classifier or .onnx file')
+parser.add_argument('--window_size', default=150, type=int, help='window size')
+parser.add_argument('--stride', default=3, type=int, help='classify the latest window every stride samples')
+parser.add_argument('--source', default='socket', help='socket or file')
+parser.add_argument('--socket_address', default='127.0.0.1:5555', help="'host:port' or path of a unix socket")
+parser.add_argument('--input_file', default='None', help='file to tail when source is file')
+parser.add_argument('--idle_timeout', default=10.0, type=float, help='stop tailing the file after this many seconds without new samples')
+parser.add_argument('--result_save_rootdir', default='./experiments/streaming', help='folder to save the predictions and latency summary')
+
+
+def create_backend(model_name, backend_name, model_path, window_size, stride):
+    
+    if backend_name in ['torch', 'incremental']:
+        if model_name == 'EEGNet':
+            model = models.EEGNet150()
+        elif model_name == 'DeepConvNet':
+            model = models.DeepConvNet150()
+        else:
+            raise NameError('torch and incremental backends only support EEGNet and DeepConvNet')
+        
+        model.load_state_dict(torch.load(model_path, map_location=torch.device('cpu')))
+        
+        if backend_name == 'incremental':
+            return IncrementalBackend(model, num_timesteps=window_size, stride=stride)
+        return TorchBackend(model)
+    
+    elif backend_name == 'sklearn':
+        classifier = load_pickle(os.path.dirname(model_path), os.path.basename(model_path))
+        return SklearnBackend(classifier, lambda feature_array: featurize(feature_array, 'binary'))
+    
+    elif backend_name == 'compiled_forest':
+        if model_path.endswith('.npz'):
+            compiled_forest = load_compiled_forest(model_path)
+        else:
+            compiled_forest = compile_forest(load_pickle(os.path.dirname(model_path), os.path.basename(model_path)))
+        return CompiledForestBackend(compiled_forest, lambda feature_array: featurize(feature_array, 'binary'))
+    
+    elif backend_name == 'fused_lr':
+        if model_path.endswith('.npz'):
+            fused_model = load_fused_logistic_regression(model_path)
+        else:
+            fused_model = fuse_model_bundle(load_model_bundle(model_path))
+        assert fused_model.window_size == window_size, 'fused model expects windows of {} samples'.format(fused_model.window_size)
+        return FusedLogisticRegressionBackend(fused_model)
+    
+    elif backend_name == 'onnxruntime':
+        return OnnxRuntimeBackend(model_path)
+    
+    else:
+        raise NameError('not supported backend')
+
+
+def stream(args_dict):
+    
+    #parse args:
+    model_name = args_dict.model_name
+    backend_name = args_dict.backend
+    model_path = args_dict.model_path
+    window_size = args_dict.window_size
+    stride = args_dict.stride
+    source = args_dict.source
+    socket_address = args_dict.socket_address
+    input_file = args_dict.input_file
+    idle_timeout = args_dict.idle_timeout
+    result_save_rootdir = args_dict.result_save_rootdir
+    
+    makedir_if_not_exist(result_save_rootdir)
+    
+    backend = create_backend(model_name, backend_name, model_path, window_size, stride)
+    streaming_classifier = StreamingClassifier(backend, window_size=window_size, stride=stride)
+    
+    if source == 'socket':
+        sample_reader = socket_sample_reader(socket_address)
+    elif source == 'file':
+        sample_reader = file_tail_reader(input_file, idle_timeout=idle_timeout)
+    else:
+        raise NameError('not supported source')
+    
+    with open(os.path.join(result_save_rootdir, 'streaming_predictions.csv'), mode='w') as csv_file:
+        fieldnames = ['subject_id', 'window_end_sample', 'predicted_class', 'scores', 'latency']
+        writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+        writer.writeheader()
+        
+        def write_prediction(prediction_dict):
+            prediction_dict['scores'] = ' '.join(str(score) for score in prediction_dict['scores'])
+            writer.writerow(prediction_dict)
+        
+        latency_summary = streaming_classifier.run(sample_reader, callback=write_prediction)
+    
+    print('latency summary: {}'.format(latency_summary), flush=True)
+    
+    #write latency summary to txt file
+    file_writer = open(os.path.join(result_save_rootdir, 'latency.txt'), 'w')
+    for key, value in latency_summary.items():
+        file_writer.write('{}: {}\n'.format(key, value))
+    file_writer.close()
+
+
+
+if __name__=='__main__':
+    
+    #parse args
+    args = parser.parse_args()
+    
+    #sanity check:
+    print('model_name: {}, type: {}'.format(args.model_name, type(args.model_name)))
+    print('backend: {}, type: {}'.format(args.backend, type(args.backend)))
+    print('model_path: {}, type: {}'.format(args.model_path, type(args.model_path)))
+    print('window_size: {}, type: {}'.format(args.window_size, type(args.window_size)))
+    print('stride: {}, type: {}'.format(args.stride, type(args.stride)))
+    print('source: {}, type: {}'.format(args.source, type(args.source)))
+    print('result_save_rootdir: {}, type: {}'.format(args.result_save_rootdir, type(args.result_save_rootdir)))
+    
+    args_dict = edict()
+    args_dict.model_name = args.model_name
+    args_dict.backend = args.backend
+    args_dict.model_path = args.model_path
+    args_dict.window_size = args.window_size
+    args_dict.stride = args.stride
+    args_dict.source = args.source
+    args_dict.socket_address = args.socket_address
+    args_dict.input_file = args.input_file
+    args_dict.idle_timeout = args.idle_timeout
+    args_dict.result_save_rootdir = args.result_save_rootdir
+    
+    stream(args_dict)
@@ -0,0 +1,36 @@
+#!/bin/bash
+#
+# Usage
+# -----
+# $ bash launch_experiments.sh ACTION_NAME
+#
+# where ACTION_NAME is either 'list' or 'submit' or 'run_here'
+#
+# the classifier waits for samples on $socket_address, replay a recording with e.g.
+# python3 $YOUR_PATH/fNIRS-mental-workload-classifiers/deployment/replay_recording.py --data_dir $data_dir --subjects 86 --socket_address $socket_address
+
+if [[ -z $1 ]]; then
+    ACTION_NAME='list'
+else
+    ACTION_NAME=$1
+fi
+
+export data_dir="$YOUR_PATH/fNIRS-mental-workload-classifiers/data/slide_window_data/size_30sec_150ts_stride_3ts/"
+export window_size=150
+export stride=3
+export model_name='EEGNet'
+export backend='torch'
+export model_path="$YOUR_PATH/fNIRS-mental-workload-classifiers/experiments/generic_models/$model_name/binary/64vs4/TestBucket1/86/lr1.0_dropout0.25/checkpoint/best_model.statedict"
+export source='socket'
+export socket_address='127.0.0.1:5555'
+export result_save_rootdir="$YOUR_PATH/fNIRS-mental-workload-classifiers/experiments/streaming/$model_name/sub86"
+
+
+if [[ $ACTION_NAME == 'submit' ]]; then
+    ## Use this line to submit the experiment to the batch scheduler
+    sbatch < $YOUR_PATH/fNIRS-mental-workload-classifiers/deployment/runs/do_streaming_classifier.slurm
+
+elif [[ $ACTION_NAME == 'run_here' ]]; then
+    ## Use this line to just run interactively
+    bash $YOUR_PATH/fNIRS-mental-workload-classifiers/deployment/runs/do_streaming_classifier.slurm
+fi
@@ -0,0 +1,252 @@
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+import torch
+
+import argparse
+
+from easydict import EasyDict as edict
+
+YOUR_PATH = os.environ['YOUR_PATH']
+sys.path.insert(0, os.path.join(YOUR_PATH, 'fNIRS-mental-workload-classifiers/helpers'))
+import models
+import brain_data
+from adaptation import adapt_batchnorm_statistics
+from model_registry import index_best_checkpoints
+from utils import generic_GetTrainValTestSubjects, seed_everything, makedir_if_not_exist, plot_confusion_matrix, save_pickle, load_pickle, write_performance_info_FixedTrainValSplit, write_program_time, write_initial_test_accuracy
+
+#AdaBN domain adaptation of a generic EEGNet/DeepConvNet: no labels and no gradient steps, the BatchNorm running statistics are
+#recomputed from the test subject's adaptation chunks in one forward pass. The labels of the adaptation chunks are only used to
+#report a validation accuracy on the same cv-val half as the finetuning runners
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--seed', default=1, type=int, help="random seed")
+parser.add_argument('--model_name', default='EEGNet', help='EEGNet or DeepConvNet')
+parser.add_argument('--data_dir', default='../data/Leon/Visual/size_40sec_200ts_stride_3ts/', help="folder to the dataset")
+parser.add_argument('--window_size', default=200, type=int, help='window size')
+parser.add_argument('--result_save_rootdir', default='./experiments', help="Directory containing the dataset")
+parser.add_argument('--classification_task', default='four_class', help='binary or four-class classification')
+parser.add_argument('--restore_file', default='None', help="generic model xxx.statedict")
+parser.add_argument('--setting', default='64vs4_TestBucket1', help='which predefined train val test split scenario')
+parser.add_argument('--adapt_on', default='train_100', help="what portion of the test subject' train set is used for adaptation")
+parser.add_argument('--adapt_batch_size', default=0, type=int, help='batch size of the adaptation pass, 0: all adaptation chunks in one batch')
+parser.add_argument('--finetuning_result_dir', default='None', help='result_save_rootdir of the finetuning runs of the same bucket, to report them next to AdaBN')
+
+
+def evaluate(model, feature_array):
+    model.eval()
+    with torch.no_grad():
+        return model(torch.from_numpy(np.asarray(feature_array, dtype=np.float32))).numpy()
+
+
+def read_finetuning_result(finetuning_checkpoint_index, test_subject):
+    '''
+    test accuracy and finetuning time of the finetuning setting with the best validation accuracy of this subject, NaN if not available
+    '''
+
+    if test_subject not in finetuning_checkpoint_index:
+        return float('nan'), float('nan')
+
+    experiment_dir = os.path.dirname(os.path.dirname(finetuning_checkpoint_index[test_subject]['checkpoint_path']))
+    if not os.path.exists(os.path.join(experiment_dir, 'predictions', 'result_save_dict.pkl')):
+        return float('nan'), float('nan')
+
+    finetuned_test_accuracy = load_pickle(os.path.join(experiment_dir, 'predictions'), 'result_save_dict.pkl')['bestepoch_test_accuracy']
+
+    finetuning_time = float('nan')
+    program_time_path = os.path.join(experiment_dir, 'result_analysis', 'program_time.txt')
+    if os.path.exists(program_time_path):
+        with open(program_time_path) as f:
+            finetuning_time = float(f.read().split(':')[1].split()[0])
+
+    return finetuned_test_accuracy, finetuning_time
+
+
+def train_classifier(args_dict, test_subjects):
+
+    #convert to string list
+    test_subjects = [str(i) for i in test_subjects]
+
+    #parse args:
+    model_name = args_dict.model_name
+    data_dir = args_dict.data_dir
+    result_save_rootdir = args_dict.result_save_rootdir
+    classification_task = args_dict.classification_task
+    restore_file = args_dict.restore_file
+    adapt_on = args_dict.adapt_on
+    adapt_batch_size = args_dict.adapt_batch_size
+    finetuning_result_dir = args_dict.finetuning_result_dir
+
+    num_chunk_this_window_size = 1488
+
+    if model_name == 'EEGNet':
+        model_to_use = models.EEGNet150
+
+    elif model_name == 'DeepConvNet':
+        model_to_use = models.DeepConvNet150
+
+    else:
+        raise NameError('not supported model_name')
+
+    if classification_task == 'binary':
+        data_loading_function = brain_data.read_subject_csv_binary
+        confusion_matrix_figure_labels = ['0back', '2back']
+
+    else:
+        raise NameError('not supported classification type')
+
+    #the generic model
+    model = model_to_use()
+    print('loading checkpoint: {}'.format(restore_file))
+    model.load_state_dict(torch.load(restore_file, map_location=torch.device('cpu')))
+    model.eval()
+
+    if finetuning_result_dir != 'None':
+        finetuning_checkpoint_index = index_best_checkpoints(finetuning_result_dir)
+    else:
+        finetuning_checkpoint_index = None
+
+    summary_rows = []
+
+    for test_subject in test_subjects:
+
+        #derived arg
+        result_save_subjectdir = os.path.join(result_save_rootdir, test_subject, 'AdaBN')
+        result_save_subject_checkpointdir = os.path.join(result_save_subjectdir, 'checkpoint')
+        result_save_subject_predictionsdir = os.path.join(result_save_subjectdir, 'predictions')
+        result_save_subject_resultanalysisdir = os.path.join(result_save_subjectdir, 'result_analysis')
+
+        makedir_if_not_exist(result_save_subjectdir)
+        makedir_if_not_exist(result_save_subject_checkpointdir)
+        makedir_if_not_exist(result_save_subject_predictionsdir)
+        makedir_if_not_exist(result_save_subject_resultanalysisdir)
+
+        result_save_dict = dict()
+
+        #load this subject's test data
+        sub_feature_array, sub_label_array = data_loading_function(os.path.join(data_dir, 'sub_{}.csv'.format(test_subject)), num_chunk_this_window_size=num_chunk_this_window_size)
+
+        #sainty check for this test subject's data
+        sub_data_len = len(sub_label_array)
+        assert sub_data_len == int(num_chunk_this_window_size/2), 'subject {} len is not {} for binary classification'.format(test_subject, int(num_chunk_this_window_size/2))
+
+        half_sub_data_len = int(sub_data_len/2)
+
+        #first half of the test subject's data is train set, the second half is test set
+        sub_train_feature_array = sub_feature_array[:half_sub_data_len]
+        sub_train_label_array = sub_label_array[:half_sub_data_len]
+
+        sub_test_feature_array = sub_feature_array[half_sub_data_len:]
+        sub_test_label_array = sub_label_array[half_sub_data_len:]
+
+        #study the effect of the size of the adaptation set
+        if adapt_on == 'train_100':
+            print('adapt on data size: {}'.format(len(sub_train_feature_array)))
+
+        elif adapt_on == 'train_50':
+            sub_train_feature_array = sub_train_feature_array[-int(0.5*half_sub_data_len):]
+            sub_train_label_array = sub_train_label_array[-int(0.5*half_sub_data_len):]
+            print('adapt on data size: {}'.format(len(sub_train_feature_array)))
+
+        else:
+            raise NameError('not on the predefined gride')
+
+        #same cv-val half as run_EEGNet.py/run_DeepConvNet.py
+        total_number_train_chunks = len(sub_train_feature_array)
+        val_index = np.arange(total_number_train_chunks)[int(total_number_train_chunks/2):]
+
+        #accuracy of the generic model before adaptation
+        initial_test_accuracy = (evaluate(model, sub_test_feature_array).argmax(1) == sub_test_label_array).mean() * 100
+        write_initial_test_accuracy(result_save_subject_resultanalysisdir, initial_test_accuracy)
+
+        #AdaBN on the unlabeled adaptation chunks
+        adaptation_start_time = time.time()
+        adapted_model = adapt_batchnorm_statistics(model, sub_train_feature_array, batch_size=adapt_batch_size if adapt_batch_size > 0 else None)
+        adaptation_time = time.time() - adaptation_start_time
+
+        val_accuracy = (evaluate(adapted_model, sub_train_feature_array[val_index]).argmax(1) == sub_train_label_array[val_index]).mean() * 100
+        test_logits = evaluate(adapted_model, sub_test_feature_array)
+        test_class_predictions = test_logits.argmax(1)
+        test_accuracy = (test_class_predictions == sub_test_label_array).mean() * 100
+        print('subject {}: initial test accuracy {}, AdaBN val accuracy {}, test accuracy {} ({} seconds)'.format(test_subject, initial_test_accuracy, val_accuracy, test_accuracy, round(adaptation_time, 3)), flush=True)
+
+        result_save_dict['bestepoch_val_accuracy'] = val_accuracy
+        result_save_dict['bestepoch_test_accuracy'] = test_accuracy
+        result_save_dict['bestepoch_test_logits'] = test_logits.copy()
+        result_save_dict['bestepoch_test_class_labels'] = sub_test_label_array.copy()
+
+        #the adapted model, loadable like any other checkpoint
+        torch.save(adapted_model.state_dict(), os.path.join(result_save_subject_checkpointdir, 'best_model.statedict'))
+
+        #confusion matrix
+        plot_confusion_matrix(test_class_predictions, sub_test_label_array, confusion_matrix_figure_labels, result_save_subject_resultanalysisdir, 'test_confusion_matrix.png')
+
+        #save result_save_dict
+        save_pickle(result_save_subject_predictionsdir, 'result_save_dict.pkl', result_save_dict)
+
+        #write performance to txt file
+        write_performance_info_FixedTrainValSplit(adapted_model.state_dict(), result_save_subject_resultanalysisdir, val_accuracy, test_accuracy)
+
+        #write the adaptation latency to txt file
+        write_program_time(result_save_subject_resultanalysisdir, adaptation_time)
+
+        summary_row = dict(subject_id=test_subject, initial_test_accuracy=initial_test_accuracy, adabn_val_accuracy=val_accuracy, adabn_test_accuracy=test_accuracy, adabn_time=adaptation_time)
+        if finetuning_checkpoint_index is not None:
+            summary_row['finetuned_test_accuracy'], summary_row['finetuning_time'] = read_finetuning_result(finetuning_checkpoint_index, test_subject)
+
+        summary_rows.append(summary_row)
+
+    #AdaBN next to the finetuning results, one row per test subject
+    summary_df = pd.DataFrame(summary_rows)
+    summary_df.to_csv(os.path.join(result_save_rootdir, 'AdaBN_summary.csv'), index=False)
+    print(summary_df.to_string(index=False))
+
+
+
+if __name__=='__main__':
+
+    #parse args
+    args = parser.parse_args()
+
+    seed = args.seed
+    model_name = args.model_name
+    data_dir = args.data_dir
+    window_size = args.window_size
+    result_save_rootdir = args.result_save_rootdir
+    classification_task = args.classification_task
+    restore_file = args.restore_file
+    setting = args.setting
+    adapt_on = args.adapt_on
+    adapt_batch_size = args.adapt_batch_size
+    finetuning_result_dir = args.finetuning_result_dir
+
+    test_subjects, _, _ = generic_GetTrainValTestSubjects(setting)
+
+    #sanity check:
+    print('model_name: {}, type: {}'.format(model_name, type(model_name)))
+    print('data_dir: {}, type: {}'.format(data_dir, type(data_dir)))
+    print('window_size: {}, type: {}'.format(window_size, type(window_size)))
+    print('result_save_rootdir: {}, type: {}'.format(result_save_rootdir, type(result_save_rootdir)))
+    print('classification_task: {}, type: {}'.format(classification_task, type(classification_task)))
+    print('restore_file: {} type: {}'.format(restore_file, type(restore_file)))
+    print('setting: {} type: {}'.format(setting, type(setting)))
+    print('adapt_on: {} type: {}'.format(adapt_on, type(adapt_on)))
+    print('adapt_batch_size: {} type: {}'.format(adapt_batch_size, type(adapt_batch_size)))
+    print('finetuning_result_dir: {} type: {}'.format(finetuning_result_dir, type(finetuning_result_dir)))
+
+    args_dict = edict()
+
+    args_dict.model_name = model_name
+    args_dict.data_dir = data_dir
+    args_dict.window_size = window_size
+    args_dict.result_save_rootdir = result_save_rootdir
+    args_dict.classification_task = classification_task
+    args_dict.restore_file = restore_file
+    args_dict.adapt_on = adapt_on
+    args_dict.adapt_batch_size = adapt_batch_size
+    args_dict.finetuning_result_dir = finetuning_result_dir
+
+    seed_everything(seed)
+    train_classifier(args_dict, test_subjects)
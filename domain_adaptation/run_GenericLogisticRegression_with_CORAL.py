@@ -8,17 +8,15 @@ import time
 from easydict import EasyDict as edict
 from tqdm import trange
 # from sklearn.model_selection import KFold
-from sklearn.linear_model import LogisticRegression
-
-#for CORAL
-import scipy.io
-import scipy.linalg
 
 YOUR_PATH = os.environ['YOUR_PATH']
 sys.path.insert(0, os.path.join(YOUR_PATH, 'fNIRS-mental-workload-classifiers/helpers'))
 
 import models
 import brain_data
+from model_bundles import featurizer_config, data_fingerprint, save_model_bundle
+from logistic_regression_path import fit_logistic_regression_path
+from coral import CoralSource, coloring_matrix, stacked_coloring_matrices, stacked_target_to_source_matrices
 from utils import generic_GetTrainValTestSubjects, seed_everything, featurize, makedir_if_not_exist, plot_confusion_matrix, save_pickle, write_performance_info_FixedTrainValSplit, write_program_time, write_inference_time
 
 parser = argparse.ArgumentParser()
@@ -31,26 +29,7 @@ parser.add_argument('--setting', default='train64test7_bucket1', help='which pre
 
 #parameter for CORAL domain adapation
 parser.add_argument('--adapt_on', default='train_100', help="what portion of the test subject' train set is used for adaptation")
-
-#CORAL implementation:
-#https://github.com/jindongwang/transferlearning/blob/master/code/traditional/CORAL/CORAL.py
-def CoralTransform(Xs, Xt):
-    '''
-    Perform CORAL on the source domain features
-    :param Xs: ns * n_feature, source feature
-    :param Xt: nt * n_feature, target feature
-    :return: New source domain features
-    '''
-    cov_src = np.cov(Xs.T) + np.eye(Xs.shape[1])
-    cov_tar = np.cov(Xt.T) + np.eye(Xt.shape[1])
-    
-    A_coral = np.dot(scipy.linalg.fractional_matrix_power(cov_src, -0.5),
-                    scipy.linalg.fractional_matrix_power(cov_tar, 0.5))
-    
-    Xs_new = np.real(np.dot(Xs, A_coral))
-    return Xs_new
-    
-    
+parser.add_argument('--coral_mode', default='source', help="source: recolor the source pool to each test subject and refit every hyper setting per subject; target: align each test subject to the source pool, one generic model per hyper setting for the whole bucket")
 
 def train_classifier(args_dict, train_subjects, val_subjects, test_subjects):
     
@@ -66,6 +45,7 @@ def train_classifier(args_dict, train_subjects, val_subjects, test_subjects):
     result_save_rootdir = args_dict.result_save_rootdir
 #     setting = args_dict.setting  #does not need 'setting' inside train_classifier  
     adapt_on = args_dict.adapt_on
+    coral_mode = args_dict.coral_mode
     num_chunk_this_window_size = 1488
 
     
@@ -113,10 +93,36 @@ def train_classifier(args_dict, train_subjects, val_subjects, test_subjects):
     group_model_sub_val_label_array = np.concatenate(group_model_sub_val_label_list, axis=0)
     
     transformed_group_model_sub_val_feature_array = featurize(group_model_sub_val_feature_array, classification_task)
+    
+    #cross validation
+    Cs = np.logspace(-5, 5, 11)
+    experiment_names = ['C{}'.format(C) for C in Cs]
+    
+    if coral_mode == 'source':
+        #whiten the source pools once for the whole bucket, each test subject only recolors them
+        CORAL_group_model_sub_train_source = CoralSource(transformed_group_model_sub_train_feature_array)
+        CORAL_group_model_sub_val_source = CoralSource(transformed_group_model_sub_val_feature_array)
+        
+    elif coral_mode == 'target':
+        #each test subject is aligned to the source train pool, so every hyper setting is fitted once for the whole bucket
+        source_coloring_matrix = coloring_matrix(transformed_group_model_sub_train_feature_array)
+        
+        generic_fit_start_time = time.time()
+        generic_model_dict = dict()
+        path_model_dict = fit_logistic_regression_path(transformed_group_model_sub_train_feature_array, group_model_sub_train_label_array, Cs, max_iter=10000)
+        for C in Cs:
+            model = path_model_dict[C]
+            val_accuracy = model.score(transformed_group_model_sub_val_feature_array, group_model_sub_val_label_array) * 100
+            generic_model_dict['C{}'.format(C)] = (model, val_accuracy)
+        print('generic models fitted in {} seconds'.format(round(time.time() - generic_fit_start_time, 2)), flush=True)
+        
+    else:
+        raise NameError('not supported coral_mode')
 
     
     
-    #Perform domain adapation for each test subject in this bucket
+    #load every test subject of this bucket
+    sub_data_dict = dict()
     for test_subject in test_subjects:
         
         #load this subject's test data
@@ -147,18 +153,54 @@ def train_classifier(args_dict, train_subjects, val_subjects, test_subjects):
         
         else:
             raise NameError('on the predefined gride')
+
+        sub_data_dict[test_subject] = (transformed_sub_test_feature_array, sub_test_label_array, transformed_sub_adapt_feature_array)
+    
+    #CORAL for all the test subjects at once: one batched eigendecomposition of their adaptation covariances, one batched matrix multiply
+    coral_start_time = time.time()
+    transformed_sub_adapt_feature_arrays = [sub_data_dict[test_subject][2] for test_subject in test_subjects]
+    
+    if coral_mode == 'source':
+        target_coloring_matrices = stacked_coloring_matrices(transformed_sub_adapt_feature_arrays)
+        CORAL_group_model_sub_train_feature_arrays = CORAL_group_model_sub_train_source.transform_stack(target_coloring_matrices=target_coloring_matrices)
+        CORAL_group_model_sub_val_feature_arrays = CORAL_group_model_sub_val_source.transform_stack(target_coloring_matrices=target_coloring_matrices)
+        
+    else:
+        #the test features are scored in the source domain
+        target_to_source_matrices = stacked_target_to_source_matrices(transformed_sub_adapt_feature_arrays, source_coloring_matrix)
+        aligned_sub_test_feature_arrays = np.matmul(np.stack([sub_data_dict[test_subject][0] for test_subject in test_subjects]), target_to_source_matrices)
+    
+    coral_time = time.time() - coral_start_time
+    print('CORAL for {} test subjects in {} seconds'.format(len(test_subjects), round(coral_time, 3)), flush=True)
+    
+    #every fitted pipeline is saved as a model bundle (see model_bundles.py): in source mode the classifier fitted on the test subject's
+    #recolored source pool, in target mode the generic classifier together with the test subject's alignment matrix
+    bundle_featurizer_config = featurizer_config(classification_task, window_size)
+    if coral_mode == 'target':
+        train_fingerprint = data_fingerprint(transformed_group_model_sub_train_feature_array, group_model_sub_train_label_array)
+    
+    
+    classifier_bundle_paths = dict()
+    #Perform domain adapation for each test subject in this bucket
+    for subject_index, test_subject in enumerate(test_subjects):
+        
+        transformed_sub_test_feature_array, sub_test_label_array, _ = sub_data_dict[test_subject]
         
         start_time = time.time()
-
-        CORAL_group_model_sub_train_feature_array = CoralTransform(transformed_group_model_sub_train_feature_array, transformed_sub_adapt_feature_array)
-        CORAL_group_model_sub_val_feature_array = CoralTransform(transformed_group_model_sub_val_feature_array, transformed_sub_adapt_feature_array)
         
+        if coral_mode == 'source':
+            CORAL_group_model_sub_train_feature_array = CORAL_group_model_sub_train_feature_arrays[subject_index]
+            CORAL_group_model_sub_val_feature_array = CORAL_group_model_sub_val_feature_arrays[subject_index]
+            train_fingerprint = data_fingerprint(CORAL_group_model_sub_train_feature_array, group_model_sub_train_label_array)
+            
+            #the whole C grid as one warm-started regularization path on this subject's recolored source pool
+            path_model_dict = fit_logistic_regression_path(CORAL_group_model_sub_train_feature_array, group_model_sub_train_label_array, Cs, max_iter=10000)
+            
+        else:
+            transformed_sub_test_feature_array = aligned_sub_test_feature_arrays[subject_index]
         
-        #cross validation
-        Cs = np.logspace(-5, 5, 11)
-                
-        for C in Cs:
-            experiment_name = 'C{}'.format(C)
+        
+        for C, experiment_name in zip(Cs, experiment_names):
             print('experiment_name: {}'.format(experiment_name))
             #derived args
             result_save_subjectdir = os.path.join(result_save_rootdir, test_subject, experiment_name)
@@ -175,11 +217,15 @@ def train_classifier(args_dict, train_subjects, val_subjects, test_subjects):
 
             result_save_dict = dict()            
             
-            #create Logistic Regression object
-            model = LogisticRegression(C=C, random_state=0, max_iter=10000, solver='lbfgs').fit(CORAL_group_model_sub_train_feature_array, group_model_sub_train_label_array)
+            if coral_mode == 'source':
+                #Logistic Regression object of this C
+                model = path_model_dict[C]
 
-            # val performance 
-            val_accuracy = model.score(CORAL_group_model_sub_val_feature_array, group_model_sub_val_label_array) * 100
+                # val performance 
+                val_accuracy = model.score(CORAL_group_model_sub_val_feature_array, group_model_sub_val_label_array) * 100
+                
+            else:
+                model, val_accuracy = generic_model_dict[experiment_name]
                 
             result_save_dict['bestepoch_val_accuracy'] = val_accuracy
                 
@@ -203,9 +249,16 @@ def train_classifier(args_dict, train_subjects, val_subjects, test_subjects):
             
             #write performance to txt file
             write_performance_info_FixedTrainValSplit('NA', result_save_subject_resultanalysisdir, val_accuracy, test_accuracy)
+            
+            #save the fitted pipeline: in target mode the generic model is written with the first test subject, the others refer to it (see
+            #model_bundles.py)
+            bundle_path = save_model_bundle(result_save_subject_checkpointdir, model, bundle_featurizer_config, train_fingerprint, alignment_matrix=None if coral_mode == 'source' else target_to_source_matrices[subject_index], extra={'coral_mode': coral_mode, 'adapt_on': adapt_on}, classifier_bundle_path=classifier_bundle_paths.get(experiment_name))
+            if coral_mode == 'target':
+                classifier_bundle_paths.setdefault(experiment_name, bundle_path)
     
         end_time = time.time()
-        total_time = end_time - start_time
+        #CORAL ran once for all test subjects before this loop, add this subject's share of it
+        total_time = end_time - start_time + coral_time / len(test_subjects)
         write_program_time(result_save_rootdir, total_time)
         write_inference_time(result_save_rootdir, inference_time)
 
@@ -224,6 +277,7 @@ if __name__=='__main__':
     result_save_rootdir = args.result_save_rootdir
     setting = args.setting
     adapt_on = args.adapt_on
+    coral_mode = args.coral_mode
     
     test_subjects, train_subjects, val_subjects = generic_GetTrainValTestSubjects(setting)
     
@@ -234,6 +288,7 @@ if __name__=='__main__':
     print('result_save_rootdir: {} type: {}'.format(result_save_rootdir, type(result_save_rootdir)))
     print('setting: {} type: {}'.format(setting, type(setting)))
     print('adapt_on: {} type: {}'.format(adapt_on, type(adapt_on)))
+    print('coral_mode: {} type: {}'.format(coral_mode, type(coral_mode)))
 
     
     args_dict = edict()
@@ -243,6 +298,7 @@ if __name__=='__main__':
     args_dict.result_save_rootdir = result_save_rootdir
 #     args_dict.setting = setting #does not need 'setting' inside train_classifier 
     args_dict.adapt_on = adapt_on
+    args_dict.coral_mode = coral_mode
     
     seed_everything(seed)
     train_classifier(args_dict, train_subjects, val_subjects, test_subjects)
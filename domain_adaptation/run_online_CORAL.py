@@ -0,0 +1,256 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import argparse
+
+import time
+
+from easydict import EasyDict as edict
+from sklearn.linear_model import LogisticRegression
+
+YOUR_PATH = os.environ['YOUR_PATH']
+sys.path.insert(0, os.path.join(YOUR_PATH, 'fNIRS-mental-workload-classifiers/helpers'))
+import brain_data
+from model_bundles import featurizer_config, data_fingerprint, save_model_bundle
+from random_forest_grid import random_forest_hyper_settings, run_random_forest_grid, accuracy_from_probabilities
+from coral import OnlineCoralAligner, coloring_matrix
+from utils import generic_GetTrainValTestSubjects, seed_everything, featurize, makedir_if_not_exist, plot_confusion_matrix, save_pickle, write_performance_info_FixedTrainValSplit, write_program_time, write_inference_time
+
+#continuous-time counterpart of the adapt_on experiments of the CORAL runners (target-side CORAL, see --coral_mode target): the test
+#subject's adaptation chunks arrive one update at a time, in recording order, and only their streaming mean/covariance is kept.
+#After every refresh of the alignment the test set is scored, which gives test accuracy as a function of the adaptation chunks seen
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--seed', default=0, type=int, help='random seed')
+parser.add_argument('--model_name', default='LogisticRegression', help='LogisticRegression or RandomForest')
+parser.add_argument('--data_dir', default='../data/Leon/Visual/size_2sec_10ts_stride_3ts/', help='folder to the train data')
+parser.add_argument('--window_size', default=10, type=int, help='window size')
+parser.add_argument('--classification_task', default='four_class', help='binary or four-class classification')
+parser.add_argument('--result_save_rootdir', default='./experiments', help='folder to the result')
+parser.add_argument('--setting', default='train64test7_bucket1', help='which predefined train test split scenario')
+
+#parameter for online CORAL domain adapation
+parser.add_argument('--chunks_per_update', default=1, type=int, help='number of adaptation chunks arriving together')
+parser.add_argument('--refresh_every', default=31, type=int, help='refresh the alignment every this many chunks, 0: only on drift')
+parser.add_argument('--drift_threshold', default=0.0, type=float, help='also refresh when the target covariance changed by more than this (relative), 0: off')
+parser.add_argument('--min_chunks', default=31, type=int, help='chunks needed before the first alignment')
+parser.add_argument('--num_workers', default=0, type=int, help='RandomForest: forests fitted in parallel, 0: one per hyper setting up to the cpu budget')
+parser.add_argument('--cpu_budget', default=0, type=int, help='RandomForest: cpus shared by the parallel forests, 0: all cpus')
+
+
+def train_classifier(args_dict, train_subjects, val_subjects, test_subjects):
+
+    #convert to string list
+    train_subjects = [str(i) for i in train_subjects]
+    val_subjects = [str(i) for i in val_subjects]
+    test_subjects = [str(i) for i in test_subjects]
+
+    #parse args:
+    model_name = args_dict.model_name
+    data_dir = args_dict.data_dir
+    window_size = args_dict.window_size
+    classification_task = args_dict.classification_task
+    result_save_rootdir = args_dict.result_save_rootdir
+    chunks_per_update = args_dict.chunks_per_update
+    refresh_every = args_dict.refresh_every if args_dict.refresh_every > 0 else None
+    drift_threshold = args_dict.drift_threshold if args_dict.drift_threshold > 0 else None
+    min_chunks = args_dict.min_chunks
+    num_chunk_this_window_size = 1488
+
+    if classification_task == 'binary':
+        data_loading_function = brain_data.read_subject_csv_binary
+        confusion_matrix_figure_labels = ['0back', '2back']
+
+    else:
+        raise NameError('not supported classification type')
+
+    #same hyper grids as run_GenericLogisticRegression_with_CORAL.py/run_GenericRandomForest_with_CORAL.py
+    if model_name == 'LogisticRegression':
+        hyper_settings = [('C{}'.format(C), dict(C=C)) for C in np.logspace(-5, 5, 11)]
+        model_to_use = lambda hyper_setting: LogisticRegression(random_state=0, max_iter=10000, solver='lbfgs', **hyper_setting)
+
+    elif model_name == 'RandomForest':
+        hyper_settings = random_forest_hyper_settings()
+
+    else:
+        raise NameError('not supported model_name')
+
+    #create the group train and val data
+    group_model_feature_arrays = dict()
+    for split, subjects in [('train', train_subjects), ('val', val_subjects)]:
+        sub_feature_list = []
+        sub_label_list = []
+
+        for subject in subjects:
+            sub_feature, sub_label = data_loading_function(os.path.join(data_dir, 'sub_{}.csv'.format(subject)), num_chunk_this_window_size=num_chunk_this_window_size)
+
+            sub_feature_list.append(sub_feature)
+            sub_label_list.append(sub_label)
+
+        group_model_feature_arrays[split] = (featurize(np.concatenate(sub_feature_list, axis=0).astype(np.float32), classification_task), np.concatenate(sub_label_list, axis=0))
+
+    transformed_group_model_sub_train_feature_array, group_model_sub_train_label_array = group_model_feature_arrays['train']
+    transformed_group_model_sub_val_feature_array, group_model_sub_val_label_array = group_model_feature_arrays['val']
+
+    #every fitted pipeline is saved as a model bundle (see model_bundles.py): the generic model with the final alignment of the test subject
+    bundle_featurizer_config = featurizer_config(classification_task, window_size)
+    train_fingerprint = data_fingerprint(transformed_group_model_sub_train_feature_array, group_model_sub_train_label_array)
+
+    #one generic model per hyper setting for the whole bucket, the test subjects are aligned to the source train pool
+    source_coloring_matrix = coloring_matrix(transformed_group_model_sub_train_feature_array)
+
+    generic_model_dict = dict()
+    if model_name == 'RandomForest':
+        #the forests of all the hyper settings in parallel, see random_forest_grid.py
+        grid_results = run_random_forest_grid(transformed_group_model_sub_train_feature_array, group_model_sub_train_label_array, {'val': transformed_group_model_sub_val_feature_array}, hyper_settings, num_workers=args_dict.num_workers, cpu_budget=args_dict.cpu_budget, return_models=True)
+        for experiment_name, _ in hyper_settings:
+            val_accuracy = accuracy_from_probabilities(grid_results[experiment_name]['classes'], grid_results[experiment_name]['probabilities']['val'], group_model_sub_val_label_array)
+            generic_model_dict[experiment_name] = (grid_results[experiment_name]['model'], val_accuracy)
+    
+    else:
+        for experiment_name, hyper_setting in hyper_settings:
+            model = model_to_use(hyper_setting).fit(transformed_group_model_sub_train_feature_array, group_model_sub_train_label_array)
+            val_accuracy = model.score(transformed_group_model_sub_val_feature_array, group_model_sub_val_label_array) * 100
+            generic_model_dict[experiment_name] = (model, val_accuracy)
+
+    classifier_bundle_paths = dict()
+    for test_subject in test_subjects:
+
+        #load this subject's test data
+        sub_feature_array, sub_label_array = data_loading_function(os.path.join(data_dir, 'sub_{}.csv'.format(test_subject)), num_chunk_this_window_size=num_chunk_this_window_size)
+
+        #sainty check for this test subject's data
+        sub_data_len = len(sub_label_array)
+        assert sub_data_len == int(num_chunk_this_window_size/2), 'subject {} len is not {} for binary classification'.format(test_subject, int(num_chunk_this_window_size/2))
+
+        half_sub_data_len = int(sub_data_len/2)
+
+        #first half of the test subject's data is the adaptation stream, the second half is test set
+        sub_adapt_feature_array = sub_feature_array[:half_sub_data_len]
+
+        transformed_sub_test_feature_array = featurize(sub_feature_array[half_sub_data_len:], classification_task)
+        sub_test_label_array = sub_label_array[half_sub_data_len:]
+
+        for experiment_name, _ in hyper_settings:
+            model, val_accuracy = generic_model_dict[experiment_name]
+
+            #derived args
+            result_save_subjectdir = os.path.join(result_save_rootdir, test_subject, experiment_name)
+            result_save_subject_checkpointdir = os.path.join(result_save_subjectdir, 'checkpoint')
+            result_save_subject_predictionsdir = os.path.join(result_save_subjectdir, 'predictions')
+            result_save_subject_resultanalysisdir = os.path.join(result_save_subjectdir, 'result_analysis')
+
+            makedir_if_not_exist(result_save_subjectdir)
+            makedir_if_not_exist(result_save_subject_checkpointdir)
+            makedir_if_not_exist(result_save_subject_predictionsdir)
+            makedir_if_not_exist(result_save_subject_resultanalysisdir)
+
+            result_save_dict = dict()
+
+            aligner = OnlineCoralAligner(source_coloring_matrix, refresh_every=refresh_every, drift_threshold=drift_threshold, min_chunks=min_chunks)
+
+            #before any adaptation chunk: the generic model
+            online_curve = [dict(num_adapt_chunks=0, num_refreshes=0, test_accuracy=model.score(transformed_sub_test_feature_array, sub_test_label_array) * 100)]
+
+            adaptation_time = 0.0
+            for start in range(0, half_sub_data_len, chunks_per_update):
+                #featurize the chunks as they arrive
+                update_start_time = time.time()
+                refreshed = aligner.partial_fit(featurize(sub_adapt_feature_array[start:start + chunks_per_update], classification_task))
+                adaptation_time += time.time() - update_start_time
+
+                if refreshed:
+                    test_accuracy = model.score(aligner.transform(transformed_sub_test_feature_array), sub_test_label_array) * 100
+                    online_curve.append(dict(num_adapt_chunks=aligner.statistics.count, num_refreshes=aligner.num_refreshes, test_accuracy=test_accuracy))
+
+            #the alignment to all the adaptation chunks, same as --coral_mode target with adapt_on train_100
+            if aligner.num_chunks_at_refresh != aligner.statistics.count:
+                aligner.refresh()
+
+            inference_start_time = time.time()
+            test_logits = model.predict_proba(aligner.transform(transformed_sub_test_feature_array))
+            inference_time = time.time() - inference_start_time
+
+            test_class_predictions = test_logits.argmax(1)
+            test_accuracy = (test_class_predictions == sub_test_label_array).mean() * 100
+            online_curve.append(dict(num_adapt_chunks=aligner.statistics.count, num_refreshes=aligner.num_refreshes, test_accuracy=test_accuracy))
+
+            result_save_dict['bestepoch_val_accuracy'] = val_accuracy
+            result_save_dict['bestepoch_test_accuracy'] = test_accuracy
+            result_save_dict['bestepoch_test_logits'] = test_logits.copy()
+            result_save_dict['bestepoch_test_class_labels'] = sub_test_label_array.copy()
+
+            plot_confusion_matrix(test_class_predictions, sub_test_label_array, confusion_matrix_figure_labels, result_save_subject_resultanalysisdir, 'test_confusion_matrix.png')
+
+            save_pickle(result_save_subject_predictionsdir, 'result_save_dict.pkl', result_save_dict)
+
+            #test accuracy after each refresh of the alignment
+            pd.DataFrame(online_curve).drop_duplicates().to_csv(os.path.join(result_save_subject_resultanalysisdir, 'online_curve.csv'), index=False)
+
+            #write performance to txt file
+            write_performance_info_FixedTrainValSplit('NA', result_save_subject_resultanalysisdir, val_accuracy, test_accuracy)
+
+            #save the fitted pipeline: the generic model is written with the first test subject, the others refer to it (see model_bundles.py)
+            bundle_path = save_model_bundle(result_save_subject_checkpointdir, model, bundle_featurizer_config, train_fingerprint, alignment_matrix=aligner.alignment_matrix, extra={'coral_mode': 'online', 'num_adapt_chunks': aligner.statistics.count, 'num_refreshes': aligner.num_refreshes}, classifier_bundle_path=classifier_bundle_paths.get(experiment_name))
+            classifier_bundle_paths.setdefault(experiment_name, bundle_path)
+
+            #write the time spent on the adaptation stream (featurize + updates + refreshes) to txt file
+            write_program_time(result_save_subject_resultanalysisdir, adaptation_time)
+            write_inference_time(result_save_subject_resultanalysisdir, inference_time)
+
+            print('subject {} {}: {} refreshes, test accuracy {} -> {} ({} seconds of adaptation)'.format(test_subject, experiment_name, aligner.num_refreshes, online_curve[0]['test_accuracy'], test_accuracy, round(adaptation_time, 3)), flush=True)
+
+
+
+
+if __name__=='__main__':
+
+    #parse args
+    args = parser.parse_args()
+
+    seed = args.seed
+    model_name = args.model_name
+    data_dir = args.data_dir
+    window_size = args.window_size
+    classification_task = args.classification_task
+    result_save_rootdir = args.result_save_rootdir
+    setting = args.setting
+    chunks_per_update = args.chunks_per_update
+    refresh_every = args.refresh_every
+    drift_threshold = args.drift_threshold
+    min_chunks = args.min_chunks
+    num_workers = args.num_workers
+    cpu_budget = args.cpu_budget
+
+    test_subjects, train_subjects, val_subjects = generic_GetTrainValTestSubjects(setting)
+
+    #sanity check
+    print('model_name: {} type: {}'.format(model_name, type(model_name)))
+    print('data_dir: {} type: {}'.format(data_dir, type(data_dir)))
+    print('window_size: {} type: {}'.format(window_size, type(window_size)))
+    print('classification_task: {} type: {}'.format(classification_task, type(classification_task)))
+    print('result_save_rootdir: {} type: {}'.format(result_save_rootdir, type(result_save_rootdir)))
+    print('setting: {} type: {}'.format(setting, type(setting)))
+    print('chunks_per_update: {} type: {}'.format(chunks_per_update, type(chunks_per_update)))
+    print('refresh_every: {} type: {}'.format(refresh_every, type(refresh_every)))
+    print('drift_threshold: {} type: {}'.format(drift_threshold, type(drift_threshold)))
+    print('min_chunks: {} type: {}'.format(min_chunks, type(min_chunks)))
+    print('num_workers: {} type: {}'.format(num_workers, type(num_workers)))
+    print('cpu_budget: {} type: {}'.format(cpu_budget, type(cpu_budget)))
+
+    args_dict = edict()
+    args_dict.model_name = model_name
+    args_dict.data_dir = data_dir
+    args_dict.window_size = window_size
+    args_dict.classification_task = classification_task
+    args_dict.result_save_rootdir = result_save_rootdir
+    args_dict.chunks_per_update = chunks_per_update
+    args_dict.refresh_every = refresh_every
+    args_dict.drift_threshold = drift_threshold
+    args_dict.min_chunks = min_chunks
+    args_dict.num_workers = num_workers
+    args_dict.cpu_budget = cpu_budget
+
+    seed_everything(seed)
+    train_classifier(args_dict, train_subjects, val_subjects, test_subjects)
@@ -0,0 +1,314 @@
+import os
+import sys
+import copy
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+import argparse
+
+from easydict import EasyDict as edict
+from sklearn.linear_model import LogisticRegression
+
+YOUR_PATH = os.environ['YOUR_PATH']
+sys.path.insert(0, os.path.join(YOUR_PATH, 'fNIRS-mental-workload-classifiers/helpers'))
+import models
+import brain_data
+from utils import generic_GetTrainValTestSubjects, seed_everything, makedir_if_not_exist, plot_confusion_matrix, save_pickle, save_training_curves_FixedTrainValSplit, write_performance_info_FixedTrainValSplit, write_program_time
+
+#fast per-subject calibration: the convolutional blocks of the generic model stay frozen, the subject's adaptation and test chunks
+#are passed through them once, and only a head is trained on the cached embeddings:
+#   classifier: the generic model's own classifier layer, finetuned with Adam (hyper setting lr)
+#   prototype: nearest class mean in embedding space (no hyper setting)
+#   logistic: sklearn LogisticRegression on the embeddings (hyper setting C)
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--seed', default=1, type=int, help="random seed")
+parser.add_argument('--model_name', default='EEGNet', help='EEGNet or DeepConvNet')
+parser.add_argument('--head', default='classifier', help='classifier, prototype or logistic')
+parser.add_argument('--data_dir', default='../data/Leon/Visual/size_40sec_200ts_stride_3ts/', help="folder to the dataset")
+parser.add_argument('--window_size', default=200, type=int, help='window size')
+parser.add_argument('--result_save_rootdir', default='./experiments', help="Directory containing the dataset")
+parser.add_argument('--classification_task', default='four_class', help='binary or four-class classification')
+parser.add_argument('--restore_file', default='None', help="generic model xxx.statedict")
+parser.add_argument('--n_epoch', default=100, type=int, help="number of epoch for the classifier head")
+parser.add_argument('--setting', default='64vs4_TestBucket1', help='which predefined train val test split scenario')
+parser.add_argument('--adapt_on', default='train_100', help="what portion of the test subject' train set is used for adaptation")
+
+
+def compute_embeddings(model, feature_array):
+    model.eval()
+    with torch.no_grad():
+        return model.embed(torch.from_numpy(np.asarray(feature_array, dtype=np.float32)))
+
+
+def fit_classifier_head(model, lr, n_epoch, cv_train_embedding, cv_train_label, cv_val_embedding, cv_val_label, test_embedding):
+    '''
+    finetune only model.classifier on the cached embeddings (full batch), keep the epoch with the best validation accuracy
+    returns val_accuracy, test_logits, the model with the best head, training curves
+    '''
+
+    model = copy.deepcopy(model)
+    for parameter in model.classifier.parameters():
+        parameter.requires_grad = True
+
+    criterion = nn.NLLLoss()
+    optimizer = torch.optim.Adam(model.classifier.parameters(), lr=lr)
+
+    cv_train_label_tensor = torch.from_numpy(cv_train_label).long()
+
+    best_val_accuracy = 0.0
+    best_state_dict = None
+    epoch_train_loss = []
+    epoch_train_accuracy = []
+    epoch_validation_accuracy = []
+
+    for epoch in range(n_epoch):
+        output = model.classify(cv_train_embedding)
+        loss = criterion(output, cv_train_label_tensor)
+
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+
+        with torch.no_grad():
+            train_accuracy = (model.classify(cv_train_embedding).argmax(1).numpy() == cv_train_label).mean() * 100
+            val_accuracy = (model.classify(cv_val_embedding).argmax(1).numpy() == cv_val_label).mean() * 100
+
+        epoch_train_loss.append(loss.item())
+        epoch_train_accuracy.append(train_accuracy)
+        epoch_validation_accuracy.append(val_accuracy)
+
+        #update is_best flag
+        if val_accuracy >= best_val_accuracy:
+            best_val_accuracy = val_accuracy
+            best_state_dict = copy.deepcopy(model.state_dict())
+            with torch.no_grad():
+                test_logits = model.classify(test_embedding).numpy()
+
+    model.load_state_dict(best_state_dict)
+
+    return best_val_accuracy, test_logits, model, (epoch_train_loss, epoch_train_accuracy, epoch_validation_accuracy)
+
+
+def prototype_scores(prototypes, embedding):
+    #log-softmax of the negative squared distances to the class means
+    distances = ((embedding[:, None, :] - prototypes[None, :, :]) ** 2).sum(axis=2)
+
+    return F.log_softmax(torch.from_numpy(-distances), dim=1).numpy()
+
+
+def train_classifier(args_dict, test_subjects):
+
+    #convert to string list
+    test_subjects = [str(i) for i in test_subjects]
+
+    #parse args:
+    model_name = args_dict.model_name
+    head = args_dict.head
+    data_dir = args_dict.data_dir
+    result_save_rootdir = args_dict.result_save_rootdir
+    classification_task = args_dict.classification_task
+    restore_file = args_dict.restore_file
+    adapt_on = args_dict.adapt_on
+    n_epoch = args_dict.n_epoch
+
+    num_chunk_this_window_size = 1488
+
+    if model_name == 'EEGNet':
+        model_to_use = models.EEGNet150
+
+    elif model_name == 'DeepConvNet':
+        model_to_use = models.DeepConvNet150
+
+    else:
+        raise NameError('not supported model_name')
+
+    if classification_task == 'binary':
+        data_loading_function = brain_data.read_subject_csv_binary
+        confusion_matrix_figure_labels = ['0back', '2back']
+
+    else:
+        raise NameError('not supported classification type')
+
+    #hyper settings of each head
+    if head == 'classifier':
+        experiment_names = ['lr{}'.format(lr) for lr in [0.001, 0.01, 0.1, 1.0]]
+
+    elif head == 'prototype':
+        experiment_names = ['prototype']
+
+    elif head == 'logistic':
+        experiment_names = ['C{}'.format(C) for C in np.logspace(-5,5,11)]
+
+    else:
+        raise NameError('not supported head')
+
+    #the generic model, frozen
+    model = model_to_use()
+    print('loading checkpoint: {}'.format(restore_file))
+    model.load_state_dict(torch.load(restore_file, map_location=torch.device('cpu')))
+    model.eval()
+    for parameter in model.parameters():
+        parameter.requires_grad = False
+
+    for test_subject in test_subjects:
+        calibration_start_time = time.time()
+
+        #load this subject's test data
+        sub_feature_array, sub_label_array = data_loading_function(os.path.join(data_dir, 'sub_{}.csv'.format(test_subject)), num_chunk_this_window_size=num_chunk_this_window_size)
+
+        #sainty check for this test subject's data
+        sub_data_len = len(sub_label_array)
+        assert sub_data_len == int(num_chunk_this_window_size/2), 'subject {} len is not {} for binary classification'.format(test_subject, int(num_chunk_this_window_size/2))
+
+        half_sub_data_len = int(sub_data_len/2)
+
+        #first half of the test subject's data is train set, the second half is test set
+        sub_train_feature_array = sub_feature_array[:half_sub_data_len]
+        sub_train_label_array = sub_label_array[:half_sub_data_len]
+
+        sub_test_feature_array = sub_feature_array[half_sub_data_len:]
+        sub_test_label_array = sub_label_array[half_sub_data_len:]
+
+        #study the effect of the size of the finetuning set
+        if adapt_on == 'train_100':
+            print('adapt on data size: {}'.format(len(sub_train_feature_array)))
+
+        elif adapt_on == 'train_50':
+            sub_train_feature_array = sub_train_feature_array[-int(0.5*half_sub_data_len):]
+            sub_train_label_array = sub_train_label_array[-int(0.5*half_sub_data_len):]
+            print('adapt on data size: {}'.format(len(sub_train_feature_array)))
+
+        else:
+            raise NameError('not on the predefined gride')
+
+        #backbone embeddings, computed once and shared by every hyper setting of the head
+        sub_train_embedding = compute_embeddings(model, sub_train_feature_array)
+        sub_test_embedding = compute_embeddings(model, sub_test_feature_array)
+        embedding_time = time.time() - calibration_start_time
+        print('subject {}: embeddings {} computed in {} seconds'.format(test_subject, tuple(sub_train_embedding.shape), round(embedding_time, 3)), flush=True)
+
+        #1-fold cv, same split as run_EEGNet.py/run_DeepConvNet.py
+        total_number_train_chunks = len(sub_train_feature_array)
+        total_index = np.arange(total_number_train_chunks)
+        train_index = total_index[:int(total_number_train_chunks/2)]
+        val_index = total_index[int(total_number_train_chunks/2):]
+
+        cv_train_embedding, cv_train_label = sub_train_embedding[train_index], sub_train_label_array[train_index]
+        cv_val_embedding, cv_val_label = sub_train_embedding[val_index], sub_train_label_array[val_index]
+
+        for experiment_name in experiment_names:
+            head_start_time = time.time()
+
+            #derived arg
+            result_save_subjectdir = os.path.join(result_save_rootdir, test_subject, experiment_name)
+            result_save_subject_checkpointdir = os.path.join(result_save_subjectdir, 'checkpoint')
+            result_save_subject_predictionsdir = os.path.join(result_save_subjectdir, 'predictions')
+            result_save_subject_resultanalysisdir = os.path.join(result_save_subjectdir, 'result_analysis')
+            result_save_subject_trainingcurvedir = os.path.join(result_save_subjectdir, 'trainingcurve')
+
+            makedir_if_not_exist(result_save_subjectdir)
+            makedir_if_not_exist(result_save_subject_checkpointdir)
+            makedir_if_not_exist(result_save_subject_predictionsdir)
+            makedir_if_not_exist(result_save_subject_resultanalysisdir)
+            makedir_if_not_exist(result_save_subject_trainingcurvedir)
+
+            result_save_dict = dict()
+
+            if head == 'classifier':
+                lr = float(experiment_name.split('lr')[-1])
+                val_accuracy, test_logits, finetuned_model, training_curves = fit_classifier_head(model, lr, n_epoch, cv_train_embedding, cv_train_label, cv_val_embedding, cv_val_label, sub_test_embedding)
+
+                #the full model (frozen backbone + finetuned head), loadable like any other checkpoint
+                torch.save(finetuned_model.state_dict(), os.path.join(result_save_subject_checkpointdir, 'best_model.statedict'))
+                save_training_curves_FixedTrainValSplit('training_curve.png', result_save_subject_trainingcurvedir, *training_curves)
+                model_state_dict = finetuned_model.state_dict()
+
+            elif head == 'prototype':
+                prototypes = np.stack([cv_train_embedding.numpy()[cv_train_label == label].mean(axis=0) for label in np.unique(cv_train_label)])
+                val_accuracy = (prototype_scores(prototypes, cv_val_embedding.numpy()).argmax(1) == cv_val_label).mean() * 100
+                test_logits = prototype_scores(prototypes, sub_test_embedding.numpy())
+
+                save_pickle(result_save_subject_checkpointdir, 'prototypes.pkl', prototypes)
+                model_state_dict = 'NA'
+
+            else:
+                C = float(experiment_name.split('C')[-1])
+                classifier = LogisticRegression(C=C, random_state=0, max_iter=10000, solver='lbfgs').fit(cv_train_embedding.numpy(), cv_train_label)
+                val_accuracy = classifier.score(cv_val_embedding.numpy(), cv_val_label) * 100
+                test_logits = classifier.predict_proba(sub_test_embedding.numpy())
+                model_state_dict = 'NA'
+
+            test_class_predictions = test_logits.argmax(1)
+            test_accuracy = (test_class_predictions == sub_test_label_array).mean() * 100
+            print('subject {} {}: val accuracy {}, test accuracy {}'.format(test_subject, experiment_name, val_accuracy, test_accuracy), flush=True)
+
+            result_save_dict['bestepoch_val_accuracy'] = val_accuracy
+            result_save_dict['bestepoch_test_accuracy'] = test_accuracy
+            result_save_dict['bestepoch_test_logits'] = test_logits.copy()
+            result_save_dict['bestepoch_test_class_labels'] = sub_test_label_array.copy()
+
+            #confusion matrix
+            plot_confusion_matrix(test_class_predictions, sub_test_label_array, confusion_matrix_figure_labels, result_save_subject_resultanalysisdir, 'test_confusion_matrix.png')
+
+            #save result_save_dict
+            save_pickle(result_save_subject_predictionsdir, 'result_save_dict.pkl', result_save_dict)
+
+            #write performance to txt file
+            write_performance_info_FixedTrainValSplit(model_state_dict, result_save_subject_resultanalysisdir, val_accuracy, test_accuracy)
+
+            #write the head's training time (the embeddings are shared) to txt file
+            write_program_time(result_save_subject_resultanalysisdir, time.time() - head_start_time)
+
+        #write the calibration time of this subject (embeddings + every hyper setting of the head) to txt file
+        write_program_time(os.path.join(result_save_rootdir, test_subject), time.time() - calibration_start_time)
+
+
+
+if __name__=='__main__':
+
+    #parse args
+    args = parser.parse_args()
+
+    seed = args.seed
+    model_name = args.model_name
+    head = args.head
+    data_dir = args.data_dir
+    window_size = args.window_size
+    result_save_rootdir = args.result_save_rootdir
+    classification_task = args.classification_task
+    restore_file = args.restore_file
+    adapt_on = args.adapt_on
+    n_epoch = args.n_epoch
+    setting = args.setting
+
+    test_subjects, _, _ = generic_GetTrainValTestSubjects(setting)
+
+    #sanity check:
+    print('model_name: {}, type: {}'.format(model_name, type(model_name)))
+    print('head: {}, type: {}'.format(head, type(head)))
+    print('data_dir: {}, type: {}'.format(data_dir, type(data_dir)))
+    print('window_size: {}, type: {}'.format(window_size, type(window_size)))
+    print('result_save_rootdir: {}, type: {}'.format(result_save_rootdir, type(result_save_rootdir)))
+    print('classification_task: {}, type: {}'.format(classification_task, type(classification_task)))
+    print('restore_file: {} type: {}'.format(restore_file, type(restore_file)))
+    print('n_epoch: {} type: {}'.format(n_epoch, type(n_epoch)))
+    print('setting: {} type: {}'.format(setting, type(setting)))
+
+    args_dict = edict()
+
+    args_dict.model_name = model_name
+    args_dict.head = head
+    args_dict.data_dir = data_dir
+    args_dict.window_size = window_size
+    args_dict.result_save_rootdir = result_save_rootdir
+    args_dict.classification_task = classification_task
+    args_dict.restore_file = restore_file
+    args_dict.n_epoch = n_epoch
+    args_dict.adapt_on = adapt_on
+
+    seed_everything(seed)
+    train_classifier(args_dict, test_subjects)
@@ -0,0 +1,240 @@
+import os
+import sys
+import numpy as np
+import argparse
+
+import time
+
+from easydict import EasyDict as edict
+from tqdm import trange
+from sklearn.model_selection import KFold
+
+YOUR_PATH = os.environ['YOUR_PATH']
+sys.path.insert(0, os.path.join(YOUR_PATH, 'fNIRS-mental-workload-classifiers/helpers'))
+import models
+import brain_data
+from model_bundles import featurizer_config, data_fingerprint, save_model_bundle
+from random_forest_grid import accuracy_from_probabilities
+from hist_gradient_boosting_grid import hist_gradient_boosting_hyper_settings, run_hist_gradient_boosting_grid
+from utils import generic_GetTrainValTestSubjects, seed_everything, featurize, makedir_if_not_exist, plot_confusion_matrix, save_pickle, write_performance_info_FixedTrainValSplit, write_program_time
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--seed', default=0, type=int, help='random seed')
+parser.add_argument('--data_dir', default='../data/Leon/Visual/size_2sec_10ts_stride_3ts/', help='folder to the train data')
+parser.add_argument('--window_size', default=200, type=int, help='window size')
+parser.add_argument('--result_save_rootdir', default='./experiments', help='folder to the result')
+parser.add_argument('--classification_task', default='four_class', help='binary or four-class classification')
+parser.add_argument('--setting', default='64vs4_TestBucket1', help='which predefined train val test split scenario')
+parser.add_argument('--max_iter', default=500, type=int, help='max boosting iterations')
+parser.add_argument('--eval_every', default=10, type=int, help='boosting iterations between two checks of the validation log loss')
+parser.add_argument('--patience', default=5, type=int, help='early stopping after this many checks without improvement of the validation log loss')
+parser.add_argument('--num_workers', default=0, type=int, help='models fitted in parallel, 0: one per hyper setting up to the cpu budget')
+parser.add_argument('--cpu_budget', default=0, type=int, help='cpus shared by the parallel models, 0: all cpus')
+
+def train_classifier(args_dict, train_subjects, val_subjects, test_subjects):
+    #convert to string list
+    train_subjects = [str(i) for i in train_subjects]
+    val_subjects = [str(i) for i in val_subjects]
+    test_subjects = [str(i) for i in test_subjects]
+    
+    #parse args:
+    data_dir = args_dict.data_dir
+    window_size = args_dict.window_size
+    result_save_rootdir = args_dict.result_save_rootdir
+    classification_task = args_dict.classification_task
+    
+    num_chunk_this_window_size = 1488        
+        
+    if classification_task == 'four_class':
+        data_loading_function = brain_data.read_subject_csv
+        confusion_matrix_figure_labels = ['0back', '1back', '2back', '3back']
+        
+    elif classification_task == 'binary':
+        data_loading_function = brain_data.read_subject_csv_binary
+        confusion_matrix_figure_labels = ['0back', '2back']
+        
+    else:
+        raise NameError('not supported classification type')
+        
+    
+    #create the group train data 
+    group_model_sub_train_feature_list = []
+    group_model_sub_train_label_list = []
+    
+    for subject in train_subjects:
+        sub_feature, sub_label = data_loading_function(os.path.join(data_dir, 'sub_{}.csv'.format(subject)), num_chunk_this_window_size=num_chunk_this_window_size)
+        
+        group_model_sub_train_feature_list.append(sub_feature)
+        group_model_sub_train_label_list.append(sub_label)
+    
+    group_model_sub_train_feature_array = np.concatenate(group_model_sub_train_feature_list, axis=0).astype(np.float32)
+    group_model_sub_train_label_array = np.concatenate(group_model_sub_train_label_list, axis=0)
+    
+    transformed_group_model_sub_train_feature_array = featurize(group_model_sub_train_feature_array, classification_task)
+    
+    
+    #create the group val data
+    group_model_sub_val_feature_list = []
+    group_model_sub_val_label_list = []
+    
+    for subject in val_subjects:
+        sub_feature, sub_label = data_loading_function(os.path.join(data_dir, 'sub_{}.csv'.format(subject)), num_chunk_this_window_size=num_chunk_this_window_size)
+        
+        group_model_sub_val_feature_list.append(sub_feature)
+        group_model_sub_val_label_list.append(sub_label)
+    
+    group_model_sub_val_feature_array = np.concatenate(group_model_sub_val_feature_list, axis=0).astype(np.float32)
+    group_model_sub_val_label_array = np.concatenate(group_model_sub_val_label_list, axis=0)
+    
+    transformed_group_model_sub_val_feature_array = featurize(group_model_sub_val_feature_array, classification_task)
+
+    
+    #load the test subjects once, the whole grid is evaluated on them
+    test_subjects_dict = dict()
+    for test_subject in test_subjects:
+        #load this subject's test data
+        sub_feature_array, sub_label_array = data_loading_function(os.path.join(data_dir, 'sub_{}.csv'.format(test_subject)), num_chunk_this_window_size=num_chunk_this_window_size)
+        
+        sub_data_len = len(sub_label_array)
+        assert sub_data_len == int(num_chunk_this_window_size/2), 'subject {} len is not {} for binary classification'.format(test_subject, int(num_chunk_this_window_size/2))
+        half_sub_data_len = int(sub_data_len/2)
+        print('half_sub_data_len: {}'.format(half_sub_data_len), flush=True)
+
+        sub_test_feature_array = sub_feature_array[half_sub_data_len:]
+        transformed_sub_test_feature_array = featurize(sub_test_feature_array, classification_task)
+        sub_test_label_array = sub_label_array[half_sub_data_len:]
+
+        test_subjects_dict[test_subject] = dict()
+        test_subjects_dict[test_subject]['transformed_sub_test_feature_array'] = transformed_sub_test_feature_array
+        test_subjects_dict[test_subject]['sub_test_label_array'] = sub_test_label_array
+
+    
+    #every fitted pipeline is saved as a model bundle (see model_bundles.py)
+    bundle_featurizer_config = featurizer_config(classification_task, window_size)
+    train_fingerprint = data_fingerprint(transformed_group_model_sub_train_feature_array, group_model_sub_train_label_array)
+
+    #cross validation
+    start_time = time.time()
+
+    #the features are binned once for all the hyper settings, fitted in parallel with early stopping on the val subjects, one predict_proba
+    #per model and evaluation set
+    eval_features_dict = {'val': transformed_group_model_sub_val_feature_array}
+    for test_subject in test_subjects:
+        eval_features_dict[test_subject] = test_subjects_dict[test_subject]['transformed_sub_test_feature_array']
+    
+    grid_results = run_hist_gradient_boosting_grid(transformed_group_model_sub_train_feature_array, group_model_sub_train_label_array, eval_features_dict, group_model_sub_val_label_array, hist_gradient_boosting_hyper_settings(), max_iter=args_dict.max_iter, eval_every=args_dict.eval_every, patience=args_dict.patience, num_workers=args_dict.num_workers, cpu_budget=args_dict.cpu_budget, return_models=True)
+
+    classifier_bundle_paths = dict()
+    for experiment_name, _ in hist_gradient_boosting_hyper_settings():
+        classes = grid_results[experiment_name]['classes']
+        probabilities_dict = grid_results[experiment_name]['probabilities']
+        
+        # val performance 
+        val_accuracy = accuracy_from_probabilities(classes, probabilities_dict['val'], group_model_sub_val_label_array)
+        
+        # test performance
+        for test_subject in test_subjects:
+            #derived args
+            result_save_subjectdir = os.path.join(result_save_rootdir, test_subject, experiment_name)
+            result_save_subject_checkpointdir = os.path.join(result_save_subjectdir, 'checkpoint')
+            result_save_subject_predictionsdir = os.path.join(result_save_subjectdir, 'predictions')
+            result_save_subject_resultanalysisdir = os.path.join(result_save_subjectdir, 'result_analysis')
+            result_save_subject_trainingcurvedir = os.path.join(result_save_subjectdir, 'trainingcurve')
+
+            makedir_if_not_exist(result_save_subjectdir)
+            makedir_if_not_exist(result_save_subject_checkpointdir)
+            makedir_if_not_exist(result_save_subject_predictionsdir)
+            makedir_if_not_exist(result_save_subject_resultanalysisdir)
+            makedir_if_not_exist(result_save_subject_trainingcurvedir)
+
+            sub_test_label_array = test_subjects_dict[test_subject]['sub_test_label_array']
+            test_logits = probabilities_dict[test_subject]
+            test_accuracy = accuracy_from_probabilities(classes, test_logits, sub_test_label_array)
+            test_class_predictions = test_logits.argmax(1)
+            
+            result_save_dict = dict()
+            result_save_dict['bestepoch_val_accuracy'] = val_accuracy
+            result_save_dict['bestepoch_test_accuracy'] = test_accuracy
+            result_save_dict['bestepoch_test_logits'] = test_logits
+            result_save_dict['bestepoch_test_class_labels'] = sub_test_label_array
+            
+            plot_confusion_matrix(test_class_predictions, sub_test_label_array, confusion_matrix_figure_labels, result_save_subject_resultanalysisdir, 'test_confusion_matrix.png')
+
+            save_pickle(result_save_subject_predictionsdir, 'result_save_dict.pkl', result_save_dict)
+            
+            #write performance to txt file
+            write_performance_info_FixedTrainValSplit('NA', result_save_subject_resultanalysisdir, val_accuracy, test_accuracy)
+
+            #save the fitted pipeline: the generic model is written with the first test subject, the others refer to it (see model_bundles.py)
+            bundle_path = save_model_bundle(result_save_subject_checkpointdir, grid_results[experiment_name]['model'], bundle_featurizer_config, train_fingerprint, classifier_bundle_path=classifier_bundle_paths.get(experiment_name))
+            classifier_bundle_paths.setdefault(experiment_name, bundle_path)
+
+    end_time = time.time()
+    total_time = end_time - start_time
+    write_program_time(result_save_rootdir, total_time)
+    
+    
+if __name__=='__main__':
+    
+    #parse args
+    args = parser.parse_args()
+    
+    seed = args.seed
+    data_dir = args.data_dir
+    window_size = args.window_size
+    result_save_rootdir = args.result_save_rootdir
+    classification_task = args.classification_task
+    setting = args.setting
+    max_iter = args.max_iter
+    eval_every = args.eval_every
+    patience = args.patience
+    num_workers = args.num_workers
+    cpu_budget = args.cpu_budget
+    
+    test_subjects, train_subjects, val_subjects = generic_GetTrainValTestSubjects(setting)
+    
+    #sanity check 
+    print('data_dir: {}, type: {}'.format(data_dir, type(data_dir)))
+    print('window_size: {}, type: {}'.format(window_size, type(window_size)))
+    print('result_save_rootdir: {}, type: {}'.format(result_save_rootdir, type(result_save_rootdir)))
+    print('classification_task: {}, type: {}'.format(classification_task, type(classification_task)))
+    print('setting: {} type: {}'.format(setting, type(setting)))
+    print('max_iter: {} type: {}'.format(max_iter, type(max_iter)))
+    print('eval_every: {} type: {}'.format(eval_every, type(eval_every)))
+    print('patience: {} type: {}'.format(patience, type(patience)))
+    print('num_workers: {} type: {}'.format(num_workers, type(num_workers)))
+    print('cpu_budget: {} type: {}'.format(cpu_budget, type(cpu_budget)))
+    
+    args_dict = edict()
+    args_dict.data_dir = data_dir
+    args_dict.window_size = window_size
+    args_dict.result_save_rootdir = result_save_rootdir
+    args_dict.classification_task = classification_task
+    args_dict.max_iter = max_iter
+    args_dict.eval_every = eval_every
+    args_dict.patience = patience
+    args_dict.num_workers = num_workers
+    args_dict.cpu_budget = cpu_budget
+    
+    seed_everything(seed)
+    train_classifier(args_dict, train_subjects, val_subjects, test_subjects)
+        
+            
+            
+            
+            
+    
+    
+    
+    
+    
+    
+    
+    
+    
+    
+    
+    
+    
+    
+
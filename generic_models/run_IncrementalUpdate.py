@@ -0,0 +1,359 @@
+import os
+import sys
+import csv
+import copy
+import numpy as np
+import torch
+import torch.nn as nn
+
+import time
+import argparse
+
+from easydict import EasyDict as edict
+from sklearn.base import clone
+from sklearn.linear_model import LogisticRegression
+
+YOUR_PATH = os.environ['YOUR_PATH']
+sys.path.insert(0, os.path.join(YOUR_PATH, 'fNIRS-mental-workload-classifiers/helpers'))
+import models
+import brain_data
+from model_bundles import BUNDLE_FILENAME, featurizer_config, data_fingerprint, save_model_bundle, load_model_bundle
+from replay import build_replay_buffer, merge_replay_buffer, load_replay_buffer
+from utils import generic_GetTrainValTestSubjects, seed_everything, featurize, makedir_if_not_exist, plot_confusion_matrix, save_pickle, train_one_epoch, eval_model, write_performance_info_FixedTrainValSplit, write_program_time
+
+#update a generic EEGNet/Logistic Regression model when new subjects are enrolled, instead of retraining on the whole pool: the model is
+#warm started from the generic checkpoint of the bucket (--restore_dir, --experiment_name) and trained on the new subjects plus a
+#bounded, stratified replay sample of the old pool (see replay.py). The replay sample is read from --replay_file if it exists (the
+#buffer saved by a previous update), drawn from the old pool's csv files otherwise; the buffer grown by the new subjects is saved with
+#the updated model (result_save_rootdir/incremental, the --restore_dir of the next enrollment)
+#
+#for comparison the model is also retrained from scratch on the old pool plus the new subjects, as the generic runners do. Both are
+#evaluated on the bucket's val subjects and test subjects, and update_summary.csv reports their accuracies and costs (train chunks,
+#epochs or lbfgs iterations, seconds reading the data each one needs, seconds training)
+#
+#Logistic Regression weights each replayed chunk by the pool chunks of its (subject, class) cell it stands for, so the update minimizes
+#an estimate of the full pool's objective; EEGNet trains on the replayed chunks unweighted, as train_one_epoch does
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--seed', default=0, type=int, help='random seed')
+parser.add_argument('--model_name', default='EEGNet', help='EEGNet or LogisticRegression')
+parser.add_argument('--data_dir', default='../data/Leon/Visual/size_30sec_150ts_stride_3ts/', help='folder to the dataset')
+parser.add_argument('--window_size', default=150, type=int, help='window size')
+parser.add_argument('--classification_task', default='binary', help='binary or four-class classification')
+parser.add_argument('--setting', default='16vs4_TestBucket1', help='which predefined train val test split scenario the generic model was trained on')
+parser.add_argument('--new_subjects', default=[5, 13, 14, 15], type=int, nargs='+', help='enrolled subjects, not in the train/val/test subjects of the setting')
+parser.add_argument('--restore_dir', default='./experiments/generic_models/EEGNet/binary/16vs4/TestBucket1', help='result_save_rootdir of the generic run to update')
+parser.add_argument('--experiment_name', default='lr0.001_dropout0.25', help='hyper setting of the generic model to update, lr{}_dropout{} for EEGNet, C{} for Logistic Regression')
+parser.add_argument('--replay_size', default=2000, type=int, help='max number of replayed chunks of the old pool')
+parser.add_argument('--replay_file', default='', help='replay buffer of the old pool, empty: restore_dir/replay_buffer.npz')
+parser.add_argument('--update_epochs', default=50, type=int, help='EEGNet epochs of the update')
+parser.add_argument('--n_epoch', default=600, type=int, help='EEGNet epochs of the full retrain')
+parser.add_argument('--result_save_rootdir', default='./experiments/generic_models/IncrementalUpdate/EEGNet/binary/16vs4/TestBucket1', help='folder to the result')
+
+
+def load_subjects(data_loading_function, data_dir, subjects, num_chunk_this_window_size):
+    '''
+    chunks, labels and subject of each chunk of the subjects, and the seconds it took to read them
+    '''
+
+    start_time = time.time()
+
+    sub_feature_list = []
+    sub_label_list = []
+    sub_subject_list = []
+    for subject in subjects:
+        sub_feature, sub_label = data_loading_function(os.path.join(data_dir, 'sub_{}.csv'.format(subject)), num_chunk_this_window_size=num_chunk_this_window_size)
+
+        sub_feature_list.append(sub_feature)
+        sub_label_list.append(sub_label)
+        sub_subject_list.append(np.full(len(sub_label), subject))
+
+    return np.concatenate(sub_feature_list, axis=0).astype(np.float32), np.concatenate(sub_label_list, axis=0), np.concatenate(sub_subject_list, axis=0), time.time() - start_time
+
+
+def train_deep_model(model, lr, train_feature_array, train_label_array, val_loader, n_epoch, device):
+    '''
+    train as the generic runners do (full batch Adam, best epoch on the val set) -> best state dict, its val accuracy, epochs
+    '''
+
+    #dataset object
+    train_set = brain_data.brain_dataset(train_feature_array, train_label_array)
+
+    #dataloader object
+    train_loader = torch.utils.data.DataLoader(train_set, batch_size=len(train_set), shuffle=True)
+
+    #create criterion and optimizer
+    criterion = nn.NLLLoss() #for EEGNet and DeepConvNet, use nn.NLLLoss directly, which accept integer labels
+    optimizer = torch.optim.Adam(model.parameters(), lr=lr) #the authors used Adam instead of SGD
+
+    best_val_accuracy = 0.0
+    best_state_dict = copy.deepcopy(model.state_dict())
+    for epoch in range(n_epoch):
+        train_one_epoch(model, optimizer, criterion, train_loader, device)
+        val_accuracy, _, _, _ = eval_model(model, val_loader, device)
+
+        #update is_best flag
+        if val_accuracy >= best_val_accuracy:
+            best_val_accuracy = val_accuracy
+            best_state_dict = copy.deepcopy(model.state_dict())
+
+    return best_state_dict, best_val_accuracy, n_epoch
+
+
+def update_generic_model(args_dict, train_subjects, val_subjects, test_subjects, new_subjects):
+
+    #convert to string list
+    train_subjects = [str(i) for i in train_subjects]
+    val_subjects = [str(i) for i in val_subjects]
+    test_subjects = [str(i) for i in test_subjects]
+    new_subjects = [str(i) for i in new_subjects]
+
+    #parse args:
+    seed = args_dict.seed
+    model_name = args_dict.model_name
+    data_dir = args_dict.data_dir
+    window_size = args_dict.window_size
+    classification_task = args_dict.classification_task
+    restore_dir = args_dict.restore_dir
+    experiment_name = args_dict.experiment_name
+    replay_size = args_dict.replay_size
+    replay_file = args_dict.replay_file
+    update_epochs = args_dict.update_epochs
+    n_epoch = args_dict.n_epoch
+    result_save_rootdir = args_dict.result_save_rootdir
+
+    num_chunk_this_window_size = 1488
+
+    if classification_task == 'binary':
+        data_loading_function = brain_data.read_subject_csv_binary
+        confusion_matrix_figure_labels = ['0back', '2back']
+
+    else:
+        raise NameError('not supported classification type')
+
+    if model_name not in ['EEGNet', 'LogisticRegression']:
+        raise NameError('not supported model_name')
+
+    assert not set(new_subjects) & set(train_subjects + val_subjects + test_subjects), 'new subjects {} are already in the train/val/test subjects'.format(sorted(set(new_subjects) & set(train_subjects + val_subjects + test_subjects)))
+
+    makedir_if_not_exist(result_save_rootdir)
+
+    #the new subjects, val and test sets
+    new_feature_array, new_label_array, new_subject_array, new_data_seconds = load_subjects(data_loading_function, data_dir, new_subjects, num_chunk_this_window_size)
+    val_feature_array, val_label_array, _, _ = load_subjects(data_loading_function, data_dir, val_subjects, num_chunk_this_window_size)
+
+    test_subjects_dict = dict()
+    for test_subject in test_subjects:
+        sub_feature_array, sub_label_array, _, _ = load_subjects(data_loading_function, data_dir, [test_subject], num_chunk_this_window_size)
+        half_sub_data_len = int(len(sub_label_array)/2)
+
+        test_subjects_dict[test_subject] = dict()
+        test_subjects_dict[test_subject]['sub_test_feature_array'] = sub_feature_array[half_sub_data_len:]
+        test_subjects_dict[test_subject]['sub_test_label_array'] = sub_label_array[half_sub_data_len:]
+
+    #the old pool (the subjects of the generic model: the setting's train subjects, plus the subjects enrolled by previous updates if the
+    #model is an update): needed by the full retrain, and by the update only if there is no replay buffer yet
+    if replay_file != '' and os.path.exists(replay_file):
+        replay_start_time = time.time()
+        replay_buffer = load_replay_buffer(replay_file)
+        replay_seconds = time.time() - replay_start_time
+        print('replaying {} chunks from {}'.format(len(replay_buffer.label_array), replay_file), flush=True)
+
+        old_subjects = replay_buffer.subjects
+        old_feature_array, old_label_array, old_subject_array, old_data_seconds = load_subjects(data_loading_function, data_dir, old_subjects, num_chunk_this_window_size)
+
+    else:
+        old_subjects = train_subjects
+        old_feature_array, old_label_array, old_subject_array, old_data_seconds = load_subjects(data_loading_function, data_dir, old_subjects, num_chunk_this_window_size)
+
+        replay_start_time = time.time()
+        replay_buffer = build_replay_buffer(old_feature_array, old_label_array, old_subject_array, replay_size, random_state=seed)
+        #drawn from the old pool's csv files
+        replay_seconds = time.time() - replay_start_time + old_data_seconds
+        print('replaying {} chunks drawn from the {} old subjects'.format(len(replay_buffer.label_array), len(old_subjects)), flush=True)
+
+    assert not set(new_subjects) & set(old_subjects), 'new subjects {} are already in the pool of the generic model'.format(sorted(set(new_subjects) & set(old_subjects)))
+
+    #new subjects + replay sample
+    update_feature_array = np.concatenate([new_feature_array, replay_buffer.feature_array])
+    update_label_array = np.concatenate([new_label_array, replay_buffer.label_array])
+    update_sample_weight = np.concatenate([np.ones(len(new_label_array)), replay_buffer.sample_weights()])
+
+    #whole pool
+    full_feature_array = np.concatenate([old_feature_array, new_feature_array])
+    full_label_array = np.concatenate([old_label_array, new_label_array])
+
+    mode_dict = dict()
+
+    if model_name == 'EEGNet':
+        #lr{}_dropout{}
+        lr = float(experiment_name.split('_')[0][len('lr'):])
+        dropout = float(experiment_name.split('_')[1][len('dropout'):])
+
+        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+        val_loader = torch.utils.data.DataLoader(brain_data.brain_dataset(val_feature_array, val_label_array), batch_size=len(val_label_array), shuffle=False)
+
+        restore_path = os.path.join(restore_dir, test_subjects[0], experiment_name, 'checkpoint', 'best_model.statedict')
+        print('loading checkpoint: {}'.format(restore_path), flush=True)
+
+        #warm started update
+        seed_everything(seed)
+        start_time = time.time()
+        model = models.EEGNet150(dropout=dropout).to(device)
+        model.load_state_dict(torch.load(restore_path, map_location=device))
+        state_dict, val_accuracy, num_steps = train_deep_model(model, lr, update_feature_array, update_label_array, val_loader, update_epochs, device)
+        model.load_state_dict(state_dict)
+        mode_dict['incremental'] = dict(model=model, val_accuracy=val_accuracy, num_steps=num_steps, train_chunks=len(update_label_array), data_seconds=new_data_seconds + replay_seconds, train_seconds=time.time() - start_time)
+
+        #full retrain from scratch
+        seed_everything(seed)
+        start_time = time.time()
+        model = models.EEGNet150(dropout=dropout).to(device)
+        state_dict, val_accuracy, num_steps = train_deep_model(model, lr, full_feature_array, full_label_array, val_loader, n_epoch, device)
+        model.load_state_dict(state_dict)
+        mode_dict['full_retrain'] = dict(model=model, val_accuracy=val_accuracy, num_steps=num_steps, train_chunks=len(full_label_array), data_seconds=new_data_seconds + old_data_seconds, train_seconds=time.time() - start_time)
+
+        for mode in mode_dict.keys():
+            for test_subject in test_subjects:
+                test_loader = torch.utils.data.DataLoader(brain_data.brain_dataset(test_subjects_dict[test_subject]['sub_test_feature_array'], test_subjects_dict[test_subject]['sub_test_label_array']), batch_size=len(test_subjects_dict[test_subject]['sub_test_label_array']), shuffle=False)
+                test_accuracy, _, _, test_logits = eval_model(mode_dict[mode]['model'], test_loader, device)
+                test_subjects_dict[test_subject][mode] = (test_accuracy, test_logits)
+
+    else:
+        restore_path = os.path.join(restore_dir, test_subjects[0], experiment_name, 'checkpoint', BUNDLE_FILENAME)
+        print('loading model bundle: {}'.format(restore_path), flush=True)
+        bundle = load_model_bundle(restore_path, expected_featurizer_config=featurizer_config(classification_task, window_size))
+        generic_model = bundle['classifier']
+
+        transformed_val_feature_array = featurize(val_feature_array, classification_task)
+
+        #warm started update: the generic coefficients as the starting point, the replayed chunks weighted for the old pool
+        start_time = time.time()
+        transformed_update_feature_array = featurize(update_feature_array, classification_task)
+        model = clone(generic_model).set_params(warm_start=True)
+        model.coef_ = np.array(generic_model.coef_)
+        model.intercept_ = np.array(generic_model.intercept_)
+        model.fit(transformed_update_feature_array, update_label_array, sample_weight=update_sample_weight)
+        mode_dict['incremental'] = dict(model=model, num_steps=int(np.max(model.n_iter_)), train_chunks=len(update_label_array), data_seconds=new_data_seconds + replay_seconds, train_seconds=time.time() - start_time, train_fingerprint=data_fingerprint(transformed_update_feature_array, update_label_array))
+
+        #full retrain from scratch, as run_LogisticRegression.py fits this C
+        start_time = time.time()
+        transformed_full_feature_array = featurize(full_feature_array, classification_task)
+        model = LogisticRegression(C=generic_model.C, random_state=0, max_iter=10000, solver='lbfgs').fit(transformed_full_feature_array, full_label_array)
+        mode_dict['full_retrain'] = dict(model=model, num_steps=int(np.max(model.n_iter_)), train_chunks=len(full_label_array), data_seconds=new_data_seconds + old_data_seconds, train_seconds=time.time() - start_time, train_fingerprint=data_fingerprint(transformed_full_feature_array, full_label_array))
+
+        for mode in mode_dict.keys():
+            mode_dict[mode]['val_accuracy'] = mode_dict[mode]['model'].score(transformed_val_feature_array, val_label_array) * 100
+            for test_subject in test_subjects:
+                test_logits = mode_dict[mode]['model'].predict_proba(featurize(test_subjects_dict[test_subject]['sub_test_feature_array'], classification_task))
+                test_accuracy = (mode_dict[mode]['model'].classes_[test_logits.argmax(1)] == test_subjects_dict[test_subject]['sub_test_label_array']).mean() * 100
+                test_subjects_dict[test_subject][mode] = (test_accuracy, test_logits)
+
+    #results of both modes, in the generic runners' layout
+    summary_filename = os.path.join(result_save_rootdir, 'update_summary.csv')
+    with open(summary_filename, mode='w') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=['mode', 'subject_id', 'validation_accuracy', 'test_accuracy', 'train_chunks', 'epochs_or_iterations', 'data_seconds', 'train_seconds'])
+        writer.writeheader()
+
+        for mode, mode_results in mode_dict.items():
+            for test_subject in test_subjects:
+                #derived args
+                result_save_subjectdir = os.path.join(result_save_rootdir, mode, test_subject, experiment_name)
+                result_save_subject_checkpointdir = os.path.join(result_save_subjectdir, 'checkpoint')
+                result_save_subject_predictionsdir = os.path.join(result_save_subjectdir, 'predictions')
+                result_save_subject_resultanalysisdir = os.path.join(result_save_subjectdir, 'result_analysis')
+
+                makedir_if_not_exist(result_save_subjectdir)
+                makedir_if_not_exist(result_save_subject_checkpointdir)
+                makedir_if_not_exist(result_save_subject_predictionsdir)
+                makedir_if_not_exist(result_save_subject_resultanalysisdir)
+
+                test_accuracy, test_logits = test_subjects_dict[test_subject][mode]
+                sub_test_label_array = test_subjects_dict[test_subject]['sub_test_label_array']
+
+                result_save_dict = dict()
+                result_save_dict['bestepoch_val_accuracy'] = mode_results['val_accuracy']
+                result_save_dict['bestepoch_test_accuracy'] = test_accuracy
+                result_save_dict['bestepoch_test_logits'] = test_logits
+                result_save_dict['bestepoch_test_class_labels'] = sub_test_label_array
+
+                plot_confusion_matrix(test_logits.argmax(1), sub_test_label_array, confusion_matrix_figure_labels, result_save_subject_resultanalysisdir, 'test_confusion_matrix.png')
+
+                save_pickle(result_save_subject_predictionsdir, 'result_save_dict.pkl', result_save_dict)
+
+                #write performance to txt file
+                write_performance_info_FixedTrainValSplit('NA', result_save_subject_resultanalysisdir, mode_results['val_accuracy'], test_accuracy)
+
+                #save the updated model
+                if model_name == 'EEGNet':
+                    torch.save(mode_results['model'].state_dict(), os.path.join(result_save_subject_checkpointdir, 'best_model.statedict'))
+                else:
+                    save_model_bundle(result_save_subject_checkpointdir, mode_results['model'], featurizer_config(classification_task, window_size), mode_results['train_fingerprint'], extra={'update_mode': mode, 'new_subjects': new_subjects})
+
+                writer.writerow({'mode': mode, 'subject_id': test_subject, 'validation_accuracy': mode_results['val_accuracy'], 'test_accuracy': test_accuracy, 'train_chunks': mode_results['train_chunks'], 'epochs_or_iterations': mode_results['num_steps'], 'data_seconds': mode_results['data_seconds'], 'train_seconds': mode_results['train_seconds']})
+
+            print('{}: val accuracy {}, {} train chunks, {} epochs/iterations, {} seconds reading data, {} seconds training'.format(mode, mode_results['val_accuracy'], mode_results['train_chunks'], mode_results['num_steps'], round(mode_results['data_seconds'], 2), round(mode_results['train_seconds'], 2)), flush=True)
+
+    #the replay buffer of the grown pool, for the next enrollment
+    merge_replay_buffer(replay_buffer, new_feature_array, new_label_array, new_subject_array, replay_size, random_state=seed).save(os.path.join(result_save_rootdir, 'incremental', 'replay_buffer.npz'))
+
+    write_program_time(result_save_rootdir, sum(mode_results['data_seconds'] + mode_results['train_seconds'] for mode_results in mode_dict.values()))
+
+
+if __name__=='__main__':
+
+    #parse args
+    args = parser.parse_args()
+
+    seed = args.seed
+    model_name = args.model_name
+    data_dir = args.data_dir
+    window_size = args.window_size
+    classification_task = args.classification_task
+    setting = args.setting
+    new_subjects = args.new_subjects
+    restore_dir = args.restore_dir
+    experiment_name = args.experiment_name
+    replay_size = args.replay_size
+    replay_file = args.replay_file
+    update_epochs = args.update_epochs
+    n_epoch = args.n_epoch
+    result_save_rootdir = args.result_save_rootdir
+
+    if replay_file == '':
+        replay_file = os.path.join(restore_dir, 'replay_buffer.npz')
+
+    test_subjects, train_subjects, val_subjects = generic_GetTrainValTestSubjects(setting)
+
+    #sanity check:
+    print('model_name: {}, type: {}'.format(model_name, type(model_name)))
+    print('data_dir: {}, type: {}'.format(data_dir, type(data_dir)))
+    print('window_size: {}, type: {}'.format(window_size, type(window_size)))
+    print('classification_task: {}, type: {}'.format(classification_task, type(classification_task)))
+    print('setting: {} type: {}'.format(setting, type(setting)))
+    print('new_subjects: {} type: {}'.format(new_subjects, type(new_subjects)))
+    print('restore_dir: {} type: {}'.format(restore_dir, type(restore_dir)))
+    print('experiment_name: {} type: {}'.format(experiment_name, type(experiment_name)))
+    print('replay_size: {} type: {}'.format(replay_size, type(replay_size)))
+    print('replay_file: {} type: {}'.format(replay_file, type(replay_file)))
+    print('update_epochs: {} type: {}'.format(update_epochs, type(update_epochs)))
+    print('n_epoch: {} type: {}'.format(n_epoch, type(n_epoch)))
+    print('result_save_rootdir: {}, type: {}'.format(result_save_rootdir, type(result_save_rootdir)))
+
+    args_dict = edict()
+    args_dict.seed = seed
+    args_dict.model_name = model_name
+    args_dict.data_dir = data_dir
+    args_dict.window_size = window_size
+    args_dict.classification_task = classification_task
+    args_dict.restore_dir = restore_dir
+    args_dict.experiment_name = experiment_name
+    args_dict.replay_size = replay_size
+    args_dict.replay_file = replay_file
+    args_dict.update_epochs = update_epochs
+    args_dict.n_epoch = n_epoch
+    args_dict.result_save_rootdir = result_save_rootdir
+
+    seed_everything(seed)
+    update_generic_model(args_dict, train_subjects, val_subjects, test_subjects, new_subjects)
@@ -0,0 +1,185 @@
+import os
+import sys
+import csv
+import numpy as np
+import argparse
+
+import time
+
+from easydict import EasyDict as edict
+
+YOUR_PATH = os.environ['YOUR_PATH']
+sys.path.insert(0, os.path.join(YOUR_PATH, 'fNIRS-mental-workload-classifiers/helpers'))
+from featurized_subjects import load_featurized_subjects
+from sufficient_statistics import SubjectStatistics, solve_ridge, solve_shrinkage_lda, predict_linear
+from utils import generic_GetTrainValTestSubjects, SubgroupAnalysisWhite_GetTrainValTestSubjects, SubgroupAnalysisAsian_GetTrainValTestSubjects, seed_everything, makedir_if_not_exist, write_program_time
+
+#rapid screening of closed-form linear classifiers (ridge classifier, shrinkage LDA) on every train pool of the paper at once: the 17
+#buckets of the 3 generic scenarios, the 4 partitions of the 2 subgroup analyses and leave-one-subject-out over the 68 subjects. The
+#subjects are featurized once (cached, see featurized_subjects.py), their sufficient statistics computed once, and each pool is a sum of
+#statistics and one [32, 32] solve per hyper setting (see sufficient_statistics.py)
+#
+#generic and subgroup pools are evaluated as the runners do (all chunks of the val subjects, second half of each test subject);
+#leave-one-subject-out validates on the first half of the held-out subject and tests on its second half
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--seed', default=0, type=int, help='random seed')
+parser.add_argument('--data_dir', default='../data/Leon/Visual/size_30sec_150ts_stride_3ts/', help='folder to the data')
+parser.add_argument('--window_size', default=150, type=int, help='window size')
+parser.add_argument('--result_save_rootdir', default='./experiments/generic_models/LinearScreening/binary', help='folder to the result')
+parser.add_argument('--classification_task', default='binary', help='binary or four-class classification')
+parser.add_argument('--alpha_list', default=[0.01, 0.1, 1.0, 10.0, 100.0, 1000.0], type=float, nargs='+', help='ridge classifier regularization strengths')
+parser.add_argument('--shrinkage_list', default=[0.0, 0.01, 0.1, 0.3, 0.5, 0.9], type=float, nargs='+', help='shrinkage LDA shrinkages')
+parser.add_argument('--loso_subjects', default=[1, 13, 14, 15, 20, 21, 22, 23, 24, 25, 27, 28, 29, 31, 32, 34, 35, 36, 37, 38, 40, 42, 43, 44, 45, 46, 47, 48, 49, 5, 51, 52, 54, 55, 56, 57, 58, 60, 61, 62, 63, 64, 65, 68, 69, 7, 70, 71, 72, 73, 74, 75, 76, 78, 79, 80, 81, 82, 83, 84, 85, 86, 91, 92, 93, 94, 95, 97], type=int, nargs='+', help='subjects of the leave-one-subject-out folds, every pool is drawn from them')
+parser.add_argument('--features_cache', default='', help='npz of the featurized subjects, written on the first run, default: result_save_rootdir/featurized_subjects.npz')
+
+GENERIC_SCENARIOS = ['64vs4', '16vs4', '4vs4']
+NUM_BUCKETS = 17
+SUBGROUP_SETTINGS = ['random_partition1', 'random_partition2', 'random_partition3', 'random_partition4']
+
+
+def list_pools(loso_subjects):
+    '''
+    [(pool_type, pool_name, train_subjects, val_subjects, test_subjects)], subjects as strings; leave-one-subject-out pools have the
+    held-out subject as both val and test subject
+    '''
+
+    pools = []
+
+    for scenario in GENERIC_SCENARIOS:
+        for bucket_index in range(1, NUM_BUCKETS + 1):
+            setting = '{}_TestBucket{}'.format(scenario, bucket_index)
+            test_subjects, train_subjects, val_subjects = generic_GetTrainValTestSubjects(setting)
+            pools.append(('generic', setting, train_subjects, val_subjects, test_subjects))
+
+    for subgroup, subgroup_split_function in [('White', SubgroupAnalysisWhite_GetTrainValTestSubjects), ('Asian', SubgroupAnalysisAsian_GetTrainValTestSubjects)]:
+        for setting in SUBGROUP_SETTINGS:
+            train_subjects, val_subjects, test_subjects_URG, test_subjects_WHITE, test_subjects_ASIAN = subgroup_split_function(setting)
+            pools.append(('subgroup_{}'.format(subgroup), setting, train_subjects, val_subjects, test_subjects_URG + test_subjects_WHITE + test_subjects_ASIAN))
+
+    for subject in loso_subjects:
+        pools.append(('leave_one_subject_out', 'sub{}'.format(subject), None, [subject], [subject]))
+
+    return [(pool_type, pool_name, None if train_subjects is None else [str(i) for i in train_subjects], [str(i) for i in val_subjects], [str(i) for i in test_subjects]) for pool_type, pool_name, train_subjects, val_subjects, test_subjects in pools]
+
+
+def screen_pools(args_dict, loso_subjects):
+    #convert to string list
+    loso_subjects = [str(i) for i in loso_subjects]
+
+    #parse args:
+    result_save_rootdir = args_dict.result_save_rootdir
+    alpha_list = args_dict.alpha_list
+    shrinkage_list = args_dict.shrinkage_list
+
+    makedir_if_not_exist(result_save_rootdir)
+
+    pools = list_pools(loso_subjects)
+    subjects = set(loso_subjects)
+    for _, _, train_subjects, val_subjects, test_subjects in pools:
+        subjects.update(train_subjects or [])
+        subjects.update(val_subjects + test_subjects)
+    subjects = sorted(subjects, key=int)
+
+    feature_dict, label_dict = load_featurized_subjects(args_dict.data_dir, subjects, args_dict.classification_task, args_dict.window_size, args_dict.features_cache)
+
+    #first half (leave-one-subject-out validation) and second half (test) of every subject, as in the runners
+    half_feature_dict = dict()
+    half_label_dict = dict()
+    for subject in subjects:
+        half_sub_data_len = int(len(label_dict[subject])/2)
+        half_feature_dict[subject] = (feature_dict[subject][:half_sub_data_len], feature_dict[subject][half_sub_data_len:])
+        half_label_dict[subject] = (label_dict[subject][:half_sub_data_len], label_dict[subject][half_sub_data_len:])
+
+    statistics_start_time = time.time()
+    subject_statistics = SubjectStatistics.from_arrays(feature_dict, label_dict)
+    #leave-one-subject-out pools are taken within --loso_subjects only, not over every subject of the generic and subgroup pools
+    loso_statistics = subject_statistics.subset(loso_subjects)
+    statistics_time = time.time() - statistics_start_time
+
+    experiment_names = ['RidgeAlpha{}'.format(alpha) for alpha in alpha_list] + ['LDAShrinkage{}'.format(shrinkage) for shrinkage in shrinkage_list]
+    classes = subject_statistics.classes
+
+    def accuracies(weights, intercepts, features, labels):
+        #percent accuracy of every setting
+        return (predict_linear(weights, intercepts, classes, features) == labels).mean(1) * 100
+
+    #cross validation
+    start_time = time.time()
+
+    rows = []
+    for pool_type, pool_name, train_subjects, val_subjects, test_subjects in pools:
+        if pool_type == 'leave_one_subject_out':
+            pool_statistics = loso_statistics.leave_one_out(val_subjects[0])
+            val_feature_array, val_label_array = half_feature_dict[val_subjects[0]][0], half_label_dict[val_subjects[0]][0]
+
+        else:
+            pool_statistics = subject_statistics.pool(train_subjects)
+            val_feature_array = np.concatenate([feature_dict[subject] for subject in val_subjects])
+            val_label_array = np.concatenate([label_dict[subject] for subject in val_subjects])
+
+        ridge_weights, ridge_intercepts = solve_ridge(pool_statistics, alpha_list)
+        lda_weights, lda_intercepts = solve_shrinkage_lda(pool_statistics, shrinkage_list)
+        weights = np.concatenate([ridge_weights, lda_weights])
+        intercepts = np.concatenate([ridge_intercepts, lda_intercepts])
+
+        val_accuracies = accuracies(weights, intercepts, val_feature_array, val_label_array)
+
+        for test_subject in test_subjects:
+            test_accuracies = accuracies(weights, intercepts, half_feature_dict[test_subject][1], half_label_dict[test_subject][1])
+
+            for experiment_name, val_accuracy, test_accuracy in zip(experiment_names, val_accuracies, test_accuracies):
+                rows.append({'pool_type': pool_type, 'pool_name': pool_name, 'experiment_name': experiment_name, 'subject_id': test_subject, 'validation_accuracy': val_accuracy, 'test_accuracy': test_accuracy})
+
+    end_time = time.time()
+    total_time = end_time - start_time
+
+    print('{} subjects: sufficient statistics in {} seconds; {} pools x {} settings solved and evaluated in {} seconds'.format(len(subjects), round(statistics_time, 2), len(pools), len(experiment_names), round(total_time, 2)), flush=True)
+
+    with open(os.path.join(result_save_rootdir, 'screening_summary.csv'), mode='w') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=['pool_type', 'pool_name', 'experiment_name', 'subject_id', 'validation_accuracy', 'test_accuracy'])
+        writer.writeheader()
+        writer.writerows(rows)
+
+    write_program_time(result_save_rootdir, total_time)
+
+
+if __name__=='__main__':
+
+    #parse args
+    args = parser.parse_args()
+
+    seed = args.seed
+    data_dir = args.data_dir
+    window_size = args.window_size
+    result_save_rootdir = args.result_save_rootdir
+    classification_task = args.classification_task
+    alpha_list = args.alpha_list
+    shrinkage_list = args.shrinkage_list
+    loso_subjects = args.loso_subjects
+    features_cache = args.features_cache
+
+    if features_cache == '':
+        features_cache = os.path.join(result_save_rootdir, 'featurized_subjects.npz')
+
+    #sanity check
+    print('data_dir: {}, type: {}'.format(data_dir, type(data_dir)))
+    print('window_size: {}, type: {}'.format(window_size, type(window_size)))
+    print('result_save_rootdir: {}, type: {}'.format(result_save_rootdir, type(result_save_rootdir)))
+    print('classification_task: {}, type: {}'.format(classification_task, type(classification_task)))
+    print('alpha_list: {}, type: {}'.format(alpha_list, type(alpha_list)))
+    print('shrinkage_list: {}, type: {}'.format(shrinkage_list, type(shrinkage_list)))
+    print('loso_subjects: {}, type: {}'.format(loso_subjects, type(loso_subjects)))
+    print('features_cache: {}, type: {}'.format(features_cache, type(features_cache)))
+
+    args_dict = edict()
+    args_dict.data_dir = data_dir
+    args_dict.window_size = window_size
+    args_dict.result_save_rootdir = result_save_rootdir
+    args_dict.classification_task = classification_task
+    args_dict.alpha_list = alpha_list
+    args_dict.shrinkage_list = shrinkage_list
+    args_dict.features_cache = features_cache
+
+    seed_everything(seed)
+    screen_pools(args_dict, loso_subjects)
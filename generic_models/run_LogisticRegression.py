@@ -8,12 +8,13 @@ import time
 from easydict import EasyDict as edict
 from tqdm import trange
 from sklearn.model_selection import KFold
-from sklearn.linear_model import LogisticRegression
 
 YOUR_PATH = os.environ['YOUR_PATH']
 sys.path.insert(0, os.path.join(YOUR_PATH, 'fNIRS-mental-workload-classifiers/helpers'))
 import models
 import brain_data
+from model_bundles import featurizer_config, data_fingerprint, save_model_bundle
+from logistic_regression_path import fit_logistic_regression_path
 from utils import generic_GetTrainValTestSubjects, seed_everything, featurize, makedir_if_not_exist, plot_confusion_matrix, save_pickle, write_performance_info_FixedTrainValSplit, write_program_time
 
 parser = argparse.ArgumentParser()
@@ -84,11 +85,19 @@ def train_classifier(args_dict, train_subjects, val_subjects, test_subjects):
     transformed_group_model_sub_val_feature_array = featurize(group_model_sub_val_feature_array, classification_task)
 
     
+    #every fitted pipeline is saved as a model bundle (see model_bundles.py)
+    bundle_featurizer_config = featurizer_config(classification_task, window_size)
+    train_fingerprint = data_fingerprint(transformed_group_model_sub_train_feature_array, group_model_sub_train_label_array)
+
     #cross validation
     Cs = np.logspace(-5,5,11)
 
     start_time = time.time()
+
+    #the whole C grid as one warm-started regularization path
+    path_model_dict = fit_logistic_regression_path(transformed_group_model_sub_train_feature_array, group_model_sub_train_label_array, Cs, max_iter=10000)
     
+    classifier_bundle_paths = dict()
     for C in Cs:
         experiment_name = 'C{}'.format(C)
         
@@ -141,8 +150,8 @@ def train_classifier(args_dict, train_subjects, val_subjects, test_subjects):
             
 
             
-        #create Logistic Regression object
-        model = LogisticRegression(C=C, random_state=0, max_iter=10000, solver='lbfgs').fit(transformed_group_model_sub_train_feature_array, group_model_sub_train_label_array)
+        #Logistic Regression object of this C
+        model = path_model_dict[C]
 
         # val performance 
         val_accuracy = model.score(transformed_group_model_sub_val_feature_array, group_model_sub_val_label_array) * 100
@@ -164,6 +173,10 @@ def train_classifier(args_dict, train_subjects, val_subjects, test_subjects):
             
             #write performance to txt file
             write_performance_info_FixedTrainValSplit('NA', test_subjects_dict[test_subject]['result_save_subject_resultanalysisdir'], val_accuracy, test_accuracy)
+
+            #save the fitted pipeline: the generic model is written with the first test subject, the others refer to it (see model_bundles.py)
+            bundle_path = save_model_bundle(test_subjects_dict[test_subject]['result_save_subject_checkpointdir'], model, bundle_featurizer_config, train_fingerprint, classifier_bundle_path=classifier_bundle_paths.get(experiment_name))
+            classifier_bundle_paths.setdefault(experiment_name, bundle_path)
         
     end_time = time.time()
     total_time = end_time - start_time
@@ -0,0 +1,257 @@
+import os
+import sys
+import numpy as np
+import argparse
+
+import time
+
+from easydict import EasyDict as edict
+
+YOUR_PATH = os.environ['YOUR_PATH']
+sys.path.insert(0, os.path.join(YOUR_PATH, 'fNIRS-mental-workload-classifiers/helpers'))
+from featurized_subjects import load_featurized_subjects
+from model_bundles import featurizer_config, data_fingerprint, save_model_bundle
+from logistic_regression_path import fit_logistic_regression_path
+from random_forest_grid import random_forest_hyper_settings, run_random_forest_grid, accuracy_from_probabilities
+from utils import generic_GetTrainValTestSubjects, seed_everything, makedir_if_not_exist, plot_confusion_matrix, save_pickle, write_performance_info_FixedTrainValSplit, write_program_time
+
+#the buckets of a generic scenario in one process, for the Logistic Regression and Random Forest runners: every subject of the scenario
+#is loaded and featurized once (see featurized_subjects.py), each bucket's train and val sets are index slices of the featurized
+#subjects (in the order of the bucket's subject lists, as run_LogisticRegression.py/run_RandomForest.py concatenate them), and the
+#results are written to result_save_rootdir/TestBucket{}/ exactly as the single-bucket runners do
+#
+#Logistic Regression: each C of a bucket's path starts from the previous C's coefficients or from the same C's coefficients of the
+#already fitted bucket that shares the most train subjects, whichever has the lower objective (see logistic_regression_path.py).
+#Random Forest: the forests cannot be reused across train sets, the grid is refitted per bucket with the global seed reset, so each
+#bucket gets the forests of its own run_RandomForest.py job
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--seed', default=0, type=int, help='random seed')
+parser.add_argument('--data_dir', default='../data/Leon/Visual/size_30sec_150ts_stride_3ts/', help='folder to the train data')
+parser.add_argument('--window_size', default=150, type=int, help='window size')
+parser.add_argument('--result_save_rootdir', default='./experiments/generic_models/LogisticRegression/binary/64vs4', help='folder to the results of the scenario, one TestBucket subfolder per bucket')
+parser.add_argument('--classification_task', default='binary', help='binary or four-class classification')
+parser.add_argument('--model_name', default='LogisticRegression', help='LogisticRegression or RandomForest')
+parser.add_argument('--scenario', default='64vs4', help='64vs4, 16vs4 or 4vs4')
+parser.add_argument('--buckets', default=list(range(1, 18)), type=int, nargs='+', help='TestBuckets to run, in this order')
+parser.add_argument('--features_cache', default='', help='npz of the featurized subjects, reused and extended by later runs, empty: no cache')
+parser.add_argument('--num_workers', default=0, type=int, help='forests fitted in parallel, 0: one per hyper setting up to the cpu budget')
+parser.add_argument('--cpu_budget', default=0, type=int, help='cpus shared by the parallel forests, 0: all cpus')
+
+
+def save_bucket_results(result_save_rootdir, test_subject, experiment_name, val_accuracy, test_accuracy, test_logits, sub_test_label_array, confusion_matrix_figure_labels, model, bundle_featurizer_config, train_fingerprint, classifier_bundle_paths):
+    #derived args
+    result_save_subjectdir = os.path.join(result_save_rootdir, test_subject, experiment_name)
+    result_save_subject_checkpointdir = os.path.join(result_save_subjectdir, 'checkpoint')
+    result_save_subject_predictionsdir = os.path.join(result_save_subjectdir, 'predictions')
+    result_save_subject_resultanalysisdir = os.path.join(result_save_subjectdir, 'result_analysis')
+    result_save_subject_trainingcurvedir = os.path.join(result_save_subjectdir, 'trainingcurve')
+
+    makedir_if_not_exist(result_save_subjectdir)
+    makedir_if_not_exist(result_save_subject_checkpointdir)
+    makedir_if_not_exist(result_save_subject_predictionsdir)
+    makedir_if_not_exist(result_save_subject_resultanalysisdir)
+    makedir_if_not_exist(result_save_subject_trainingcurvedir)
+
+    result_save_dict = dict()
+    result_save_dict['bestepoch_val_accuracy'] = val_accuracy
+    result_save_dict['bestepoch_test_accuracy'] = test_accuracy
+    result_save_dict['bestepoch_test_logits'] = test_logits
+    result_save_dict['bestepoch_test_class_labels'] = sub_test_label_array
+
+    plot_confusion_matrix(test_logits.argmax(1), sub_test_label_array, confusion_matrix_figure_labels, result_save_subject_resultanalysisdir, 'test_confusion_matrix.png')
+
+    save_pickle(result_save_subject_predictionsdir, 'result_save_dict.pkl', result_save_dict)
+
+    #write performance to txt file
+    write_performance_info_FixedTrainValSplit('NA', result_save_subject_resultanalysisdir, val_accuracy, test_accuracy)
+
+    #save the fitted pipeline: the bucket's generic model is written with its first test subject, the others refer to it (see model_bundles.py)
+    bundle_path = save_model_bundle(result_save_subject_checkpointdir, model, bundle_featurizer_config, train_fingerprint, classifier_bundle_path=classifier_bundle_paths.get(experiment_name))
+    classifier_bundle_paths.setdefault(experiment_name, bundle_path)
+
+
+def train_buckets(args_dict, settings):
+
+    #parse args:
+    seed = args_dict.seed
+    data_dir = args_dict.data_dir
+    window_size = args_dict.window_size
+    result_save_rootdir = args_dict.result_save_rootdir
+    classification_task = args_dict.classification_task
+    model_name = args_dict.model_name
+    features_cache = args_dict.features_cache
+
+    if model_name not in ['LogisticRegression', 'RandomForest']:
+        raise NameError('not supported model type')
+
+    #same tasks as the single-bucket runners: run_RandomForest.py supports four-class, run_LogisticRegression.py is binary only
+    if classification_task == 'binary':
+        confusion_matrix_figure_labels = ['0back', '2back']
+
+    elif classification_task == 'four_class' and model_name == 'RandomForest':
+        confusion_matrix_figure_labels = ['0back', '1back', '2back', '3back']
+
+    else:
+        raise NameError('not supported classification type for {}'.format(model_name))
+
+    #train, val, test subjects of every bucket, as string lists
+    split_dict = dict()
+    for setting in settings:
+        test_subjects, train_subjects, val_subjects = generic_GetTrainValTestSubjects(setting)
+        split_dict[setting] = ([str(i) for i in train_subjects], [str(i) for i in val_subjects], [str(i) for i in test_subjects])
+
+    subjects = sorted(set(subject for setting in settings for subject_list in split_dict[setting] for subject in subject_list), key=int)
+
+    #load and featurize every subject once
+    loading_start_time = time.time()
+    feature_dict, label_dict = load_featurized_subjects(data_dir, subjects, classification_task, window_size, features_cache)
+    loading_time = time.time() - loading_start_time
+
+    #all the featurized chunks in one array, a bucket's sets are index slices of it
+    all_feature_array = np.concatenate([feature_dict[subject] for subject in subjects])
+    all_label_array = np.concatenate([label_dict[subject] for subject in subjects])
+    subject_offsets = np.cumsum([0] + [len(label_dict[subject]) for subject in subjects])
+    subject_index_dict = {subject: np.arange(subject_offsets[i], subject_offsets[i + 1]) for i, subject in enumerate(subjects)}
+    del feature_dict
+
+    def subject_indices(subject_list):
+        return np.concatenate([subject_index_dict[subject] for subject in subject_list])
+
+    bundle_featurizer_config = featurizer_config(classification_task, window_size)
+    Cs = np.logspace(-5,5,11)
+
+    path_model_dicts = dict()
+    bucket_times = []
+    for setting in settings:
+        train_subjects, val_subjects, test_subjects = split_dict[setting]
+        result_save_bucketdir = os.path.join(result_save_rootdir, setting.split('_')[-1])
+        makedir_if_not_exist(result_save_bucketdir)
+
+        #the single-bucket runners are seeded once per job
+        seed_everything(seed)
+
+        start_time = time.time()
+
+        train_indices = subject_indices(train_subjects)
+        transformed_group_model_sub_train_feature_array = all_feature_array[train_indices]
+        group_model_sub_train_label_array = all_label_array[train_indices]
+
+        val_indices = subject_indices(val_subjects)
+        transformed_group_model_sub_val_feature_array = all_feature_array[val_indices]
+        group_model_sub_val_label_array = all_label_array[val_indices]
+
+        #second half of each test subject
+        test_subjects_dict = dict()
+        for test_subject in test_subjects:
+            sub_indices = subject_index_dict[test_subject]
+            half_sub_data_len = int(len(sub_indices)/2)
+
+            test_subjects_dict[test_subject] = dict()
+            test_subjects_dict[test_subject]['transformed_sub_test_feature_array'] = all_feature_array[sub_indices[half_sub_data_len:]]
+            test_subjects_dict[test_subject]['sub_test_label_array'] = all_label_array[sub_indices[half_sub_data_len:]]
+
+        train_fingerprint = data_fingerprint(transformed_group_model_sub_train_feature_array, group_model_sub_train_label_array)
+        classifier_bundle_paths = dict()
+
+        if model_name == 'LogisticRegression':
+            #warm start from the fitted bucket with the largest train subject overlap
+            init_setting = max(path_model_dicts.keys(), key=lambda fitted_setting: len(set(train_subjects) & set(split_dict[fitted_setting][0])), default=None)
+            if init_setting is not None:
+                print('{}: warm start from {}'.format(setting, init_setting), flush=True)
+
+            path_model_dict = fit_logistic_regression_path(transformed_group_model_sub_train_feature_array, group_model_sub_train_label_array, Cs, max_iter=10000, init_model_dict=None if init_setting is None else path_model_dicts[init_setting])
+            path_model_dicts[setting] = path_model_dict
+
+            for C in Cs:
+                experiment_name = 'C{}'.format(C)
+                model = path_model_dict[C]
+
+                # val performance
+                val_accuracy = model.score(transformed_group_model_sub_val_feature_array, group_model_sub_val_label_array) * 100
+
+                # test performance
+                for test_subject in test_subjects:
+                    sub_test_label_array = test_subjects_dict[test_subject]['sub_test_label_array']
+                    test_logits = model.predict_proba(test_subjects_dict[test_subject]['transformed_sub_test_feature_array'])
+                    test_accuracy = accuracy_from_probabilities(model.classes_, test_logits, sub_test_label_array)
+
+                    save_bucket_results(result_save_bucketdir, test_subject, experiment_name, val_accuracy, test_accuracy, test_logits, sub_test_label_array, confusion_matrix_figure_labels, model, bundle_featurizer_config, train_fingerprint, classifier_bundle_paths)
+
+        else:
+            eval_features_dict = {'val': transformed_group_model_sub_val_feature_array}
+            for test_subject in test_subjects:
+                eval_features_dict[test_subject] = test_subjects_dict[test_subject]['transformed_sub_test_feature_array']
+
+            grid_results = run_random_forest_grid(transformed_group_model_sub_train_feature_array, group_model_sub_train_label_array, eval_features_dict, random_forest_hyper_settings(), num_workers=args_dict.num_workers, cpu_budget=args_dict.cpu_budget, return_models=True)
+
+            for experiment_name, _ in random_forest_hyper_settings():
+                classes = grid_results[experiment_name]['classes']
+                probabilities_dict = grid_results[experiment_name]['probabilities']
+
+                # val performance
+                val_accuracy = accuracy_from_probabilities(classes, probabilities_dict['val'], group_model_sub_val_label_array)
+
+                # test performance
+                for test_subject in test_subjects:
+                    sub_test_label_array = test_subjects_dict[test_subject]['sub_test_label_array']
+                    test_logits = probabilities_dict[test_subject]
+                    test_accuracy = accuracy_from_probabilities(classes, test_logits, sub_test_label_array)
+
+                    save_bucket_results(result_save_bucketdir, test_subject, experiment_name, val_accuracy, test_accuracy, test_logits, sub_test_label_array, confusion_matrix_figure_labels, grid_results[experiment_name]['model'], bundle_featurizer_config, train_fingerprint, classifier_bundle_paths)
+
+        end_time = time.time()
+        total_time = end_time - start_time
+        write_program_time(result_save_bucketdir, total_time)
+        bucket_times.append(total_time)
+
+        print('{}: {} seconds'.format(setting, round(total_time, 2)), flush=True)
+
+    #loading and featurizing once, then all the buckets
+    write_program_time(result_save_rootdir, loading_time + sum(bucket_times))
+    print('{} subjects loaded and featurized in {} seconds, {} buckets in {} seconds'.format(len(subjects), round(loading_time, 2), len(settings), round(sum(bucket_times), 2)), flush=True)
+
+
+if __name__=='__main__':
+
+    #parse args
+    args = parser.parse_args()
+
+    seed = args.seed
+    data_dir = args.data_dir
+    window_size = args.window_size
+    result_save_rootdir = args.result_save_rootdir
+    classification_task = args.classification_task
+    model_name = args.model_name
+    scenario = args.scenario
+    buckets = args.buckets
+    features_cache = args.features_cache
+    num_workers = args.num_workers
+    cpu_budget = args.cpu_budget
+
+    settings = ['{}_TestBucket{}'.format(scenario, bucket) for bucket in buckets]
+
+    #sanity check
+    print('data_dir: {}, type: {}'.format(data_dir, type(data_dir)))
+    print('window_size: {}, type: {}'.format(window_size, type(window_size)))
+    print('result_save_rootdir: {}, type: {}'.format(result_save_rootdir, type(result_save_rootdir)))
+    print('classification_task: {}, type: {}'.format(classification_task, type(classification_task)))
+    print('model_name: {}, type: {}'.format(model_name, type(model_name)))
+    print('settings: {}, type: {}'.format(settings, type(settings)))
+    print('features_cache: {}, type: {}'.format(features_cache, type(features_cache)))
+    print('num_workers: {} type: {}'.format(num_workers, type(num_workers)))
+    print('cpu_budget: {} type: {}'.format(cpu_budget, type(cpu_budget)))
+
+    args_dict = edict()
+    args_dict.seed = seed
+    args_dict.data_dir = data_dir
+    args_dict.window_size = window_size
+    args_dict.result_save_rootdir = result_save_rootdir
+    args_dict.classification_task = classification_task
+    args_dict.model_name = model_name
+    args_dict.features_cache = features_cache
+    args_dict.num_workers = num_workers
+    args_dict.cpu_budget = cpu_budget
+
+    seed_everything(seed)
+    train_buckets(args_dict, settings)
@@ -0,0 +1,431 @@
+import os
+import sys
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import argparse
+
+from easydict import EasyDict as edict
+
+YOUR_PATH = os.environ['YOUR_PATH']
+sys.path.insert(0, os.path.join(YOUR_PATH, 'fNIRS-mental-workload-classifiers/helpers'))
+import models
+import brain_data
+from utils import generic_GetTrainValTestSubjects, seed_everything, makedir_if_not_exist, plot_confusion_matrix, save_pickle, train_one_epoch, eval_model, save_training_curves_FixedTrainValSplit, write_performance_info_FixedTrainValSplit, write_program_time
+
+#same generic training as run_EEGNet.py/run_DeepConvNet.py for all the buckets of a scenario in one job: every subject csv is parsed
+#once into one data pool (instead of once per bucket launch), each bucket's train/val/test sets are index slices of the pool taken from
+#generic_GetTrainValTestSubjects, and every (bucket, hyper setting) is trained by a worker process on the gpus (cpu if there is none).
+#The pool is shared with the workers through shared memory, each worker owns one device, and as many workers run per device as the
+#estimated memory of one full-batch training allows. The results are written to result_save_rootdir/TestBucket{}/ as the single-bucket
+#launches do
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--seed', default=0, type=int, help="random seed")
+parser.add_argument('--model_name', default='EEGNet', help='EEGNet or DeepConvNet')
+parser.add_argument('--data_dir', default='../data/Leon/Visual/size_30sec_150ts_stride_3ts/', help="folder to the dataset")
+parser.add_argument('--window_size', default=150, type=int, help='window size')
+parser.add_argument('--result_save_rootdir', default='./experiments/generic_models/EEGNet/binary/64vs4', help="folder to the results of the scenario, one TestBucket subfolder per bucket")
+parser.add_argument('--classification_task', default='binary', help='binary or four-class classification')
+parser.add_argument('--n_epoch', default=100, type=int, help="number of epoch")
+parser.add_argument('--scenario', default='64vs4', help='64vs4, 16vs4 or 4vs4')
+parser.add_argument('--buckets', default=list(range(1, 18)), type=int, nargs='+', help='TestBuckets to run')
+parser.add_argument('--num_workers', default=0, type=int, help='number of training processes, 0: as many as fit in --memory_fraction of the devices\' memory')
+parser.add_argument('--memory_fraction', default=0.8, type=float, help='fraction of each device\'s memory (gpu, or the host memory without gpu) the concurrent trainings may use')
+parser.add_argument('--cpu_budget', default=0, type=int, help='total number of cpu threads used by all workers, 0: all cpus')
+
+#memory of a full-batch training step per sample, relative to the model's activations (the activations and their gradients, plus
+#workspace), measured on cpu at about 2.1x for EEGNet150 and 1.3x for DeepConvNet150. Besides its trainings, every worker process
+#holds WORKER_PROCESS_BYTES of host memory (interpreter, torch) and, on a gpu, a cuda context of about CUDA_CONTEXT_BYTES
+ACTIVATION_MEMORY_FACTOR = 2.5
+WORKER_PROCESS_BYTES = 512 * 2**20
+CUDA_CONTEXT_BYTES = 512 * 2**20
+
+#set in each worker by init_worker
+worker_state = dict()
+
+
+def init_worker(data_pool, device_queue, num_threads_per_worker):
+    torch.set_num_threads(num_threads_per_worker)
+
+    #the pool's tensors are in shared memory, seen here as numpy arrays without a copy
+    feature_tensor, label_tensor, subject_index_dict = data_pool
+    worker_state['data_pool'] = (feature_tensor.numpy(), label_tensor.numpy(), subject_index_dict)
+
+    #the device this worker trains on for all its tasks
+    worker_state['device'] = torch.device(device_queue.get())
+
+
+def training_memory(model_to_use, num_samples, window_size, feature_size=8):
+    '''
+    estimated memory of one full-batch training on num_samples samples, as (device bytes, host bytes):
+        device: the model's activations (summed module outputs of a train-mode forward) times ACTIVATION_MEMORY_FACTOR, and the samples
+        host: the worker process and its copy of the samples gathered from the pool
+    on cpu both are host memory
+    '''
+
+    model = model_to_use()
+    model.train()
+
+    activation_bytes = [0]
+    def hook(module, inputs, output):
+        activation_bytes[0] += output.numel() * output.element_size()
+
+    hooks = [module.register_forward_hook(hook) for module in model.modules() if len(list(module.children())) == 0]
+    with torch.no_grad():
+        model(torch.zeros(2, window_size, feature_size))
+    for handle in hooks:
+        handle.remove()
+
+    sample_bytes = window_size * feature_size * 4
+
+    return num_samples * (ACTIVATION_MEMORY_FACTOR * activation_bytes[0] / 2 + sample_bytes), WORKER_PROCESS_BYTES + num_samples * sample_bytes
+
+
+def available_host_memory():
+    #MemAvailable counts the page cache that can be reclaimed, SC_AVPHYS_PAGES only the free pages
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_AVPHYS_PAGES')
+
+
+def device_slots(device_bytes, host_bytes, memory_fraction, num_tasks, num_workers=0):
+    '''
+    one device name per worker: the gpus (round robin), each taking as many workers as fit in memory_fraction of its memory, or the cpu.
+    The workers also have to fit in memory_fraction of the available host memory. num_workers > 0 overrides the count
+    '''
+
+    host_memory = memory_fraction * available_host_memory()
+
+    if torch.cuda.is_available():
+        devices = ['cuda:{}'.format(device_index) for device_index in range(torch.cuda.device_count())]
+        max_device_workers = sum(int(memory_fraction * torch.cuda.get_device_properties(device_index).total_memory // (device_bytes + CUDA_CONTEXT_BYTES)) for device_index in range(len(devices)))
+        max_workers = min(max_device_workers, int(host_memory // host_bytes))
+
+    else:
+        devices = ['cpu']
+        max_workers = int(host_memory // (device_bytes + host_bytes))
+
+    if num_workers <= 0:
+        num_workers = min(num_tasks, max(1, max_workers))
+
+    #round robin over the devices, so the workers are spread evenly
+    return [devices[worker_index % len(devices)] for worker_index in range(num_workers)]
+
+
+def train_one_setting(task):
+    '''
+    train the generic model of one bucket with one hyper setting, saving the same outputs as run_EEGNet.py/run_DeepConvNet.py
+    '''
+
+    args_dict, setting, lr, dropout = task
+
+    #parse args:
+    seed = args_dict.seed
+    model_name = args_dict.model_name
+    result_save_rootdir = args_dict.result_save_rootdir
+    classification_task = args_dict.classification_task
+    n_epoch = args_dict.n_epoch
+
+    start_time = time.time()
+
+    #seed every task, so the result does not depend on which worker runs it or in which order
+    seed_everything(seed)
+
+    if model_name == 'EEGNet':
+        model_to_use = models.EEGNet150
+
+    elif model_name == 'DeepConvNet':
+        model_to_use = models.DeepConvNet150
+
+    else:
+        raise NameError('not supported model_name')
+
+    if classification_task == 'binary':
+        confusion_matrix_figure_labels = ['0back', '2back']
+
+    else:
+        raise NameError('not supported classification type')
+
+    device = worker_state['device']
+
+    feature_array, label_array, subject_index_dict = worker_state['data_pool']
+
+    def subject_indices(subject_list):
+        return np.concatenate([subject_index_dict[subject] for subject in subject_list])
+
+    #this bucket's sets, gathered from the pool in the order of its subject lists
+    test_subjects, train_subjects, val_subjects = generic_GetTrainValTestSubjects(setting)
+    train_subjects = [str(i) for i in train_subjects]
+    val_subjects = [str(i) for i in val_subjects]
+    test_subjects = [str(i) for i in test_subjects]
+
+    train_indices = subject_indices(train_subjects)
+    val_indices = subject_indices(val_subjects)
+
+    #dataset object
+    group_train_set = brain_data.brain_dataset(feature_array[train_indices], label_array[train_indices])
+    group_val_set = brain_data.brain_dataset(feature_array[val_indices], label_array[val_indices])
+
+    #dataloader object
+    cv_train_batch_size = len(group_train_set)
+    cv_val_batch_size = len(group_val_set)
+    group_train_loader = torch.utils.data.DataLoader(group_train_set, batch_size=cv_train_batch_size, shuffle=True)
+    group_val_loader = torch.utils.data.DataLoader(group_val_set, batch_size=cv_val_batch_size, shuffle=False)
+
+    experiment_name = 'lr{}_dropout{}'.format(lr, dropout)#experiment name: used for indicating hyper setting
+    result_save_bucketdir = os.path.join(result_save_rootdir, setting.split('_')[-1])
+
+    #create test subjects dict
+    test_subjects_dict = dict()
+    for test_subject in test_subjects:
+        #second half of the test subject's data is its test set
+        sub_indices = subject_index_dict[test_subject]
+        half_sub_data_len = int(len(sub_indices)/2)
+        sub_test_indices = sub_indices[half_sub_data_len:]
+
+        #convert subject's test data into dataset object
+        sub_test_set = brain_data.brain_dataset(feature_array[sub_test_indices], label_array[sub_test_indices])
+
+        #convert subject's test dataset object into dataloader object
+        test_batch_size = len(sub_test_set)
+        sub_test_loader = torch.utils.data.DataLoader(sub_test_set, batch_size=test_batch_size, shuffle=False)
+
+        #derived arg
+        result_save_subjectdir = os.path.join(result_save_bucketdir, test_subject, experiment_name)
+        result_save_subject_checkpointdir = os.path.join(result_save_subjectdir, 'checkpoint')
+        result_save_subject_predictionsdir = os.path.join(result_save_subjectdir, 'predictions')
+        result_save_subject_resultanalysisdir = os.path.join(result_save_subjectdir, 'result_analysis')
+        result_save_subject_trainingcurvedir = os.path.join(result_save_subjectdir, 'trainingcurve')
+
+        makedir_if_not_exist(result_save_subjectdir)
+        makedir_if_not_exist(result_save_subject_checkpointdir)
+        makedir_if_not_exist(result_save_subject_predictionsdir)
+        makedir_if_not_exist(result_save_subject_resultanalysisdir)
+        makedir_if_not_exist(result_save_subject_trainingcurvedir)
+
+        test_subjects_dict[test_subject] = dict()
+        test_subjects_dict[test_subject]['sub_test_loader'] = sub_test_loader
+        test_subjects_dict[test_subject]['result_save_subject_checkpointdir'] = result_save_subject_checkpointdir
+        test_subjects_dict[test_subject]['result_save_subject_predictionsdir'] = result_save_subject_predictionsdir
+        test_subjects_dict[test_subject]['result_save_subject_resultanalysisdir'] = result_save_subject_resultanalysisdir
+        test_subjects_dict[test_subject]['result_save_subject_trainingcurvedir'] = result_save_subject_trainingcurvedir
+        test_subjects_dict[test_subject]['result_save_dict'] = dict()
+
+    #create model
+    model = model_to_use(dropout=dropout).to(device)
+
+    #create criterion and optimizer
+    criterion = nn.NLLLoss() #for EEGNet and DeepConvNet, use nn.NLLLoss directly, which accept integer labels
+    optimizer = torch.optim.Adam(model.parameters(), lr=lr) #the authors used Adam instead of SGD
+
+    #training loop
+    best_val_accuracy = 0.0
+
+    epoch_train_loss = []
+    epoch_train_accuracy = []
+    epoch_validation_accuracy = []
+
+    for epoch in range(n_epoch):
+        average_loss_this_epoch = train_one_epoch(model, optimizer, criterion, group_train_loader, device)
+        val_accuracy, _, _, _ = eval_model(model, group_val_loader, device)
+        train_accuracy, _, _ , _ = eval_model(model, group_train_loader, device)
+
+        epoch_train_loss.append(average_loss_this_epoch)
+        epoch_train_accuracy.append(train_accuracy)
+        epoch_validation_accuracy.append(val_accuracy)
+
+        #update is_best flag
+        is_best = val_accuracy >= best_val_accuracy
+
+        if is_best:
+            best_val_accuracy = val_accuracy
+
+            for test_subject in test_subjects:
+                torch.save(model.state_dict(), os.path.join(test_subjects_dict[test_subject]['result_save_subject_checkpointdir'], 'best_model.statedict'))
+
+                test_accuracy, test_class_predictions, test_class_labels, test_logits = eval_model(model, test_subjects_dict[test_subject]['sub_test_loader'], device)
+
+                test_subjects_dict[test_subject]['result_save_dict']['bestepoch_test_accuracy'] = test_accuracy
+                test_subjects_dict[test_subject]['result_save_dict']['bestepoch_val_accuracy'] = val_accuracy
+                test_subjects_dict[test_subject]['result_save_dict']['bestepoch_test_logits'] = test_logits.copy()
+                test_subjects_dict[test_subject]['result_save_dict']['bestepoch_test_class_predictions'] = test_class_predictions.copy()
+                test_subjects_dict[test_subject]['result_save_dict']['bestepoch_test_class_labels'] = test_class_labels.copy()
+
+    for test_subject in test_subjects:
+
+        #save training curve for each fold
+        save_training_curves_FixedTrainValSplit('training_curve.png', test_subjects_dict[test_subject]['result_save_subject_trainingcurvedir'], epoch_train_loss, epoch_train_accuracy, epoch_validation_accuracy)
+
+        #confusion matrix
+        plot_confusion_matrix(test_subjects_dict[test_subject]['result_save_dict']['bestepoch_test_class_predictions'], test_subjects_dict[test_subject]['result_save_dict']['bestepoch_test_class_labels'], confusion_matrix_figure_labels, test_subjects_dict[test_subject]['result_save_subject_resultanalysisdir'], 'test_confusion_matrix.png')
+
+        #save the model at last epoch
+        torch.save(model.state_dict(), os.path.join(test_subjects_dict[test_subject]['result_save_subject_checkpointdir'], 'last_model.statedict'))
+
+        #save result_save_dict
+        save_pickle(test_subjects_dict[test_subject]['result_save_subject_predictionsdir'], 'result_save_dict.pkl', test_subjects_dict[test_subject]['result_save_dict'])
+
+        #write performance to txt file
+        write_performance_info_FixedTrainValSplit(model.state_dict(), test_subjects_dict[test_subject]['result_save_subject_resultanalysisdir'], test_subjects_dict[test_subject]['result_save_dict']['bestepoch_val_accuracy'], test_subjects_dict[test_subject]['result_save_dict']['bestepoch_test_accuracy'])
+
+    program_time = time.time() - start_time
+
+    return setting, experiment_name, str(device), best_val_accuracy, program_time
+
+
+def train_buckets(args_dict, settings):
+
+    #parse args:
+    model_name = args_dict.model_name
+    data_dir = args_dict.data_dir
+    window_size = args_dict.window_size
+    result_save_rootdir = args_dict.result_save_rootdir
+    classification_task = args_dict.classification_task
+    num_workers = args_dict.num_workers
+    memory_fraction = args_dict.memory_fraction
+    cpu_budget = args_dict.cpu_budget
+
+    num_chunk_this_window_size = 1488
+
+    if model_name == 'EEGNet':
+        model_to_use = models.EEGNet150
+
+    elif model_name == 'DeepConvNet':
+        model_to_use = models.DeepConvNet150
+
+    else:
+        raise NameError('not supported model_name')
+
+    if classification_task == 'binary':
+        data_loading_function = brain_data.read_subject_csv_binary
+
+    else:
+        raise NameError('not supported classification type')
+
+    #same hyper grid as run_EEGNet.py/run_DeepConvNet.py
+    lrs = [0.001, 0.01, 0.1, 1.0, 10.0]
+    dropouts = [0.25, 0.5, 0.75]
+
+    start_time = time.time()
+
+    #every subject of the buckets, parsed once
+    subjects = set()
+    for setting in settings:
+        for subject_list in generic_GetTrainValTestSubjects(setting):
+            subjects.update(str(i) for i in subject_list)
+    subjects = sorted(subjects, key=int)
+
+    sub_feature_list = []
+    sub_label_list = []
+    for subject in subjects:
+        sub_feature, sub_label = data_loading_function(os.path.join(data_dir, 'sub_{}.csv'.format(subject)), num_chunk_this_window_size=num_chunk_this_window_size)
+
+        #sainty check for this subject's data
+        assert len(sub_label) == int(num_chunk_this_window_size/2), 'subject {} len is not {} for binary classification'.format(subject, int(num_chunk_this_window_size/2))
+
+        sub_feature_list.append(sub_feature)
+        sub_label_list.append(sub_label)
+
+    #the data pool: all the chunks in one array, with each subject's rows, in shared memory for the workers
+    feature_tensor = torch.from_numpy(np.concatenate(sub_feature_list, axis=0).astype(np.float32)).share_memory_()
+    label_tensor = torch.from_numpy(np.concatenate(sub_label_list, axis=0)).share_memory_()
+    subject_offsets = np.cumsum([0] + [len(sub_label) for sub_label in sub_label_list])
+    subject_index_dict = {subject: np.arange(subject_offsets[i], subject_offsets[i + 1]) for i, subject in enumerate(subjects)}
+    del sub_feature_list
+
+    print('{} subjects loaded in {} seconds'.format(len(subjects), round(time.time() - start_time, 2)), flush=True)
+
+    tasks = [(args_dict, setting, lr, dropout) for setting in settings for lr in lrs for dropout in dropouts]
+
+    #memory of the largest training of the scenario: full-batch steps on its train set and full-batch evaluation of its val set
+    max_training_samples = 0
+    for setting in settings:
+        _, train_subjects, val_subjects = generic_GetTrainValTestSubjects(setting)
+        max_training_samples = max(max_training_samples, sum(len(subject_index_dict[str(subject)]) for subject in list(train_subjects) + list(val_subjects)))
+    device_bytes, host_bytes = training_memory(model_to_use, max_training_samples, window_size)
+
+    #one device per worker, bounded by memory
+    worker_devices = device_slots(device_bytes, host_bytes, memory_fraction, len(tasks), num_workers)
+    num_workers = len(worker_devices)
+
+    #thread budget: the workers share the cpus instead of each one starting a thread per cpu
+    if cpu_budget <= 0:
+        cpu_budget = os.cpu_count()
+    num_threads_per_worker = max(1, cpu_budget // num_workers)
+    print('{} training tasks on {} workers x {} threads ({}), estimated {} GB device + {} GB host memory per worker'.format(len(tasks), num_workers, num_threads_per_worker, ', '.join(sorted(set(worker_devices))), round(device_bytes / 2**30, 2), round(host_bytes / 2**30, 2)), flush=True)
+
+    #spawn: cuda can not be used in forked workers. The pool's tensors are passed by their shared memory, not copied
+    context = torch.multiprocessing.get_context('spawn')
+    device_queue = context.Queue()
+    for device in worker_devices:
+        device_queue.put(device)
+
+    #a worker killed (e.g. out of memory) fails the job with BrokenProcessPool instead of leaving it waiting for its task
+    with ProcessPoolExecutor(num_workers, mp_context=context, initializer=init_worker, initargs=((feature_tensor, label_tensor, subject_index_dict), device_queue, num_threads_per_worker)) as executor:
+        for future in as_completed([executor.submit(train_one_setting, task) for task in tasks]):
+            setting, experiment_name, device, best_val_accuracy, program_time = future.result()
+            print('{} {} on {}: best val accuracy {} ({} seconds)'.format(setting, experiment_name, device, best_val_accuracy, round(program_time, 2)), flush=True)
+
+    #write the time of the whole scenario to txt file
+    makedir_if_not_exist(result_save_rootdir)
+    write_program_time(result_save_rootdir, time.time() - start_time)
+
+
+
+if __name__=='__main__':
+
+    #parse args
+    args = parser.parse_args()
+
+    seed = args.seed
+    model_name = args.model_name
+    data_dir = args.data_dir
+    window_size = args.window_size
+    result_save_rootdir = args.result_save_rootdir
+    classification_task = args.classification_task
+    n_epoch = args.n_epoch
+    scenario = args.scenario
+    buckets = args.buckets
+    num_workers = args.num_workers
+    memory_fraction = args.memory_fraction
+    cpu_budget = args.cpu_budget
+
+    settings = ['{}_TestBucket{}'.format(scenario, bucket) for bucket in buckets]
+
+    #sanity check:
+    print('model_name: {}, type: {}'.format(model_name, type(model_name)))
+    print('data_dir: {}, type: {}'.format(data_dir, type(data_dir)))
+    print('window_size: {}, type: {}'.format(window_size, type(window_size)))
+    print('result_save_rootdir: {}, type: {}'.format(result_save_rootdir, type(result_save_rootdir)))
+    print('classification_task: {}, type: {}'.format(classification_task, type(classification_task)))
+    print('n_epoch: {} type: {}'.format(n_epoch, type(n_epoch)))
+    print('settings: {} type: {}'.format(settings, type(settings)))
+    print('num_workers: {} type: {}'.format(num_workers, type(num_workers)))
+    print('memory_fraction: {} type: {}'.format(memory_fraction, type(memory_fraction)))
+    print('cpu_budget: {} type: {}'.format(cpu_budget, type(cpu_budget)))
+
+    args_dict = edict()
+
+    args_dict.seed = seed
+    args_dict.model_name = model_name
+    args_dict.data_dir = data_dir
+    args_dict.window_size = window_size
+    args_dict.result_save_rootdir = result_save_rootdir
+    args_dict.classification_task = classification_task
+    args_dict.n_epoch = n_epoch
+    args_dict.num_workers = num_workers
+    args_dict.memory_fraction = memory_fraction
+    args_dict.cpu_budget = cpu_budget
+
+    train_buckets(args_dict, settings)
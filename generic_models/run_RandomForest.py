@@ -8,12 +8,13 @@ import time
 from easydict import EasyDict as edict
 from tqdm import trange
 from sklearn.model_selection import KFold
-from sklearn.ensemble import RandomForestClassifier as rfc
 
 YOUR_PATH = os.environ['YOUR_PATH']
 sys.path.insert(0, os.path.join(YOUR_PATH, 'fNIRS-mental-workload-classifiers/helpers'))
 import models
 import brain_data
+from model_bundles import featurizer_config, data_fingerprint, save_model_bundle
+from random_forest_grid import random_forest_hyper_settings, run_random_forest_grid, accuracy_from_probabilities
 from utils import generic_GetTrainValTestSubjects, seed_everything, featurize, makedir_if_not_exist, plot_confusion_matrix, save_pickle, write_performance_info_FixedTrainValSplit, write_program_time
 
 parser = argparse.ArgumentParser()
@@ -23,6 +24,8 @@ parser.add_argument('--window_size', default=200, type=int, help='window size')
 parser.add_argument('--result_save_rootdir', default='./experiments', help='folder to the result')
 parser.add_argument('--classification_task', default='four_class', help='binary or four-class classification')
 parser.add_argument('--setting', default='64vs4_TestBucket1', help='which predefined train val test split scenario')
+parser.add_argument('--num_workers', default=0, type=int, help='forests fitted in parallel, 0: one per hyper setting up to the cpu budget')
+parser.add_argument('--cpu_budget', default=0, type=int, help='cpus shared by the parallel forests, 0: all cpus')
 
 def train_classifier(args_dict, train_subjects, val_subjects, test_subjects):
     #convert to string list
@@ -82,87 +85,84 @@ def train_classifier(args_dict, train_subjects, val_subjects, test_subjects):
     transformed_group_model_sub_val_feature_array = featurize(group_model_sub_val_feature_array, classification_task)
 
     
-    #cross validation
-    max_features_list = [0.166, 0.333, 0.667, 0.1]
-    min_samples_leaf_list = [4, 16, 64]   
+    #load the test subjects once, the whole grid is evaluated on them
+    test_subjects_dict = dict()
+    for test_subject in test_subjects:
+        #load this subject's test data
+        sub_feature_array, sub_label_array = data_loading_function(os.path.join(data_dir, 'sub_{}.csv'.format(test_subject)), num_chunk_this_window_size=num_chunk_this_window_size)
+        
+        sub_data_len = len(sub_label_array)
+        assert sub_data_len == int(num_chunk_this_window_size/2), 'subject {} len is not {} for binary classification'.format(test_subject, int(num_chunk_this_window_size/2))
+        half_sub_data_len = int(sub_data_len/2)
+        print('half_sub_data_len: {}'.format(half_sub_data_len), flush=True)
+
+        sub_test_feature_array = sub_feature_array[half_sub_data_len:]
+        transformed_sub_test_feature_array = featurize(sub_test_feature_array, classification_task)
+        sub_test_label_array = sub_label_array[half_sub_data_len:]
+
+        test_subjects_dict[test_subject] = dict()
+        test_subjects_dict[test_subject]['transformed_sub_test_feature_array'] = transformed_sub_test_feature_array
+        test_subjects_dict[test_subject]['sub_test_label_array'] = sub_test_label_array
 
+    
+    #every fitted pipeline is saved as a model bundle (see model_bundles.py)
+    bundle_featurizer_config = featurizer_config(classification_task, window_size)
+    train_fingerprint = data_fingerprint(transformed_group_model_sub_train_feature_array, group_model_sub_train_label_array)
+
+    #cross validation
     start_time = time.time()
 
-    for max_features in max_features_list:
-        for min_samples_leaf in min_samples_leaf_list:
-            experiment_name = 'MaxFeatures{}_MinSamplesLeaf{}'.format(max_features, min_samples_leaf)
-            
-            #create test subjects dict
-            test_subjects_dict = dict()
-            for test_subject in test_subjects:
-                #load this subject's test data
-                sub_feature_array, sub_label_array = data_loading_function(os.path.join(data_dir, 'sub_{}.csv'.format(test_subject)), num_chunk_this_window_size=num_chunk_this_window_size)
-                
-                sub_data_len = len(sub_label_array)
-                assert sub_data_len == int(num_chunk_this_window_size/2), 'subject {} len is not {} for binary classification'.format(test_subject, int(num_chunk_this_window_size/2))
-                half_sub_data_len = int(sub_data_len/2)
-                print('half_sub_data_len: {}'.format(half_sub_data_len), flush=True)
-
-                sub_test_feature_array = sub_feature_array[half_sub_data_len:]
-                transformed_sub_test_feature_array = featurize(sub_test_feature_array, classification_task)
-                sub_test_label_array = sub_label_array[half_sub_data_len:]
-
-                #create the dict for this subject: 
-                #each subject's dict has: 'transformed_sub_test_feature_array', 'sub_test_label_array',
-                                    # 'resutl_save_subjectdir', 'resutl_save_subject_checkpointdir', 
-                                    # 'result_save_subject_predictiondir', 'result_save_subject_resultanalysisdir'
-                                    # 'result_save_subject_trainingcurvedir', 'result_save_dir', 
-
-                test_subjects_dict[test_subject] = dict()
-                test_subjects_dict[test_subject]['transformed_sub_test_feature_array'] = transformed_sub_test_feature_array
-                test_subjects_dict[test_subject]['sub_test_label_array'] = sub_test_label_array
+    #all the hyper settings in parallel, one predict_proba per model and evaluation set
+    eval_features_dict = {'val': transformed_group_model_sub_val_feature_array}
+    for test_subject in test_subjects:
+        eval_features_dict[test_subject] = test_subjects_dict[test_subject]['transformed_sub_test_feature_array']
+    
+    grid_results = run_random_forest_grid(transformed_group_model_sub_train_feature_array, group_model_sub_train_label_array, eval_features_dict, random_forest_hyper_settings(), num_workers=args_dict.num_workers, cpu_budget=args_dict.cpu_budget, return_models=True)
 
+    classifier_bundle_paths = dict()
+    for experiment_name, _ in random_forest_hyper_settings():
+        classes = grid_results[experiment_name]['classes']
+        probabilities_dict = grid_results[experiment_name]['probabilities']
+        
+        # val performance 
+        val_accuracy = accuracy_from_probabilities(classes, probabilities_dict['val'], group_model_sub_val_label_array)
+        
+        # test performance
+        for test_subject in test_subjects:
+            #derived args
+            result_save_subjectdir = os.path.join(result_save_rootdir, test_subject, experiment_name)
+            result_save_subject_checkpointdir = os.path.join(result_save_subjectdir, 'checkpoint')
+            result_save_subject_predictionsdir = os.path.join(result_save_subjectdir, 'predictions')
+            result_save_subject_resultanalysisdir = os.path.join(result_save_subjectdir, 'result_analysis')
+            result_save_subject_trainingcurvedir = os.path.join(result_save_subjectdir, 'trainingcurve')
+
+            makedir_if_not_exist(result_save_subjectdir)
+            makedir_if_not_exist(result_save_subject_checkpointdir)
+            makedir_if_not_exist(result_save_subject_predictionsdir)
+            makedir_if_not_exist(result_save_subject_resultanalysisdir)
+            makedir_if_not_exist(result_save_subject_trainingcurvedir)
+
+            sub_test_label_array = test_subjects_dict[test_subject]['sub_test_label_array']
+            test_logits = probabilities_dict[test_subject]
+            test_accuracy = accuracy_from_probabilities(classes, test_logits, sub_test_label_array)
+            test_class_predictions = test_logits.argmax(1)
             
-                #derived args
-                result_save_subjectdir = os.path.join(result_save_rootdir, test_subject, experiment_name)
-                result_save_subject_checkpointdir = os.path.join(result_save_subjectdir, 'checkpoint')
-                result_save_subject_predictionsdir = os.path.join(result_save_subjectdir, 'predictions')
-                result_save_subject_resultanalysisdir = os.path.join(result_save_subjectdir, 'result_analysis')
-                result_save_subject_trainingcurvedir = os.path.join(result_save_subjectdir, 'trainingcurve')
-
-                makedir_if_not_exist(result_save_subjectdir)
-                makedir_if_not_exist(result_save_subject_checkpointdir)
-                makedir_if_not_exist(result_save_subject_predictionsdir)
-                makedir_if_not_exist(result_save_subject_resultanalysisdir)
-                makedir_if_not_exist(result_save_subject_trainingcurvedir)
-                
-                test_subjects_dict[test_subject]['result_save_subjectdir'] = result_save_subjectdir
-                test_subjects_dict[test_subject]['result_save_subject_checkpointdir'] = result_save_subject_checkpointdir
-                test_subjects_dict[test_subject]['result_save_subject_predictionsdir'] = result_save_subject_predictionsdir
-                test_subjects_dict[test_subject]['result_save_subject_resultanalysisdir'] = result_save_subject_resultanalysisdir
-                test_subjects_dict[test_subject]['result_save_subject_trainingcurvedir'] = result_save_subject_trainingcurvedir
-
-                test_subjects_dict[test_subject]['result_save_dict'] = dict()
-            
-            
-            #create Logistic Regression object
-            model = rfc(max_features=max_features, min_samples_leaf=min_samples_leaf).fit(transformed_group_model_sub_train_feature_array, group_model_sub_train_label_array)
-            
-            # val performance 
-            val_accuracy = model.score(transformed_group_model_sub_val_feature_array, group_model_sub_val_label_array) * 100
+            result_save_dict = dict()
+            result_save_dict['bestepoch_val_accuracy'] = val_accuracy
+            result_save_dict['bestepoch_test_accuracy'] = test_accuracy
+            result_save_dict['bestepoch_test_logits'] = test_logits
+            result_save_dict['bestepoch_test_class_labels'] = sub_test_label_array
             
-            # test performance
-            for test_subject in test_subjects:
-                test_subjects_dict[test_subject]['result_save_dict']['bestepoch_val_accuracy'] = val_accuracy
-                test_accuracy = model.score(test_subjects_dict[test_subject]['transformed_sub_test_feature_array'], test_subjects_dict[test_subject]['sub_test_label_array']) * 100
-                test_logits = model.predict_proba(test_subjects_dict[test_subject]['transformed_sub_test_feature_array'])
-                test_class_predictions = test_logits.argmax(1)
+            plot_confusion_matrix(test_class_predictions, sub_test_label_array, confusion_matrix_figure_labels, result_save_subject_resultanalysisdir, 'test_confusion_matrix.png')
+
+            save_pickle(result_save_subject_predictionsdir, 'result_save_dict.pkl', result_save_dict)
             
-                test_subjects_dict[test_subject]['result_save_dict']['bestepoch_test_accuracy'] = test_accuracy
-                test_subjects_dict[test_subject]['result_save_dict']['bestepoch_test_logits'] = test_logits
-                test_subjects_dict[test_subject]['result_save_dict']['bestepoch_test_class_labels'] = test_subjects_dict[test_subject]['sub_test_label_array']
-                
-                plot_confusion_matrix(test_class_predictions, test_subjects_dict[test_subject]['sub_test_label_array'], confusion_matrix_figure_labels, test_subjects_dict[test_subject]['result_save_subject_resultanalysisdir'], 'test_confusion_matrix.png')
+            #write performance to txt file
+            write_performance_info_FixedTrainValSplit('NA', result_save_subject_resultanalysisdir, val_accuracy, test_accuracy)
 
-                save_pickle(test_subjects_dict[test_subject]['result_save_subject_predictionsdir'], 'result_save_dict.pkl', test_subjects_dict[test_subject]['result_save_dict'])
-                
-                #write performance to txt file
-                write_performance_info_FixedTrainValSplit('NA', test_subjects_dict[test_subject]['result_save_subject_resultanalysisdir'], val_accuracy, test_accuracy)
+            #save the fitted pipeline: the generic model is written with the first test subject, the others refer to it (see model_bundles.py)
+            bundle_path = save_model_bundle(result_save_subject_checkpointdir, grid_results[experiment_name]['model'], bundle_featurizer_config, train_fingerprint, classifier_bundle_path=classifier_bundle_paths.get(experiment_name))
+            classifier_bundle_paths.setdefault(experiment_name, bundle_path)
 
     end_time = time.time()
     total_time = end_time - start_time
@@ -180,6 +180,8 @@ if __name__=='__main__':
     result_save_rootdir = args.result_save_rootdir
     classification_task = args.classification_task
     setting = args.setting
+    num_workers = args.num_workers
+    cpu_budget = args.cpu_budget
     
     test_subjects, train_subjects, val_subjects = generic_GetTrainValTestSubjects(setting)
     
@@ -189,12 +191,16 @@ if __name__=='__main__':
     print('result_save_rootdir: {}, type: {}'.format(result_save_rootdir, type(result_save_rootdir)))
     print('classification_task: {}, type: {}'.format(classification_task, type(classification_task)))
     print('setting: {} type: {}'.format(setting, type(setting)))
+    print('num_workers: {} type: {}'.format(num_workers, type(num_workers)))
+    print('cpu_budget: {} type: {}'.format(cpu_budget, type(cpu_budget)))
     
     args_dict = edict()
     args_dict.data_dir = data_dir
     args_dict.window_size = window_size
     args_dict.result_save_rootdir = result_save_rootdir
     args_dict.classification_task = classification_task
+    args_dict.num_workers = num_workers
+    args_dict.cpu_budget = cpu_budget
     
     seed_everything(seed)
     train_classifier(args_dict, train_subjects, val_subjects, test_subjects)
@@ -0,0 +1,38 @@
+#!/bin/bash
+#
+# Usage
+# -----
+# $ bash launch_experiments.sh ACTION_NAME
+#
+# where ACTION_NAME is either "list" or "submit" or "run_here"
+
+if [[ -z $1 ]]; then
+    ACTION_NAME="list"
+else
+    ACTION_NAME=$1
+fi
+
+export model_name="LogisticRegression"
+export data_dir="$YOUR_PATH/fNIRS-mental-workload-classifiers/data/slide_window_data/size_30sec_150ts_stride_3ts/"
+export window_size=150
+export classification_task="binary"
+export scenario="16vs4"
+export bucket="TestBucket1"
+export setting="16vs4_TestBucket1"
+export new_subjects="5 13 14 15"
+export restore_dir="$YOUR_PATH/fNIRS-mental-workload-classifiers/experiments/generic_models/LogisticRegression/binary/$scenario/$bucket"
+export experiment_name="C1.0"
+export replay_size=2000
+export update_epochs=50
+export n_epoch=600
+export result_save_rootdir="$YOUR_PATH/fNIRS-mental-workload-classifiers/experiments/generic_models/IncrementalUpdate/LogisticRegression/binary/$scenario/$bucket" 
+
+if [[ $ACTION_NAME == "submit" ]]; then
+    ## Use this line to submit the experiment to the batch scheduler
+    sbatch < $YOUR_PATH/fNIRS-mental-workload-classifiers/generic_models/runs/do_experiment_IncrementalUpdate.slurm
+
+elif [[ $ACTION_NAME == "run_here" ]]; then
+    ## Use this line to just run interactively
+    bash $YOUR_PATH/fNIRS-mental-workload-classifiers/generic_models/runs/do_experiment_IncrementalUpdate.slurm
+fi
+
@@ -0,0 +1,40 @@
+#unsupervised adaptation of the deep generic models to a target subject
+
+import copy
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+
+def adapt_batchnorm_statistics(model, feature_array, batch_size=None, device=torch.device('cpu')):
+    '''
+    AdaBN (Li et al. 2016, https://arxiv.org/abs/1603.04779): return a copy of the model whose BatchNorm running statistics are
+    recomputed from the target subject's unlabeled chunks, in one no-grad pass. All weights stay the same.
+
+    batch_size None passes all chunks as one batch, which makes the running statistics the exact mean/variance of the target chunks
+    (with smaller batches they are the average of the per-batch statistics)
+    '''
+
+    adapted_model = copy.deepcopy(model).to(device)
+    adapted_model.eval()
+
+    batchnorm_layers = [module for module in adapted_model.modules() if isinstance(module, nn.modules.batchnorm._BatchNorm)]
+    for batchnorm in batchnorm_layers:
+        batchnorm.reset_running_stats()
+        #momentum None: cumulative average over the batches of this pass instead of an exponential moving average
+        batchnorm.momentum = None
+        #only the BatchNorm layers in train mode, so dropout stays off
+        batchnorm.train()
+
+    feature_array = np.asarray(feature_array, dtype=np.float32)
+    if batch_size is None:
+        batch_size = len(feature_array)
+
+    with torch.no_grad():
+        for start in range(0, len(feature_array), batch_size):
+            adapted_model(torch.from_numpy(feature_array[start:start + batch_size]).to(device))
+
+    adapted_model.eval()
+
+    return adapted_model
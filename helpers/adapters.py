@@ -0,0 +1,176 @@
+#parameter-efficient per-subject adapters on top of a shared generic EEGNet/DeepConvNet
+#
+#   batchnorm: the BatchNorm affine parameters (and the running statistics they are trained with); without it the backbone's BatchNorm
+#   layers stay in eval mode during training, so their running statistics are the generic model's ones the adapter is merged into
+#   channel_scale: one scale per output channel of every (unconstrained) conv layer
+#   classifier_lowrank: a rank-r delta U @ V on the classifier weight, plus a bias delta
+#
+#only the adapter tensors are saved (a few KB per subject); merge_adapter_state_dict folds them into the backbone's state dict at
+#load time, so the adapted model is a plain EEGNet150/DeepConvNet150 (usable by every inference backend)
+
+import copy
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from models import Conv2dWithConstraint
+
+
+ADAPTER_TYPES = ['batchnorm', 'channel_scale', 'classifier_lowrank']
+
+ADAPTER_FORMAT_VERSION = 1
+
+
+def _scaled_conv_names(model):
+    #a channel scale folds into the conv weight only if nothing renormalizes that weight afterwards: Conv2dWithConstraint renorms every forward
+    return [name for name, module in model.named_modules() if isinstance(module, nn.Conv2d) and not isinstance(module, Conv2dWithConstraint) and not name.startswith('classifier')]
+
+
+class SubjectAdapter(nn.Module):
+    '''
+    The generic model (a frozen copy) with trainable adapters attached through forward hooks.
+    forward(x) is the adapted model's output, so train_one_epoch/eval_model from utils work unchanged
+    '''
+
+    def __init__(self, model, adapter_types=ADAPTER_TYPES, rank=1):
+        super(SubjectAdapter, self).__init__()
+
+        for adapter_type in adapter_types:
+            if adapter_type not in ADAPTER_TYPES:
+                raise NameError('not supported adapter type')
+
+        self.adapter_types = list(adapter_types)
+        self.rank = rank
+
+        self.backbone = copy.deepcopy(model)
+        for parameter in self.backbone.parameters():
+            parameter.requires_grad = False
+
+        self.batchnorm_names = []
+        if 'batchnorm' in self.adapter_types:
+            for name, module in self.backbone.named_modules():
+                if isinstance(module, nn.modules.batchnorm._BatchNorm):
+                    module.weight.requires_grad = True
+                    module.bias.requires_grad = True
+                    self.batchnorm_names.append(name)
+
+        #ParameterDict keys can not contain '.'
+        self.channel_scales = nn.ParameterDict()
+        self.scaled_conv_names = []
+        if 'channel_scale' in self.adapter_types:
+            modules = dict(self.backbone.named_modules())
+            for name in _scaled_conv_names(self.backbone):
+                self.channel_scales[name.replace('.', '_')] = nn.Parameter(torch.ones(modules[name].out_channels))
+                modules[name].register_forward_hook(self._channel_scale_hook(name.replace('.', '_')))
+                self.scaled_conv_names.append(name)
+
+        if 'classifier_lowrank' in self.adapter_types:
+            classifier = self.backbone.classifier[0]
+            num_outputs = classifier.weight.shape[0]
+            num_inputs = classifier.weight[0].numel()
+
+            #U starts at zero, so the adapted model starts as the generic model (as LoRA)
+            self.lowrank_U = nn.Parameter(torch.zeros(num_outputs, rank))
+            self.lowrank_V = nn.Parameter(torch.randn(rank, num_inputs) / num_inputs ** 0.5)
+            self.lowrank_bias = nn.Parameter(torch.zeros(num_outputs))
+            classifier.register_forward_hook(self._classifier_lowrank_hook)
+
+    def _channel_scale_hook(self, key):
+        def hook(module, inputs, output):
+            return output * self.channel_scales[key].view(1, -1, 1, 1)
+
+        return hook
+
+    def _classifier_lowrank_hook(self, module, inputs, output):
+        delta_weight = (self.lowrank_U @ self.lowrank_V).view_as(module.weight)
+
+        if isinstance(module, nn.Linear):
+            return output + F.linear(inputs[0], delta_weight, self.lowrank_bias)
+
+        return output + F.conv2d(inputs[0], delta_weight, self.lowrank_bias, module.stride, module.padding, module.dilation, module.groups)
+
+    def train(self, mode=True):
+        super(SubjectAdapter, self).train(mode)
+
+        #BatchNorm layers that are not adapted keep the backbone's running statistics (they are not saved with the adapter)
+        for name, module in self.backbone.named_modules():
+            if isinstance(module, nn.modules.batchnorm._BatchNorm) and name not in self.batchnorm_names:
+                module.eval()
+
+        return self
+
+    def forward(self, x):
+        return self.backbone(x)
+
+    def adapter_state_dict(self):
+        '''
+        only the per-subject tensors, see merge_adapter_state_dict
+        '''
+
+        tensors = dict()
+        backbone_state_dict = self.backbone.state_dict()
+
+        for name in self.batchnorm_names:
+            for suffix in ['weight', 'bias', 'running_mean', 'running_var', 'num_batches_tracked']:
+                tensors['batchnorm.{}.{}'.format(name, suffix)] = backbone_state_dict['{}.{}'.format(name, suffix)].detach().clone()
+
+        for name in self.scaled_conv_names:
+            tensors['channel_scale.{}'.format(name)] = self.channel_scales[name.replace('.', '_')].detach().clone()
+
+        if 'classifier_lowrank' in self.adapter_types:
+            tensors['classifier_lowrank.U'] = self.lowrank_U.detach().clone()
+            tensors['classifier_lowrank.V'] = self.lowrank_V.detach().clone()
+            tensors['classifier_lowrank.bias'] = self.lowrank_bias.detach().clone()
+
+        return {'format_version': ADAPTER_FORMAT_VERSION, 'adapter_types': self.adapter_types, 'rank': self.rank, 'tensors': tensors}
+
+
+def adapter_num_elements(adapter_state_dict):
+    return sum(tensor.numel() for tensor in adapter_state_dict['tensors'].values())
+
+
+def merge_adapter_state_dict(backbone_state_dict, adapter_state_dict):
+    '''
+    the state dict of the adapted model: the backbone's tensors with the adapter folded in (the backbone state dict is not modified)
+        batchnorm: replaced
+        channel_scale: conv weight (and bias) scaled per output channel, exact since the scale is applied on the conv output
+        classifier_lowrank: classifier weight + U @ V, classifier bias + bias delta
+    '''
+
+    if adapter_state_dict['format_version'] != ADAPTER_FORMAT_VERSION:
+        raise NameError('not supported adapter format_version {}'.format(adapter_state_dict['format_version']))
+
+    merged_state_dict = {key: tensor.clone() for key, tensor in backbone_state_dict.items()}
+
+    for key, tensor in adapter_state_dict['tensors'].items():
+        adapter_type, name = key.split('.', 1)
+
+        if adapter_type == 'batchnorm':
+            merged_state_dict[name] = tensor.clone()
+
+        elif adapter_type == 'channel_scale':
+            merged_state_dict[name + '.weight'] *= tensor.view(-1, *([1] * (merged_state_dict[name + '.weight'].dim() - 1)))
+            if name + '.bias' in merged_state_dict:
+                merged_state_dict[name + '.bias'] *= tensor
+
+    if 'classifier_lowrank' in adapter_state_dict['adapter_types']:
+        tensors = adapter_state_dict['tensors']
+        merged_state_dict['classifier.0.weight'] += (tensors['classifier_lowrank.U'] @ tensors['classifier_lowrank.V']).view_as(merged_state_dict['classifier.0.weight'])
+        merged_state_dict['classifier.0.bias'] += tensors['classifier_lowrank.bias']
+
+    return merged_state_dict
+
+
+def load_adapted_model(model_to_use, backbone_state_dict, adapter_path):
+    '''
+    model_to_use: models.EEGNet150 or models.DeepConvNet150; backbone_state_dict: the shared generic weights, loaded once
+    '''
+
+    adapter_state_dict = torch.load(adapter_path, map_location=torch.device('cpu'))
+
+    model = model_to_use()
+    model.load_state_dict(merge_adapter_state_dict(backbone_state_dict, adapter_state_dict))
+    model.eval()
+
+    return model
@@ -0,0 +1,98 @@
+#binary logistic regression for many small problems at once (e.g. every subject x every C of the subject-specific sweep)
+#
+#same objective as sklearn's LogisticRegression(penalty='l2', C=C) (the intercept is not penalized):
+#   C * sum_i log(1 + exp(-y_i (x_i.w + b))) + 0.5 * ||w||^2
+#solved by Newton's method on the stacked [num_problems, d+1] parameters: with d=32 features every Hessian is 33 x 33, so one
+#iteration is a few batched matrix products and one batched np.linalg.solve for all the problems, and the solution matches the
+#lbfgs one of sklearn up to its tolerance (the objective is strictly convex, both reach the same optimum)
+
+import numpy as np
+
+
+def _log_sigmoid(z):
+    return -np.logaddexp(0, -z)
+
+
+def _objective(theta, augmented_features, signed_labels, C, penalty_mask):
+    logits = np.matmul(augmented_features, theta[..., None])[..., 0]
+
+    return -C * _log_sigmoid(signed_labels * logits).sum(-1) + 0.5 * (penalty_mask * theta ** 2).sum(-1)
+
+
+def fit_batched_logistic_regression(features, labels, Cs, max_iter=100, tol=1e-10, max_line_search=30):
+    '''
+    features: [S, n, d] (S problems with the same number of samples, e.g. the cv train sets of S subjects), labels: [S, n] in {0, 1}
+
+    returns coef [S, len(Cs), d] and intercept [S, len(Cs)], the LogisticRegression(C=C).coef_[0] and .intercept_[0] of each problem and C
+    '''
+
+    features = np.asarray(features, dtype=np.float64)
+    labels = np.asarray(labels)
+    Cs = np.asarray(Cs, dtype=np.float64)
+
+    num_subjects, num_samples, num_features = features.shape
+    num_Cs = len(Cs)
+
+    #one problem per (subject, C): the features are shared by the Cs of a subject
+    augmented_features = np.concatenate([features, np.ones((num_subjects, num_samples, 1))], axis=-1)
+    augmented_features = np.repeat(augmented_features, num_Cs, axis=0)
+    signed_labels = np.repeat(np.where(labels == 1, 1.0, -1.0), num_Cs, axis=0)
+    C = np.tile(Cs, num_subjects)
+
+    penalty_mask = np.ones(num_features + 1)
+    penalty_mask[-1] = 0
+
+    theta = np.zeros((num_subjects * num_Cs, num_features + 1))
+    objective = _objective(theta, augmented_features, signed_labels, C, penalty_mask)
+    active = np.ones(len(theta), dtype=bool)
+
+    for iteration in range(max_iter):
+        logits = np.matmul(augmented_features, theta[..., None])[..., 0]
+        margins = signed_labels * logits
+
+        #d/dlogit of the log loss, and its second derivative p(1-p)
+        residuals = -signed_labels * np.exp(_log_sigmoid(-margins))
+        curvatures = np.exp(_log_sigmoid(margins) + _log_sigmoid(-margins))
+
+        gradient = C[:, None] * np.matmul(residuals[:, None, :], augmented_features)[:, 0] + penalty_mask * theta
+        hessian = C[:, None, None] * np.matmul(np.swapaxes(augmented_features * curvatures[..., None], 1, 2), augmented_features) + np.diag(penalty_mask)
+        #keeps the intercept direction invertible when every sample is already fitted
+        hessian[:, -1, -1] += 1e-12
+
+        step = np.linalg.solve(hessian, gradient[..., None])[..., 0]
+
+        #Newton decrement: half of it estimates the remaining decrease of the objective
+        decrement = (gradient * step).sum(-1)
+        active &= decrement / 2 > tol * np.maximum(1.0, np.abs(objective))
+        if not active.any():
+            break
+
+        #backtracking line search, for every problem at once
+        step_size = np.ones(len(theta))
+        new_theta = theta - step_size[:, None] * step
+        new_objective = _objective(new_theta, augmented_features, signed_labels, C, penalty_mask)
+        for _ in range(max_line_search):
+            insufficient = active & (new_objective > objective - 0.25 * step_size * decrement)
+            if not insufficient.any():
+                break
+            step_size[insufficient] /= 2
+            new_theta[insufficient] = theta[insufficient] - step_size[insufficient, None] * step[insufficient]
+            new_objective[insufficient] = _objective(new_theta[insufficient], augmented_features[insufficient], signed_labels[insufficient], C[insufficient], penalty_mask)
+
+        theta[active] = new_theta[active]
+        objective[active] = new_objective[active]
+
+    theta = theta.reshape(num_subjects, num_Cs, num_features + 1)
+
+    return theta[..., :-1], theta[..., -1]
+
+
+def batched_predict_proba(features, coef, intercept):
+    '''
+    features: [S, m, d], coef [S, K, d], intercept [S, K] -> predict_proba [S, K, m, 2] (columns: class 0, class 1)
+    '''
+
+    logits = np.einsum('smd,skd->skm', features, coef) + intercept[..., None]
+    positive = np.exp(_log_sigmoid(logits))
+
+    return np.stack([1 - positive, positive], axis=-1)
@@ -117,3 +117,39 @@ def read_subject_csv_binary_SelectWindowSize(path, select_feature_columns = ['AB
     return instance_list, instance_label
 
 
+
+
+def stitch_chunks_to_recordings(instance_list, stride=3):
+    
+    '''
+    The csv files store overlapping sliding windows (chunk i+1 starts stride timesteps after chunk i).
+    Undo the windowing: consecutive chunks that overlap are stitched into one continuous recording, a break in the overlap starts a new recording
+    (e.g. between n-back blocks, or where read_subject_csv_binary dropped the 1back/3back chunks).
+    
+    returns:
+        recording_list: list of 2d arrays [num_timesteps, num_features]
+        chunk_locations: int array [num_chunks, 2], (recording index, start timestep in that recording) of every chunk
+    '''
+    
+    recording_list = []
+    chunk_locations = np.zeros((len(instance_list), 2), dtype=np.int64)
+    
+    current_recording = None
+    current_start = 0
+    for i, chunk_matrix in enumerate(instance_list):
+        
+        if current_recording is not None and np.array_equal(instance_list[i-1][stride:], chunk_matrix[:-stride]):
+            current_recording.append(chunk_matrix[-stride:])
+            current_start += stride
+        else:
+            if current_recording is not None:
+                recording_list.append(np.concatenate(current_recording, axis=0))
+            current_recording = [chunk_matrix]
+            current_start = 0
+        
+        chunk_locations[i] = [len(recording_list), current_start]
+    
+    if current_recording is not None:
+        recording_list.append(np.concatenate(current_recording, axis=0))
+    
+    return recording_list, chunk_locations
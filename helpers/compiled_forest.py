@@ -0,0 +1,169 @@
+#a fitted sklearn RandomForestClassifier flattened into contiguous arrays, scored by a vectorized traversal of all its trees at once
+#
+#the nodes of every tree are concatenated into feature/threshold/left/right/value arrays (children as global node indices, a leaf
+#points to itself), so scoring a batch is at most max_depth rounds of one gather + compare over the (sample, tree) pairs that have not
+#reached a leaf yet, instead of one Python-level predict_proba per tree (plus its joblib dispatch). The probabilities are the mean of the
+#trees' normalized leaf values, as in RandomForestClassifier.predict_proba
+#
+#sklearn compares the features cast to float32 with float64 thresholds: X32 <= t. The float32 layout stores the largest float32 <= t,
+#which takes the same branch for every float32 input, so the traversal (and the leaves reached) is identical in both layouts
+
+import time
+
+import numpy as np
+
+
+def _float32_threshold(threshold):
+    '''
+    largest float32 <= each float64 threshold
+    '''
+
+    threshold32 = threshold.astype(np.float32)
+    rounded_up = threshold32.astype(np.float64) > threshold
+    threshold32[rounded_up] = np.nextafter(threshold32[rounded_up], np.float32(-np.inf))
+
+    return threshold32
+
+
+class CompiledForest():
+    '''
+    Array layout of a fitted RandomForestClassifier, see compile_forest
+    '''
+
+    def __init__(self, classes, roots, feature, threshold, left, right, value, max_depth):
+        self.classes_ = classes
+        self.roots = roots
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.max_depth = max_depth
+        self.is_leaf = left == np.arange(len(left))
+        #[right, left] of each node side by side: the next node is one gather, children[2 * node + go_left]
+        self.children = np.stack([right, left], axis=1).ravel()
+
+    @property
+    def num_nodes(self):
+        return len(self.feature)
+
+    def apply(self, X):
+        '''
+        leaf reached in every tree, [num_samples, num_trees] global node indices
+        '''
+
+        #same input cast as sklearn's trees
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if self.threshold.dtype != np.float32:
+            X = X.astype(self.threshold.dtype)
+        num_samples, num_features = X.shape
+        X = X.ravel()
+
+        #one entry per (sample, tree); each round only advances the entries that have not reached a leaf yet
+        nodes = np.tile(self.roots, num_samples)
+        row_offsets = np.repeat(np.arange(num_samples) * num_features, len(self.roots))
+        active = np.flatnonzero(~self.is_leaf[nodes])
+        for _ in range(self.max_depth):
+            if len(active) == 0:
+                break
+
+            active_nodes = nodes[active]
+            go_left = X[row_offsets[active] + self.feature[active_nodes]] <= self.threshold[active_nodes]
+            active_nodes = self.children[2 * active_nodes + go_left]
+
+            nodes[active] = active_nodes
+            active = active[~self.is_leaf[active_nodes]]
+
+        return nodes.reshape(num_samples, len(self.roots))
+
+    def predict_proba(self, X):
+        return self.value[self.apply(X)].mean(axis=1)
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(1)]
+
+    def save(self, path):
+        np.savez(path, classes=self.classes_, roots=self.roots, feature=self.feature, threshold=self.threshold, left=self.left, right=self.right, value=self.value, max_depth=self.max_depth)
+
+
+def load_compiled_forest(path):
+    arrays = np.load(path)
+
+    return CompiledForest(arrays['classes'], arrays['roots'], arrays['feature'], arrays['threshold'], arrays['left'], arrays['right'], arrays['value'], int(arrays['max_depth']))
+
+
+def compile_forest(forest, dtype=np.float64, max_depth=None):
+    '''
+    forest: fitted RandomForestClassifier (single output)
+    dtype: np.float64 or np.float32 for the thresholds and leaf values; float32 halves the memory and takes the same branches, the
+           probabilities then differ from sklearn's by float32 rounding only
+    max_depth: None keeps the trees whole (identical to sklearn); otherwise the nodes at this depth become leaves with the class
+               distribution of their training samples, fewer traversal rounds at the price of (slightly) different probabilities
+    '''
+
+    feature_list = []
+    threshold_list = []
+    left_list = []
+    right_list = []
+    value_list = []
+    roots = []
+    compiled_depth = 0
+
+    offset = 0
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        num_nodes = tree.node_count
+        node_index = np.arange(num_nodes)
+
+        #depth of every node (children always come after their parent)
+        depth = np.zeros(num_nodes, dtype=np.int64)
+        for node in range(num_nodes):
+            if tree.children_left[node] != -1:
+                depth[tree.children_left[node]] = depth[node] + 1
+                depth[tree.children_right[node]] = depth[node] + 1
+
+        is_leaf = tree.children_left == -1
+        if max_depth is not None:
+            is_leaf = is_leaf | (depth >= max_depth)
+
+        compiled_depth = max(compiled_depth, int(depth[is_leaf].max()) if max_depth is None else min(max_depth, int(depth[is_leaf].max())))
+
+        #leaves point to themselves
+        feature_list.append(np.where(is_leaf, 0, tree.feature))
+        threshold_list.append(np.where(is_leaf, 0.0, tree.threshold))
+        left_list.append(np.where(is_leaf, node_index, tree.children_left) + offset)
+        right_list.append(np.where(is_leaf, node_index, tree.children_right) + offset)
+
+        #class counts (or fractions, depending on the sklearn version) of the training samples reaching each node, normalized as in
+        #DecisionTreeClassifier.predict_proba
+        value = tree.value[:, 0, :]
+        value_list.append(value / value.sum(axis=1, keepdims=True))
+
+        roots.append(offset)
+        offset += num_nodes
+
+    threshold = np.concatenate(threshold_list)
+    threshold = _float32_threshold(threshold) if dtype == np.float32 else threshold.astype(np.float64)
+
+    return CompiledForest(forest.classes_, np.array(roots, dtype=np.intp), np.concatenate(feature_list).astype(np.intp), threshold, np.concatenate(left_list).astype(np.intp), np.concatenate(right_list).astype(np.intp), np.concatenate(value_list).astype(dtype), compiled_depth)
+
+
+def benchmark_predict_proba(predict_proba_function, X, batch_size, num_repeats=100):
+    '''
+    median seconds per predict_proba call on batches of batch_size rows of X (featurized chunks, or raw windows for a fused pipeline)
+    '''
+
+    batch = X[:batch_size]
+    if len(batch) < batch_size:
+        batch = np.resize(X, (batch_size,) + X.shape[1:])
+
+    #warm up
+    predict_proba_function(batch)
+
+    timings = []
+    for _ in range(num_repeats):
+        start_time = time.perf_counter()
+        predict_proba_function(batch)
+        timings.append(time.perf_counter() - start_time)
+
+    return float(np.median(timings))
@@ -0,0 +1,212 @@
+#CORAL (Sun et al. 2016, https://arxiv.org/abs/1511.05547) for the featurized chunks
+#
+#same transform as the reference implementation the domain_adaptation runners used:
+#https://github.com/jindongwang/transferlearning/blob/master/code/traditional/CORAL/CORAL.py
+#   Xs_new = Xs @ cov_src^(-1/2) @ cov_tar^(1/2),  cov = np.cov(X.T) + I
+#but the matrix powers come from a symmetric eigendecomposition (the covariances are symmetric positive definite, so there is no need for
+#the Schur decompositions of scipy.linalg.fractional_matrix_power), and the whitened source features are computed once per source pool:
+#adapting to a target subject is one eigendecomposition of its d x d covariance and one matrix multiply
+
+import numpy as np
+
+
+def regularized_covariance(X):
+    return np.cov(X.T) + np.eye(X.shape[1])
+
+
+def symmetric_matrix_power(matrix, power):
+    '''
+    matrix ** power for a symmetric positive definite matrix, or for each matrix of a [k, d, d] stack (one batched eigendecomposition)
+    '''
+
+    eigenvalues, eigenvectors = np.linalg.eigh(matrix)
+
+    return (eigenvectors * eigenvalues[..., None, :] ** power) @ np.swapaxes(eigenvectors, -1, -2)
+
+
+def coloring_matrix(X):
+    '''
+    cov^(1/2) of the features: of the target subject for CoralSource.transform, of the source pool for target_to_source_matrix
+    '''
+
+    return symmetric_matrix_power(regularized_covariance(X), 0.5)
+
+
+def target_to_source_matrix(Xt, source_coloring_matrix):
+    '''
+    CORAL in the other direction: Xt @ cov_tar^(-1/2) @ cov_src^(1/2) has the covariance of the source pool, so one classifier trained on
+    the (unchanged) source features serves every target subject. source_coloring_matrix: coloring_matrix(Xs), computed once per pool
+    '''
+
+    return symmetric_matrix_power(regularized_covariance(Xt), -0.5) @ source_coloring_matrix
+
+
+def stacked_regularized_covariance(X_list):
+    '''
+    regularized_covariance of each feature set in X_list (e.g. the adaptation sets of every test subject of a bucket), as a [k, d, d] stack
+    '''
+
+    if len(set(len(X) for X in X_list)) == 1:
+        X = np.stack(X_list)
+        centered = X - X.mean(axis=1, keepdims=True)
+        covariances = np.swapaxes(centered, 1, 2) @ centered / (X.shape[1] - 1)
+    else:
+        #different adapt_on fractions: the sets have different sizes
+        covariances = np.stack([np.cov(X.T) for X in X_list])
+
+    return covariances + np.eye(covariances.shape[-1])
+
+
+def stacked_coloring_matrices(X_list):
+    '''
+    coloring_matrix of each target feature set, [k, d, d]
+    '''
+
+    return symmetric_matrix_power(stacked_regularized_covariance(X_list), 0.5)
+
+
+def stacked_target_to_source_matrices(X_list, source_coloring_matrix):
+    '''
+    target_to_source_matrix of each target feature set, [k, d, d]
+    '''
+
+    return symmetric_matrix_power(stacked_regularized_covariance(X_list), -0.5) @ source_coloring_matrix
+
+
+class CoralSource():
+    '''
+    A source pool (e.g. the generic train or val subjects of a bucket), whitened once: transform(Xt) recolors it to each target
+    '''
+
+    def __init__(self, Xs):
+        self.whitening_matrix = symmetric_matrix_power(regularized_covariance(Xs), -0.5)
+        self.whitened_features = Xs @ self.whitening_matrix
+
+    def transform(self, Xt=None, target_coloring_matrix=None):
+        '''
+        Xs @ cov_src^(-1/2) @ cov_tar^(1/2), from the target features Xt or their coloring_matrix
+        '''
+
+        if target_coloring_matrix is None:
+            target_coloring_matrix = coloring_matrix(Xt)
+
+        return self.whitened_features @ target_coloring_matrix
+
+    def transform_stack(self, Xt_list=None, target_coloring_matrices=None, out=None):
+        '''
+        transform for k targets at once (their features Xt_list, or their [k, d, d] stacked_coloring_matrices): one batched matrix multiply
+        into a [k, ns, d] buffer (out, or a new one), whose element i is the source pool recolored to target i
+        '''
+
+        if target_coloring_matrices is None:
+            target_coloring_matrices = stacked_coloring_matrices(Xt_list)
+
+        if out is None:
+            out = np.empty((len(target_coloring_matrices),) + self.whitened_features.shape, dtype=np.result_type(self.whitened_features, target_coloring_matrices))
+
+        return np.matmul(self.whitened_features, target_coloring_matrices, out=out)
+
+
+def CoralTransform(Xs, Xt):
+    '''
+    Perform CORAL on the source domain features
+    :param Xs: ns * n_feature, source feature
+    :param Xt: nt * n_feature, target feature
+    :return: New source domain features
+    '''
+
+    return CoralSource(Xs).transform(Xt)
+
+
+class StreamingCovariance():
+    '''
+    Mean and covariance of feature rows that arrive over time, updated batch by batch with the pairwise form of Welford's algorithm
+    (Chan et al. 1979) without keeping the rows: covariance() equals np.cov of every row seen so far
+    '''
+
+    def __init__(self, num_features):
+        self.count = 0
+        self.mean = np.zeros(num_features)
+        #sum over the rows seen of (x - mean)(x - mean)^T
+        self.comoment = np.zeros((num_features, num_features))
+
+    def update(self, X):
+        X = np.atleast_2d(X)
+        batch_count = len(X)
+        if batch_count == 0:
+            return
+
+        batch_mean = X.mean(axis=0)
+        centered = X - batch_mean
+        delta = batch_mean - self.mean
+        total_count = self.count + batch_count
+
+        self.comoment += centered.T @ centered + np.outer(delta, delta) * (self.count * batch_count / total_count)
+        self.mean += delta * (batch_count / total_count)
+        self.count = total_count
+
+    def covariance(self):
+        return self.comoment / (self.count - 1)
+
+
+class OnlineCoralAligner():
+    '''
+    target_to_source_matrix for a target subject whose featurized chunks arrive over time (live session): partial_fit keeps only the
+    streaming mean/covariance of the chunks, and the alignment matrix is refreshed
+        every refresh_every chunks, and/or
+        when the covariance drifted from the one of the last refresh by more than drift_threshold (relative Frobenius norm)
+    transform is the identity (the unadapted generic model) until the first refresh, which needs at least min_chunks chunks
+    '''
+
+    def __init__(self, source_coloring_matrix, refresh_every=32, drift_threshold=None, min_chunks=2):
+        self.source_coloring_matrix = source_coloring_matrix
+        self.refresh_every = refresh_every
+        self.drift_threshold = drift_threshold
+        self.min_chunks = max(2, min_chunks)
+
+        num_features = source_coloring_matrix.shape[0]
+        self.statistics = StreamingCovariance(num_features)
+        self.alignment_matrix = np.eye(num_features)
+        self.reference_covariance = None
+        self.num_chunks_at_refresh = 0
+        self.num_refreshes = 0
+
+    def drift(self):
+        '''
+        relative change of the regularized target covariance since the last refresh
+        '''
+
+        current_covariance = self.statistics.covariance() + np.eye(len(self.alignment_matrix))
+
+        return np.linalg.norm(current_covariance - self.reference_covariance) / np.linalg.norm(self.reference_covariance)
+
+    def partial_fit(self, X):
+        '''
+        returns True if the alignment matrix was refreshed by these chunks
+        '''
+
+        self.statistics.update(X)
+
+        if self.statistics.count < self.min_chunks:
+            return False
+
+        if self.reference_covariance is None:
+            refresh = True
+        else:
+            refresh = self.refresh_every is not None and self.statistics.count - self.num_chunks_at_refresh >= self.refresh_every
+            if not refresh and self.drift_threshold is not None:
+                refresh = self.drift() > self.drift_threshold
+
+        if refresh:
+            self.refresh()
+
+        return refresh
+
+    def refresh(self):
+        self.reference_covariance = self.statistics.covariance() + np.eye(len(self.alignment_matrix))
+        self.alignment_matrix = symmetric_matrix_power(self.reference_covariance, -0.5) @ self.source_coloring_matrix
+        self.num_chunks_at_refresh = self.statistics.count
+        self.num_refreshes += 1
+
+    def transform(self, X):
+        return X @ self.alignment_matrix
@@ -0,0 +1,101 @@
+#featurize each subject once for the runners that evaluate many train pools in one process (run_LinearScreening.py, run_MultiBucket.py)
+#
+#utils.featurize works chunk by chunk, so a pool's featurized array is the concatenation of its subjects' featurized arrays and a test
+#subject's test half is the second half of its featurized array. The featurized subjects can be cached in an npz, reused by later runs
+#on the same data; subjects not yet in the cache are featurized and added to it, keeping the subjects cached by other runs. The npz
+#also stores the data_dir, window_size and classification_task it was featurized from, checked at load, and it is written to a
+#temporary file moved into place, so jobs sharing a cache never read a half-written one
+
+import os
+import tempfile
+
+import numpy as np
+
+import brain_data
+from utils import featurize, makedir_if_not_exist
+
+
+def featurized_subjects_config(data_dir, window_size, classification_task):
+    return {'data_dir': os.path.realpath(data_dir), 'window_size': str(window_size), 'classification_task': classification_task}
+
+
+def _load_cache(features_cache, cache_config):
+    #name -> array of every subject in features_cache ({} if there is no cache yet)
+    if not os.path.exists(features_cache):
+        return dict()
+
+    with np.load(features_cache) as cached_arrays:
+        for key, value in cache_config.items():
+            cached_value = str(cached_arrays['config_{}'.format(key)]) if 'config_{}'.format(key) in cached_arrays else None
+            if cached_value != value:
+                raise ValueError('{} was featurized with {}={}, expected {}'.format(features_cache, key, cached_value, value))
+
+        return {name: cached_arrays[name] for name in cached_arrays.files if not name.startswith('config_')}
+
+
+def load_featurized_subjects(data_dir, subjects, classification_task, window_size, features_cache='', num_chunk_this_window_size=1488):
+    '''
+    subject -> featurized chunks [num_chunks, 32] and labels [num_chunks]. The subjects found in features_cache are loaded from it, the
+    others are featurized and added to it (no caching if features_cache is ''). Raises ValueError if features_cache was featurized from
+    other data
+    '''
+
+    if classification_task == 'four_class':
+        data_loading_function = brain_data.read_subject_csv
+
+    elif classification_task == 'binary':
+        data_loading_function = brain_data.read_subject_csv_binary
+
+    else:
+        raise NameError('not supported classification type')
+
+    cache_config = featurized_subjects_config(data_dir, window_size, classification_task)
+    cached_arrays = dict() if features_cache == '' else _load_cache(features_cache, cache_config)
+
+    feature_dict = dict()
+    label_dict = dict()
+
+    missing_subjects = []
+    for subject in subjects:
+        if 'features_{}'.format(subject) in cached_arrays:
+            feature_dict[subject] = cached_arrays['features_{}'.format(subject)]
+            label_dict[subject] = cached_arrays['labels_{}'.format(subject)]
+        else:
+            missing_subjects.append(subject)
+
+    if len(missing_subjects) < len(subjects):
+        print('loaded {} featurized subjects from {}'.format(len(subjects) - len(missing_subjects), features_cache), flush=True)
+
+    if len(missing_subjects) == 0:
+        return feature_dict, label_dict
+
+    for subject in missing_subjects:
+        sub_feature_array, sub_label_array = data_loading_function(os.path.join(data_dir, 'sub_{}.csv'.format(subject)), num_chunk_this_window_size=num_chunk_this_window_size)
+        assert sub_feature_array.shape[1] == window_size, 'subject {} chunks have {} timesteps, not window_size {}'.format(subject, sub_feature_array.shape[1], window_size)
+
+        feature_dict[subject] = featurize(sub_feature_array.astype(np.float32), classification_task)
+        label_dict[subject] = sub_label_array
+        print('featurized subject {}'.format(subject), flush=True)
+
+    if features_cache != '':
+        cache_dir = os.path.dirname(os.path.abspath(features_cache))
+        makedir_if_not_exist(cache_dir)
+
+        #keep every subject already cached, re-read in case another job added subjects while these were featurized
+        merged_arrays = _load_cache(features_cache, cache_config)
+        for subject in missing_subjects:
+            merged_arrays['features_{}'.format(subject)] = feature_dict[subject]
+            merged_arrays['labels_{}'.format(subject)] = label_dict[subject]
+        merged_arrays.update({'config_{}'.format(key): np.array(value) for key, value in cache_config.items()})
+
+        #write next to the cache and move it into place in one step
+        temp_fd, temp_path = tempfile.mkstemp(dir=cache_dir, suffix='.npz.tmp')
+        try:
+            with os.fdopen(temp_fd, 'wb') as temp_file:
+                np.savez(temp_file, **merged_arrays)
+            os.replace(temp_path, features_cache)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    return feature_dict, label_dict
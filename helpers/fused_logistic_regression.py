@@ -0,0 +1,116 @@
+#featurize + LogisticRegression (+ CORAL alignment) folded into one scoring function on the raw windows
+#
+#utils.featurize returns per column c of a [window_size, 8] window: mean_c, std_c, slope_c and intercept_c of a least squares line over
+#t = linspace(0, 1, window_size). Except for the std, these are linear in the window:
+#   mean_c      = sum_t x_tc / T
+#   slope_c     = sum_t x_tc (t - t_mean) / sum_t (t - t_mean)^2
+#   intercept_c = mean_c - slope_c * t_mean
+#and so is a CORAL alignment (features @ alignment_matrix), so the logits of the pipeline are
+#   window.ravel() @ window_weights + std @ std_weights + bias
+#with window_weights [window_size * 8, num_logits] precomputed from the coefficients: two matrix products on the flattened raw windows
+#(the linear part with the column means, then the second moments for the stds), instead of featurize's Python loop over the chunks
+#(16 np.inner per chunk) and the [num_chunks, 32] feature matrix
+#
+#the statistics are computed in float64 while featurize keeps the float32 of the data files, so the probabilities differ from the sklearn
+#pipeline's by float32 rounding only
+
+import numpy as np
+from scipy.special import expit, softmax
+
+
+class FusedLogisticRegression():
+    '''
+    Scoring function of a featurize + LogisticRegression pipeline, see fuse_logistic_regression
+    '''
+
+    def __init__(self, classes, window_weights, std_weights, bias):
+        self.classes_ = classes
+        self.window_weights = window_weights
+        self.std_weights = std_weights
+        self.bias = bias
+        self.num_columns = len(std_weights)
+        self.window_size = len(window_weights) // self.num_columns
+
+        #[window_size * 8, 8]: column means of the flattened windows as a matrix product
+        self.column_mean_weights = np.tile(np.eye(self.num_columns), (self.window_size, 1)) / self.window_size
+        #logits of the linear statistics and the column means in one matrix product
+        self.projection = np.concatenate([window_weights, self.column_mean_weights], axis=1)
+        self.num_logits = window_weights.shape[1]
+
+    def decision_function(self, X):
+        '''
+        X: raw windows [num_windows, window_size, 8] -> logits [num_windows, num_logits]
+        '''
+
+        X = np.asarray(X, dtype=np.float64)
+        assert X.shape[1:] == (self.window_size, self.num_columns), 'expected windows of shape {}, got {}'.format((self.window_size, self.num_columns), X.shape[1:])
+        num_windows = len(X)
+
+        projected = X.reshape(num_windows, -1) @ self.projection
+        column_means = projected[:, self.num_logits:]
+
+        #population std as np.std in featurize, from the second moments of the window shifted by its first sample (no cancellation for
+        #columns with a large offset)
+        shifted = (X - X[:, :1]).reshape(num_windows, -1)
+        shifted_means = column_means - X[:, 0]
+        column_variances = np.maximum((shifted * shifted) @ self.column_mean_weights - shifted_means * shifted_means, 0)
+
+        return projected[:, :self.num_logits] + np.sqrt(column_variances) @ self.std_weights + self.bias
+
+    def predict_proba(self, X):
+        logits = self.decision_function(X)
+
+        #binary: LogisticRegression.predict_proba is [1 - sigmoid, sigmoid] of its single logit
+        if self.num_logits == 1:
+            positive = expit(logits[:, 0])
+            return np.stack([1 - positive, positive], axis=1)
+
+        #multinomial
+        return softmax(logits, axis=1)
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(1)]
+
+    def save(self, path):
+        np.savez(path, classes=self.classes_, window_weights=self.window_weights, std_weights=self.std_weights, bias=self.bias)
+
+
+def load_fused_logistic_regression(path):
+    arrays = np.load(path)
+
+    return FusedLogisticRegression(arrays['classes'], arrays['window_weights'], arrays['std_weights'], arrays['bias'])
+
+
+def fuse_logistic_regression(classifier, window_size, alignment_matrix=None, num_columns=8):
+    '''
+    classifier: fitted LogisticRegression on the 32 features of utils.featurize (binary, or multinomial for more classes)
+    alignment_matrix: [32, 32] CORAL matrix applied to the features before the classifier (target-side CORAL), or None
+    '''
+
+    #[32, num_logits] weights of the featurized (and aligned) chunks
+    feature_weights = classifier.coef_.T
+    if alignment_matrix is not None:
+        feature_weights = np.asarray(alignment_matrix) @ feature_weights
+
+    mean_weights, std_weights, slope_weights, intercept_weights = np.split(feature_weights, 4)
+
+    #same time axis as utils.get_slope_and_intercept
+    tvec = np.linspace(0, 1, window_size)
+    tdiff = tvec - np.mean(tvec)
+    slope_coefficients = tdiff / np.sum(np.square(tdiff))
+    intercept_coefficients = 1 / window_size - np.mean(tvec) * slope_coefficients
+
+    #[window_size, 8, num_logits]: weight of every sample of every column
+    window_weights = mean_weights[None] / window_size + slope_coefficients[:, None, None] * slope_weights[None] + intercept_coefficients[:, None, None] * intercept_weights[None]
+
+    return FusedLogisticRegression(classifier.classes_, window_weights.reshape(window_size * num_columns, -1), std_weights, classifier.intercept_.astype(np.float64))
+
+
+def fuse_model_bundle(bundle):
+    '''
+    FusedLogisticRegression of a model bundle saved by a Logistic Regression runner (see model_bundles.py), with its CORAL alignment if any
+    '''
+
+    featurizer_config = bundle['featurizer_config']
+
+    return fuse_logistic_regression(bundle['classifier'], featurizer_config['window_size'], bundle['alignment_matrix'], featurizer_config['num_columns'])
@@ -0,0 +1,137 @@
+#the 12-setting histogram gradient boosting grid of the HistGradientBoosting runners, a faster alternative to the random forest sweeps
+#
+#HistGradientBoostingClassifier starts every fit by binning the features into at most 255 quantile bins. Here the 32 features are
+#binned once per grid, with the same binning, and every setting is fitted on the uint8 bin codes: a fit re-bins the codes onto
+#themselves (one bin per code, a fraction of the cost of binning the raw features) and grows the same trees as on the raw features.
+#The codes are dumped once to a memory-mapped file shared by the workers (as in random_forest_grid.py), and the evaluation sets are
+#binned once too
+#
+#early stopping is on the validation set of the runner (the validation subjects, or the cv split of a subject), not on a random fraction
+#of the train set as HistGradientBoostingClassifier(early_stopping=True) does: the boosting is continued by warm starts of eval_every
+#iterations until the validation log loss has not improved for patience checks, and the model of the best check is kept
+
+import os
+import copy
+import time
+import shutil
+import tempfile
+
+import numpy as np
+import joblib
+from joblib import Parallel, delayed
+from threadpoolctl import threadpool_limits
+from sklearn.metrics import log_loss
+from sklearn.pipeline import make_pipeline
+from sklearn.ensemble._hist_gradient_boosting.binning import _BinMapper
+
+try:
+    from sklearn.ensemble import HistGradientBoostingClassifier
+except ImportError:
+    #sklearn < 1.0
+    from sklearn.experimental import enable_hist_gradient_boosting
+    from sklearn.ensemble import HistGradientBoostingClassifier
+
+
+def hist_gradient_boosting_hyper_settings(learning_rate_list=[0.05, 0.1, 0.2], max_leaf_nodes_list=[15, 31], min_samples_leaf_list=[20, 80]):
+    '''
+    [(experiment_name, HistGradientBoostingClassifier keyword arguments)]
+    '''
+
+    return [('LearningRate{}_MaxLeafNodes{}_MinSamplesLeaf{}'.format(learning_rate, max_leaf_nodes, min_samples_leaf), dict(learning_rate=learning_rate, max_leaf_nodes=max_leaf_nodes, min_samples_leaf=min_samples_leaf)) for learning_rate in learning_rate_list for max_leaf_nodes in max_leaf_nodes_list for min_samples_leaf in min_samples_leaf_list]
+
+
+def subject_specific_hist_gradient_boosting_hyper_settings():
+    '''
+    the grid for one subject's cv split (about 150-190 train windows): min_samples_leaf 80 would leave at most one split per tree,
+    so the leaves are scaled down to 5 and 20 windows
+    '''
+
+    return hist_gradient_boosting_hyper_settings(min_samples_leaf_list=[5, 20])
+
+
+def _fit_one_setting(experiment_name, hyper_setting, random_state, train_codes, train_labels, eval_codes_dict, val_labels, max_iter, eval_every, patience, n_threads_per_model):
+    start_time = time.time()
+
+    with threadpool_limits(limits=n_threads_per_model, user_api='openmp'):
+        model = HistGradientBoostingClassifier(max_iter=eval_every, early_stopping=False, warm_start=True, random_state=random_state, **hyper_setting)
+
+        best_model = None
+        best_validation_loss = np.inf
+        num_checks_without_improvement = 0
+        while model.max_iter <= max_iter:
+            model.fit(train_codes, train_labels)
+
+            validation_loss = log_loss(val_labels, model.predict_proba(eval_codes_dict['val']), labels=model.classes_)
+            if validation_loss < best_validation_loss:
+                best_model = copy.deepcopy(model)
+                best_validation_loss = validation_loss
+                num_checks_without_improvement = 0
+            else:
+                num_checks_without_improvement += 1
+                if num_checks_without_improvement >= patience:
+                    break
+
+            model.max_iter += eval_every
+
+        fit_time = time.time() - start_time
+
+        probabilities_dict = dict()
+        inference_time_dict = dict()
+        for eval_name, eval_codes in eval_codes_dict.items():
+            inference_start_time = time.time()
+            probabilities_dict[eval_name] = best_model.predict_proba(eval_codes)
+            inference_time_dict[eval_name] = time.time() - inference_start_time
+
+    best_model.warm_start = False
+
+    return experiment_name, best_model.classes_, probabilities_dict, fit_time, inference_time_dict, best_model, best_validation_loss
+
+
+def run_hist_gradient_boosting_grid(train_features, train_labels, eval_features_dict, val_labels, hyper_settings=None, max_iter=500, eval_every=10, patience=5, num_workers=0, cpu_budget=0, return_models=False):
+    '''
+    bin the features once, then fit one early-stopped model per hyper setting, in parallel, and predict_proba every evaluation set
+    (e.g. {'val': ..., '86': ...}) once per model. eval_features_dict['val'] with val_labels is the early stopping set
+
+    num_workers 0: one worker per hyper setting up to the cpu budget; cpu_budget 0: all cpus
+
+    returns dict experiment_name -> {'classes', 'probabilities': {eval_name: predict_proba}, 'fit_time', 'inference_time': {eval_name: seconds},
+                                     'n_iter', 'validation_loss', 'model' (if return_models: binning + classifier, scores the featurized chunks)}
+    '''
+
+    if hyper_settings is None:
+        hyper_settings = hist_gradient_boosting_hyper_settings()
+
+    if cpu_budget <= 0:
+        cpu_budget = os.cpu_count()
+    if num_workers <= 0:
+        num_workers = min(len(hyper_settings), cpu_budget)
+    n_threads_per_model = max(1, cpu_budget // num_workers)
+
+    #drawn here from the global numpy RNG, so the grid is reproducible whatever num_workers is (see random_forest_grid.py)
+    random_states = np.random.randint(np.iinfo(np.int32).max, size=len(hyper_settings) + 1)
+
+    #the binning of HistGradientBoostingClassifier(max_bins=255), fitted once on the train set
+    bin_mapper = _BinMapper(n_bins=256, subsample=int(2e5), random_state=random_states[-1]).fit(np.asarray(train_features, dtype=np.float64))
+
+    memmap_dir = tempfile.mkdtemp(prefix='hist_gradient_boosting_grid_')
+    try:
+        def memmap(name, array):
+            filename = os.path.join(memmap_dir, '{}.joblib'.format(name))
+            joblib.dump(np.ascontiguousarray(bin_mapper.transform(np.asarray(array, dtype=np.float64))), filename)
+            return joblib.load(filename, mmap_mode='r')
+
+        train_codes = memmap('train', train_features)
+        eval_codes_dict = {eval_name: memmap('eval_{}'.format(eval_index), eval_features) for eval_index, (eval_name, eval_features) in enumerate(eval_features_dict.items())}
+
+        results = Parallel(n_jobs=num_workers)(delayed(_fit_one_setting)(experiment_name, hyper_setting, random_state, train_codes, train_labels, eval_codes_dict, val_labels, max_iter, eval_every, patience, n_threads_per_model) for (experiment_name, hyper_setting), random_state in zip(hyper_settings, random_states))
+
+    finally:
+        shutil.rmtree(memmap_dir, ignore_errors=True)
+
+    grid_results = dict()
+    for experiment_name, classes, probabilities_dict, fit_time, inference_time_dict, model, validation_loss in results:
+        grid_results[experiment_name] = {'classes': classes, 'probabilities': probabilities_dict, 'fit_time': fit_time, 'inference_time': inference_time_dict, 'n_iter': model.n_iter_, 'validation_loss': validation_loss, 'model': make_pipeline(bin_mapper, model) if return_models else None}
+
+    print('hist gradient boosting grid: {} settings on {} workers x {} threads, {} to {} iterations, slowest model {} seconds'.format(len(hyper_settings), num_workers, n_threads_per_model, min(result['n_iter'] for result in grid_results.values()), max(result['n_iter'] for result in grid_results.values()), round(max(result['fit_time'] for result in grid_results.values()), 2)), flush=True)
+
+    return grid_results
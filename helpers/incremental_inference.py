@@ -0,0 +1,390 @@
+#incremental inference for EEGNet150/DeepConvNet150: consecutive windows (stride 3, window 150) share 98% of their samples,
+#so the convolutional front-end is run once over the continuous recording and every window gathers its receptive-field outputs from it
+#
+#the trained layers are folded into numpy arrays (eval mode: every conv + BatchNorm pair is one affine map), both for
+#  offline mode: predict_recording scores all windows of a recording in one pass, predict scores chunk arrays like the other inference backends
+#  streaming mode: create_stream returns a per-subject state that caches the conv outputs, updated with every new sample (see streaming.py)
+#
+#the scores are the model's log-softmax outputs, equal to model.forward up to float rounding
+
+import numpy as np
+
+import models
+from brain_data import stitch_chunks_to_recordings
+from streaming import RingBuffer
+
+
+def _batchnorm_scale_and_shift(batchnorm):
+    scale = batchnorm.weight.detach().cpu().double().numpy() / np.sqrt(batchnorm.running_var.detach().cpu().double().numpy() + batchnorm.eps)
+    shift = batchnorm.bias.detach().cpu().double().numpy() - batchnorm.running_mean.detach().cpu().double().numpy() * scale
+
+    return scale, shift
+
+
+def _conv_weight(conv):
+    import torch
+
+    weight = conv.weight.detach().cpu().double()
+    if isinstance(conv, models.Conv2dWithConstraint):
+        #the max-norm constraint model.forward applies before every convolution
+        weight = torch.renorm(weight, p=2, dim=0, maxnorm=conv.max_norm)
+
+    return weight.numpy()
+
+
+def _elu(x):
+    return np.where(x > 0, x, np.expm1(np.minimum(x, 0)))
+
+
+def _log_softmax(x):
+    x = x - np.max(x, axis=-1, keepdims=True)
+
+    return x - np.log(np.sum(np.exp(x), axis=-1, keepdims=True))
+
+
+def _dilated_conv(x, weight, bias, dilation=1):
+    '''
+    valid convolution along the time axis
+    x: [num_timesteps, in_channels], weight: [out_channels, in_channels, kernel_size]
+    returns [num_timesteps - (kernel_size-1)*dilation, out_channels]
+    '''
+
+    kernel_size = weight.shape[2]
+    num_outputs = len(x) - (kernel_size - 1) * dilation
+    x = np.ascontiguousarray(x)
+
+    #[num_outputs, kernel_size, in_channels] view, no copy
+    x_view = np.lib.stride_tricks.as_strided(x, shape=(num_outputs, kernel_size, x.shape[1]), strides=(x.strides[0], x.strides[0] * dilation, x.strides[1]))
+
+    return np.tensordot(x_view, weight, axes=([1, 2], [2, 1])) + bias
+
+
+class _IncrementalModel():
+
+    def predict(self, feature_array):
+        '''
+        Same interface as inference_backends: scores of chunks [num_chunks, num_timesteps, num_features].
+        Overlapping chunks are stitched back into recordings, so each recording is only passed through the front-end once
+        '''
+
+        feature_array = np.asarray(feature_array)
+        assert feature_array.shape[1] == self.num_timesteps, 'expect chunks of {} timesteps'.format(self.num_timesteps)
+
+        recording_list, chunk_locations = stitch_chunks_to_recordings(feature_array, self.stride)
+
+        scores = np.zeros((len(feature_array), self.num_classes))
+        for recording_index, recording in enumerate(recording_list):
+            chunk_mask = chunk_locations[:, 0] == recording_index
+            scores[chunk_mask] = self.predict_recording(recording, chunk_locations[chunk_mask, 1])
+
+        return scores.astype(np.float32)
+
+
+class IncrementalEEGNet150(_IncrementalModel):
+    '''
+    EEGNet150 with the front-end (firstConv -> BatchNorm -> depthwiseConv -> BatchNorm -> ELU) computed once per timestep of the recording.
+
+    The front-end is pointwise in time apart from the (1,3) 'same' padded firstConv, so a window only differs from the continuous recording
+    at its first and last timestep, where it sees zero padding instead of the neighbouring sample; these two positions are recomputed per window.
+    The (1,4) average pooling is a running mean gathered every 4th timestep, the small remainder (separableConv, classifier) runs per window.
+    '''
+
+    def __init__(self, model, num_timesteps=150, stride=3):
+        self.num_timesteps = num_timesteps
+        self.stride = stride
+
+        model = model.eval()
+
+        #firstConv + BatchNorm + depthwiseConv + BatchNorm folded into one conv: [F1*D, feature_size, 3]
+        first_weight = _conv_weight(model.firstConv[0])[:, 0, 0, :]
+        first_scale, first_shift = _batchnorm_scale_and_shift(model.firstConv[1])
+        depthwise_weight = _conv_weight(model.depthwiseConv[0])[:, 0, :, 0]
+        depthwise_scale, depthwise_shift = _batchnorm_scale_and_shift(model.depthwiseConv[1])
+
+        groups = model.depthwiseConv[0].groups
+        depth_multiplier = depthwise_weight.shape[0] // groups
+        group_index = np.arange(depthwise_weight.shape[0]) // depth_multiplier
+
+        self.front_weight = (depthwise_scale * first_scale[group_index])[:, None, None] * depthwise_weight[:, :, None] * first_weight[group_index][:, None, :]
+        self.front_bias = depthwise_scale * first_shift[group_index] * depthwise_weight.sum(axis=1) + depthwise_shift
+
+        self.pool_size = model.depthwiseConv[3].kernel_size[1]
+        self.num_pooled = num_timesteps // self.pool_size
+
+        #separableConv (depthwise (1,3) + pointwise 1x1) + BatchNorm folded into one conv: [F2, F1*D, 3]
+        separable_weight = _conv_weight(model.separableConv[0])[:, 0, 0, :]
+        pointwise_weight = _conv_weight(model.separableConv[1])[:, :, 0, 0]
+        separable_scale, separable_shift = _batchnorm_scale_and_shift(model.separableConv[2])
+
+        self.separable_weight = separable_scale[:, None, None] * pointwise_weight[:, :, None] * separable_weight[None, :, :]
+        self.separable_bias = separable_shift
+
+        self.second_pool_size = model.separableConv[4].kernel_size[1]
+        self.num_second_pooled = self.num_pooled // self.second_pool_size
+
+        self.classifier_weight = model.classifier[0].weight.detach().cpu().double().numpy()
+        self.classifier_bias = model.classifier[0].bias.detach().cpu().double().numpy()
+        self.num_classes = len(self.classifier_bias)
+
+        #the last window timestep only reaches the first pooling when num_timesteps is a multiple of the pool size
+        self.last_position_used = self.num_pooled * self.pool_size == num_timesteps
+
+    def _front_end(self, recording):
+        padded = np.concatenate([np.zeros((1, recording.shape[1])), recording, np.zeros((1, recording.shape[1]))], axis=0)
+
+        return _elu(_dilated_conv(padded, self.front_weight, self.front_bias))
+
+    def _first_position(self, first_sample, second_sample):
+        #front-end output at a window's first timestep: the left neighbour is padding
+        return _elu(first_sample @ self.front_weight[:, :, 1].T + second_sample @ self.front_weight[:, :, 2].T + self.front_bias)
+
+    def _last_position(self, second_last_sample, last_sample):
+        #front-end output at a window's last timestep: the right neighbour is padding
+        return _elu(second_last_sample @ self.front_weight[:, :, 0].T + last_sample @ self.front_weight[:, :, 1].T + self.front_bias)
+
+    def _classify_pooled(self, pooled):
+        '''
+        pooled: [num_windows, num_pooled, F1*D] output of the first average pooling
+        '''
+
+        num_windows = len(pooled)
+        padded = np.concatenate([np.zeros((num_windows, 1, pooled.shape[2])), pooled, np.zeros((num_windows, 1, pooled.shape[2]))], axis=1)
+
+        separable = self.separable_bias + sum(padded[:, k:k + self.num_pooled] @ self.separable_weight[:, :, k].T for k in range(3))
+        separable = _elu(separable)
+
+        second_pooled = separable[:, :self.num_second_pooled * self.second_pool_size].reshape(num_windows, self.num_second_pooled, self.second_pool_size, -1).mean(axis=2)
+
+        #same order as x.view(-1, C*H*W) in EEGNet150.forward
+        flattened = second_pooled.transpose(0, 2, 1).reshape(num_windows, -1)
+
+        return _log_softmax(flattened @ self.classifier_weight.T + self.classifier_bias)
+
+    def predict_recording(self, recording, window_starts=None):
+        '''
+        recording: [num_timesteps_in_recording, feature_size], window_starts: start timestep of each window (default: every stride timesteps)
+        returns log-softmax scores [num_windows, num_classes]
+        '''
+
+        recording = np.asarray(recording, dtype=np.float64)
+        if window_starts is None:
+            window_starts = np.arange(0, len(recording) - self.num_timesteps + 1, self.stride)
+        window_starts = np.asarray(window_starts, dtype=np.int64)
+
+        front_end = self._front_end(recording)
+
+        #running mean over pool_size timesteps, pooled position k of the window starting at s is running_mean[s + pool_size*k]
+        cumulative = np.concatenate([np.zeros((1, front_end.shape[1])), np.cumsum(front_end, axis=0)], axis=0)
+        running_mean = (cumulative[self.pool_size:] - cumulative[:-self.pool_size]) / self.pool_size
+
+        pooled_index = window_starts[:, None] + self.pool_size * np.arange(self.num_pooled)[None, :]
+        pooled = running_mean[pooled_index]
+
+        #swap the continuous front-end output for the zero padded one at the window edges
+        interior_starts = window_starts > 0
+        first_position = self._first_position(recording[window_starts], recording[window_starts + 1])
+        pooled[interior_starts, 0] += (first_position[interior_starts] - front_end[window_starts[interior_starts]]) / self.pool_size
+
+        if self.last_position_used:
+            window_ends = window_starts + self.num_timesteps - 1
+            interior_ends = window_ends < len(recording) - 1
+            last_position = self._last_position(recording[window_ends - 1], recording[window_ends])
+            pooled[interior_ends, -1] += (last_position[interior_ends] - front_end[window_ends[interior_ends]]) / self.pool_size
+
+        return self._classify_pooled(pooled)
+
+    def create_stream(self):
+        return _EEGNetStream(self)
+
+
+class _EEGNetStream():
+    '''
+    Streaming state of one subject: the latest raw samples and the front-end outputs computed so far.
+    Each new sample completes the front-end output of the previous timestep (the 'same' padded firstConv needs the right neighbour)
+    '''
+
+    def __init__(self, incremental_model):
+        self.model = incremental_model
+
+        num_timesteps = incremental_model.num_timesteps
+        feature_size = incremental_model.front_weight.shape[1]
+        self.samples = RingBuffer(num_timesteps, feature_size, dtype=np.float64)
+        self.front_end = RingBuffer(num_timesteps, incremental_model.front_weight.shape[0], dtype=np.float64)
+        self.num_samples_seen = 0
+
+    def append(self, sample):
+        self.samples.append(sample)
+        self.num_samples_seen += 1
+
+        if self.num_samples_seen == 1:
+            return
+
+        if self.num_samples_seen == 2:
+            #first timestep of the stream, its left neighbour is padding
+            self.front_end.append(self.model._first_position(*self.samples.latest(2)))
+        else:
+            neighbourhood = self.samples.latest(3)
+            self.front_end.append(_elu(np.tensordot(neighbourhood, self.model.front_weight, axes=([0, 1], [2, 1])) + self.model.front_bias))
+
+    def score_latest(self):
+        '''
+        log-softmax scores of the window made of the latest num_timesteps samples
+        '''
+
+        model = self.model
+        assert self.num_samples_seen >= model.num_timesteps, 'only {} samples seen'.format(self.num_samples_seen)
+
+        #front-end outputs of the window timesteps 0 .. num_pooled*pool_size-1 (the buffer ends one timestep before the latest sample)
+        num_used = model.num_pooled * model.pool_size
+        window_front_end = self.front_end.latest(model.num_timesteps - 1)[:num_used].copy()
+
+        window_samples = self.samples.latest(model.num_timesteps)
+        window_front_end[0] = model._first_position(window_samples[0], window_samples[1])
+        if model.last_position_used:
+            window_front_end = np.concatenate([window_front_end, model._last_position(window_samples[-2], window_samples[-1])[None, :]], axis=0)
+
+        pooled = window_front_end.reshape(model.num_pooled, model.pool_size, -1).mean(axis=1)
+
+        return model._classify_pooled(pooled[None, :, :])[0].astype(np.float32)
+
+
+class IncrementalDeepConvNet150(_IncrementalModel):
+    '''
+    DeepConvNet150 with valid convolutions only, computed once per timestep of the recording.
+
+    Instead of down-sampling, every (1,2) max pooling keeps all timesteps and the following layers are dilated by the accumulated
+    pooling factor ('a trous'), so the output at timestep s of the last layer is exactly the score of the window starting at s.
+    '''
+
+    def __init__(self, model, num_timesteps=150, stride=3):
+        self.num_timesteps = num_timesteps
+        self.stride = stride
+
+        model = model.eval()
+
+        #block1: temporal conv (with bias) + spatial conv + BatchNorm folded into one conv: [25, feature_size, 5]
+        temporal_weight = _conv_weight(model.block1[0])[:, 0, 0, :]
+        temporal_bias = model.block1[0].bias.detach().cpu().double().numpy()
+        spatial_weight = _conv_weight(model.block1[1])[:, :, :, 0]
+        scale, shift = _batchnorm_scale_and_shift(model.block1[2])
+
+        first_weight = scale[:, None, None] * np.einsum('ocf,ck->ofk', spatial_weight, temporal_weight)
+        first_bias = scale * np.einsum('ocf,c->o', spatial_weight, temporal_bias) + shift
+
+        #list of ('conv', weight, bias, dilation, apply_elu) and ('max', pool_size, dilation)
+        self.layers = [('conv', first_weight, first_bias, 1, True)]
+        dilation = self._add_pooling(model.block1[4], 1)
+
+        for block in [model.block2, model.block3, model.block4]:
+            scale, shift = _batchnorm_scale_and_shift(block[2])
+            self.layers.append(('conv', scale[:, None, None] * _conv_weight(block[1])[:, :, 0, :], shift, dilation, True))
+            dilation = self._add_pooling(block[4], dilation)
+
+        classifier_bias = model.classifier[0].bias.detach().cpu().double().numpy()
+        self.layers.append(('conv', _conv_weight(model.classifier[0])[:, :, 0, :], classifier_bias, dilation, False))
+        self.num_classes = len(classifier_bias)
+
+        self.feature_size = first_weight.shape[1]
+        self.receptive_field = 1 + sum(self._layer_span(layer) - 1 for layer in self.layers)
+        assert self.receptive_field <= num_timesteps, 'num_timesteps {} is shorter than the receptive field {}'.format(num_timesteps, self.receptive_field)
+
+    def _add_pooling(self, max_pool, dilation):
+        pool_size = max_pool.kernel_size[1] if isinstance(max_pool.kernel_size, tuple) else max_pool.kernel_size
+        self.layers.append(('max', pool_size, dilation))
+
+        return dilation * pool_size
+
+    @staticmethod
+    def _layer_span(layer):
+        #number of consecutive input timesteps one output timestep depends on
+        if layer[0] == 'conv':
+            return (layer[1].shape[2] - 1) * layer[3] + 1
+        else:
+            return (layer[1] - 1) * layer[2] + 1
+
+    @staticmethod
+    def _apply_layer(layer, x):
+        if layer[0] == 'conv':
+            _, weight, bias, dilation, apply_elu = layer
+            x = _dilated_conv(x, weight, bias, dilation)
+            return _elu(x) if apply_elu else x
+        else:
+            _, pool_size, dilation = layer
+            num_outputs = len(x) - (pool_size - 1) * dilation
+            return np.max([x[i * dilation:i * dilation + num_outputs] for i in range(pool_size)], axis=0)
+
+    def predict_recording(self, recording, window_starts=None):
+        '''
+        recording: [num_timesteps_in_recording, feature_size], window_starts: start timestep of each window (default: every stride timesteps)
+        returns log-softmax scores [num_windows, num_classes]
+        '''
+
+        recording = np.asarray(recording, dtype=np.float64)
+        if window_starts is None:
+            window_starts = np.arange(0, len(recording) - self.num_timesteps + 1, self.stride)
+        window_starts = np.asarray(window_starts, dtype=np.int64)
+
+        x = recording
+        for layer in self.layers:
+            x = self._apply_layer(layer, x)
+
+        return _log_softmax(x[window_starts])
+
+    def create_stream(self):
+        return _DeepConvNetStream(self)
+
+
+class _DeepConvNetStream():
+    '''
+    Streaming state of one subject: one buffer per layer input, holding just the timesteps the next output needs.
+    Every new sample yields one new output timestep per layer once the buffers are filled
+    '''
+
+    def __init__(self, incremental_model):
+        self.model = incremental_model
+
+        self.layer_inputs = []
+        num_channels = incremental_model.feature_size
+        for layer in incremental_model.layers:
+            self.layer_inputs.append(RingBuffer(incremental_model._layer_span(layer), num_channels, dtype=np.float64))
+            if layer[0] == 'conv':
+                num_channels = layer[1].shape[0]
+
+        #scores of the latest windows, the score of a window is complete receptive_field samples after its start
+        self.scores = RingBuffer(incremental_model.num_timesteps - incremental_model.receptive_field + 1, num_channels, dtype=np.float64)
+        self.num_samples_seen = 0
+
+    def append(self, sample):
+        self.num_samples_seen += 1
+
+        x = np.asarray(sample, dtype=np.float64)
+        for layer, layer_input in zip(self.model.layers, self.layer_inputs):
+            layer_input.append(x)
+            if len(layer_input) < layer_input.capacity:
+                return
+
+            x = self.model._apply_layer(layer, layer_input.latest())[0]
+
+        self.scores.append(x)
+
+    def score_latest(self):
+        '''
+        log-softmax scores of the window made of the latest num_timesteps samples
+        '''
+
+        assert self.num_samples_seen >= self.model.num_timesteps, 'only {} samples seen'.format(self.num_samples_seen)
+
+        #the window started num_timesteps - receptive_field samples before the latest completed score
+        return _log_softmax(self.scores.latest()[0]).astype(np.float32)
+
+
+def create_incremental_model(model, num_timesteps=150, stride=3):
+
+    if isinstance(model, models.EEGNet150):
+        return IncrementalEEGNet150(model, num_timesteps, stride)
+
+    elif isinstance(model, models.DeepConvNet150):
+        return IncrementalDeepConvNet150(model, num_timesteps, stride)
+
+    else:
+        raise NameError('not supported model for incremental inference')
@@ -0,0 +1,178 @@
+#pluggable inference backends: score raw chunks [num_chunks, num_timesteps, num_features] with a trained model
+#
+#every backend exposes predict(feature_array) -> scores [num_chunks, num_classes], where the scores are what the experiment scripts already save as 'logits':
+#log-softmax output for EEGNet/DeepConvNet, predict_proba for the sklearn pipelines.
+#
+#this module only imports numpy at the top, so the onnxruntime backend can run in an environment without PyTorch
+
+import time
+import numpy as np
+
+
+class TorchBackend():
+    '''
+    EEGNet150/DeepConvNet150 in PyTorch
+    '''
+
+    def __init__(self, model, device=None, batch_size=None):
+        import torch
+
+        self.torch = torch
+        self.device = device if device is not None else torch.device('cpu')
+        self.model = model.to(self.device).eval()
+        self.batch_size = batch_size
+
+    def predict(self, feature_array):
+        feature_array = np.asarray(feature_array, dtype=np.float32)
+        batch_size = self.batch_size if self.batch_size is not None else max(len(feature_array), 1)
+
+        output_list = []
+        with self.torch.no_grad():
+            for start in range(0, len(feature_array), batch_size):
+                data_batch = self.torch.from_numpy(feature_array[start:start + batch_size]).to(self.device)
+                output_list.append(self.model(data_batch).cpu().numpy())
+
+        return np.concatenate(output_list, axis=0)
+
+
+class SklearnBackend():
+    '''
+    featurize + fitted sklearn classifier (e.g. LogisticRegression, RandomForestClassifier)
+    '''
+
+    def __init__(self, classifier, featurize_function):
+        self.classifier = classifier
+        self.featurize_function = featurize_function
+
+    def predict(self, feature_array):
+        transformed_feature_array = self.featurize_function(feature_array)
+
+        return self.classifier.predict_proba(transformed_feature_array)
+
+
+class CompiledForestBackend():
+    '''
+    featurize + RandomForestClassifier flattened by compiled_forest.py (same probabilities, lower per-call latency)
+    '''
+
+    def __init__(self, compiled_forest, featurize_function):
+        self.compiled_forest = compiled_forest
+        self.featurize_function = featurize_function
+
+    def predict(self, feature_array):
+        transformed_feature_array = self.featurize_function(feature_array)
+
+        return self.compiled_forest.predict_proba(transformed_feature_array)
+
+
+class FusedLogisticRegressionBackend():
+    '''
+    featurize + LogisticRegression (+ CORAL alignment) folded by fused_logistic_regression.py into one scoring function of the raw chunks
+    '''
+
+    def __init__(self, fused_model):
+        self.fused_model = fused_model
+
+    def predict(self, feature_array):
+        return self.fused_model.predict_proba(feature_array)
+
+
+class OnnxRuntimeBackend():
+    '''
+    Model exported by onnx_export.py, run with onnxruntime on CPU
+    '''
+
+    def __init__(self, onnx_path, output_name=None, num_threads=None):
+        import onnxruntime
+
+        session_options = onnxruntime.SessionOptions()
+        if num_threads is not None:
+            session_options.intra_op_num_threads = num_threads
+
+        self.session = onnxruntime.InferenceSession(onnx_path, sess_options=session_options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+        output_names = [output.name for output in self.session.get_outputs()]
+        if output_name is None:
+            #sklearn pipelines have ['label', 'probabilities'], deep models have ['log_probabilities']
+            output_name = 'probabilities' if 'probabilities' in output_names else output_names[0]
+
+        assert output_name in output_names, '{} is not an output of {}'.format(output_name, onnx_path)
+        self.output_name = output_name
+
+    def predict(self, feature_array):
+        feature_array = np.ascontiguousarray(feature_array, dtype=np.float32)
+
+        return self.session.run([self.output_name], {self.input_name: feature_array})[0]
+
+
+class IncrementalBackend():
+    '''
+    EEGNet150/DeepConvNet150 scored with incremental_inference.py: overlapping chunks share one pass of the convolutional front-end.
+    Also provides create_stream for StreamingClassifier
+    '''
+
+    def __init__(self, model, num_timesteps=150, stride=3):
+        from incremental_inference import create_incremental_model
+
+        self.incremental_model = create_incremental_model(model, num_timesteps, stride)
+
+    def predict(self, feature_array):
+        return self.incremental_model.predict(feature_array)
+
+    def create_stream(self):
+        return self.incremental_model.create_stream()
+
+
+BACKENDS = {
+    'torch': TorchBackend,
+    'sklearn': SklearnBackend,
+    'compiled_forest': CompiledForestBackend,
+    'fused_lr': FusedLogisticRegressionBackend,
+    'onnxruntime': OnnxRuntimeBackend,
+    'incremental': IncrementalBackend,
+}
+
+
+def create_backend(backend_name, *args, **kwargs):
+    if backend_name not in BACKENDS:
+        raise NameError('not supported backend {}'.format(backend_name))
+
+    return BACKENDS[backend_name](*args, **kwargs)
+
+
+def eval_backend(backend, feature_array, label_array):
+    '''
+    Same return values as utils.eval_model: accuracy, class_predictions_array, labels_array, probabilities_array
+    '''
+
+    probabilities_array = backend.predict(feature_array)
+    class_predictions_array = probabilities_array.argmax(1)
+    labels_array = np.asarray(label_array)
+    accuracy = (class_predictions_array == labels_array).mean() * 100
+
+    return accuracy, class_predictions_array, labels_array, probabilities_array
+
+
+def check_parity(reference_backend, candidate_backend, feature_array, label_array):
+    '''
+    Score the same chunks with both backends and compare the outputs
+    '''
+
+    reference_start_time = time.time()
+    reference_accuracy, reference_class_predictions, _, reference_probabilities = eval_backend(reference_backend, feature_array, label_array)
+    reference_time = time.time() - reference_start_time
+
+    candidate_start_time = time.time()
+    candidate_accuracy, candidate_class_predictions, _, candidate_probabilities = eval_backend(candidate_backend, feature_array, label_array)
+    candidate_time = time.time() - candidate_start_time
+
+    parity_dict = dict()
+    parity_dict['max_abs_difference'] = float(np.max(np.abs(reference_probabilities - candidate_probabilities)))
+    parity_dict['prediction_agreement'] = float((reference_class_predictions == candidate_class_predictions).mean() * 100)
+    parity_dict['reference_accuracy'] = float(reference_accuracy)
+    parity_dict['candidate_accuracy'] = float(candidate_accuracy)
+    parity_dict['reference_time'] = reference_time
+    parity_dict['candidate_time'] = candidate_time
+
+    return parity_dict
@@ -0,0 +1,68 @@
+#the C grid of the LogisticRegression runners as a regularization path
+#
+#the Cs are fitted in ascending order by one lbfgs LogisticRegression with warm_start=True: each fit starts from the coefficients of the
+#previous (more regularized) C instead of from zero, so the later, weakly regularized fits need a fraction of their cold-start
+#iterations. Every C still converges to the same optimum (up to the solver tolerance), on the same (unstandardized) features
+#
+#given init_model_dict (the path of another train pool, e.g. a bucket of run_MultiBucket.py sharing most of the train subjects), each C
+#starts from whichever of the previous C's coefficients and the other pool's coefficients for the same C has the lower objective on
+#this train set (one matrix product each)
+
+import copy
+import time
+
+import numpy as np
+from scipy.special import logsumexp
+from sklearn.linear_model import LogisticRegression
+
+
+def logistic_regression_objective(coef, intercept, C, train_features, train_labels, classes):
+    '''
+    the lbfgs objective of LogisticRegression(C=C): C * sum of the log losses + 0.5 * ||coef||^2
+    '''
+
+    scores = train_features @ coef.T + intercept
+
+    #binary: one logit for classes[1]
+    if len(classes) == 2:
+        log_losses = np.logaddexp(0, scores[:, 0]) - (train_labels == classes[1]) * scores[:, 0]
+
+    #multinomial
+    else:
+        log_losses = logsumexp(scores, axis=1) - scores[np.arange(len(scores)), np.searchsorted(classes, train_labels)]
+
+    return C * np.sum(log_losses) + 0.5 * np.sum(coef * coef)
+
+
+def fit_logistic_regression_path(train_features, train_labels, Cs, max_iter=10000, random_state=0, init_model_dict=None):
+    '''
+    returns dict C -> LogisticRegression(C=C, solver='lbfgs') fitted on the train features, for each C of Cs
+
+    init_model_dict: dict C -> fitted LogisticRegression to warm start each C from, or None
+    '''
+
+    #validated once for the whole path instead of once per C
+    train_features = np.ascontiguousarray(train_features, dtype=np.float64)
+
+    start_time = time.time()
+
+    path_model = LogisticRegression(random_state=random_state, max_iter=max_iter, solver='lbfgs', warm_start=True)
+
+    model_dict = dict()
+    num_iterations = 0
+    for C in sorted(Cs):
+        path_model.set_params(C=C)
+        if init_model_dict is not None:
+            init_model = init_model_dict[C]
+            classes = init_model.classes_
+            if not hasattr(path_model, 'coef_') or logistic_regression_objective(init_model.coef_, init_model.intercept_, C, train_features, train_labels, classes) < logistic_regression_objective(path_model.coef_, path_model.intercept_, C, train_features, train_labels, classes):
+                path_model.coef_ = init_model.coef_.copy()
+                path_model.intercept_ = init_model.intercept_.copy()
+        path_model.fit(train_features, train_labels)
+
+        num_iterations += int(np.max(path_model.n_iter_))
+        model_dict[C] = copy.deepcopy(path_model)
+
+    print('logistic regression path{}: {} Cs, {} lbfgs iterations in {} seconds'.format('' if init_model_dict is None else ' (warm started)', len(model_dict), num_iterations, round(time.time() - start_time, 3)), flush=True)
+
+    return model_dict
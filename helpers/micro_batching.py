@@ -0,0 +1,175 @@
+#micro-batching for serving many concurrent sessions: single-window requests are queued, coalesced into batches
+#(up to max_batch_size requests, or whatever arrived within max_wait seconds of the first one), scored with one predict call
+#per model and the scores handed back to each caller through a concurrent.futures.Future
+#
+#the request queue is bounded: when it is full, submit raises queue.Full right away (back-pressure), the server turns that into an 'overloaded' reply
+
+import time
+import queue
+import threading
+import collections
+from concurrent.futures import Future
+
+import numpy as np
+
+from streaming import LatencyRecorder
+
+
+class ServingStats():
+    '''
+    Request/batch counters and latencies of a MicroBatcher
+    '''
+
+    def __init__(self, max_latency_records=100000):
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+
+        self.num_requests = 0
+        self.num_rejected = 0
+        self.num_errors = 0
+        self.num_batches = 0
+        self.num_predict_calls = 0
+        self.max_batch_size_seen = 0
+
+        self.queue_wait = LatencyRecorder(max_latency_records)
+        self.request_latency = LatencyRecorder(max_latency_records)
+
+    def summary(self):
+        with self.lock:
+            elapsed = time.time() - self.start_time
+            num_completed = self.num_requests - self.num_errors
+
+            summary_dict = dict()
+            summary_dict['num_requests'] = self.num_requests
+            summary_dict['num_rejected'] = self.num_rejected
+            summary_dict['num_errors'] = self.num_errors
+            summary_dict['num_batches'] = self.num_batches
+            summary_dict['num_predict_calls'] = self.num_predict_calls
+            summary_dict['mean_batch_size'] = self.num_requests / self.num_batches if self.num_batches > 0 else 0
+            summary_dict['max_batch_size'] = self.max_batch_size_seen
+            summary_dict['throughput_per_sec'] = num_completed / elapsed if elapsed > 0 else 0
+            summary_dict['queue_wait'] = self.queue_wait.summary()
+            summary_dict['request_latency'] = self.request_latency.summary()
+
+        return summary_dict
+
+
+class MicroBatcher():
+    '''
+    One worker thread draining a bounded request queue.
+    model_cache: anything with get(model_key) -> backend with predict(feature_array), e.g. model_registry.ModelRegistry
+    window_shape: (num_timesteps, num_features) every window must have, checked at submit so one malformed window cannot fail the
+    requests batched with it; None: not checked
+    '''
+
+    def __init__(self, model_cache, max_batch_size=32, max_wait=0.005, max_queue_size=1024, window_shape=None):
+        self.model_cache = model_cache
+        self.window_shape = None if window_shape is None else tuple(window_shape)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self.request_queue = queue.Queue(maxsize=max_queue_size)
+        self.stats = ServingStats()
+        self.worker = threading.Thread(target=self._serve, daemon=True)
+
+    def start(self):
+        self.worker.start()
+
+        return self
+
+    def stop(self):
+        #blocks until the requests queued so far are served
+        self.request_queue.put(None)
+        self.worker.join()
+
+    def submit(self, model_key, window):
+        '''
+        queue one window [num_timesteps, num_features]; returns a Future of its scores, raises ValueError for a window of the wrong
+        shape and queue.Full when overloaded
+        '''
+
+        window = np.asarray(window, dtype=np.float32)
+        if self.window_shape is not None and window.shape != self.window_shape:
+            raise ValueError('window shape {}, expected {}'.format(window.shape, self.window_shape))
+
+        future = Future()
+
+        try:
+            self.request_queue.put_nowait((model_key, window, future, time.perf_counter()))
+        except queue.Full:
+            with self.stats.lock:
+                self.stats.num_rejected += 1
+            raise
+
+        return future
+
+    def predict(self, model_key, window, timeout=None):
+        return self.submit(model_key, window).result(timeout)
+
+    def _collect_batch(self):
+        request = self.request_queue.get()
+        if request is None:
+            return None, True
+
+        batch = [request]
+        deadline = time.perf_counter() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+
+            try:
+                if remaining > 0:
+                    request = self.request_queue.get(timeout=remaining)
+                else:
+                    request = self.request_queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if request is None:
+                return batch, True
+
+            batch.append(request)
+
+        return batch, False
+
+    def _run_batch(self, batch):
+        dequeue_time = time.perf_counter()
+
+        #one predict call per model, requests of the same model keep their order
+        requests_by_model = collections.OrderedDict()
+        for request in batch:
+            requests_by_model.setdefault(request[0], []).append(request)
+
+        num_errors = 0
+        for model_key, model_requests in requests_by_model.items():
+            try:
+                backend = self.model_cache.get(model_key)
+                scores = backend.predict(np.stack([request[1] for request in model_requests]))
+            except Exception as exception:
+                num_errors += len(model_requests)
+                for request in model_requests:
+                    request[2].set_exception(exception)
+                continue
+
+            for request, request_scores in zip(model_requests, scores):
+                request[2].set_result(request_scores)
+
+        finish_time = time.perf_counter()
+
+        with self.stats.lock:
+            self.stats.num_requests += len(batch)
+            self.stats.num_errors += num_errors
+            self.stats.num_batches += 1
+            self.stats.num_predict_calls += len(requests_by_model)
+            self.stats.max_batch_size_seen = max(self.stats.max_batch_size_seen, len(batch))
+
+            for request in batch:
+                self.stats.queue_wait.update(dequeue_time - request[3])
+                self.stats.request_latency.update(finish_time - request[3])
+
+    def _serve(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._collect_batch()
+            if batch:
+                self._run_batch(batch)
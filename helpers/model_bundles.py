@@ -0,0 +1,121 @@
+#fitted sklearn pipelines saved next to their results, so scoring jobs load them instead of refitting
+#
+#a bundle is <subject>/<experiment_name>/checkpoint/model_bundle.joblib, a dict with
+#   format_version      BUNDLE_FORMAT_VERSION, checked at load
+#   classifier          the fitted LogisticRegression/RandomForestClassifier, or None if it is in another bundle:
+#   classifier_bundle   path (relative to this bundle's folder) of the bundle holding the classifier, or None
+#   featurizer_config   how the raw chunks were featurized (featurizer_config below)
+#   alignment_matrix    CORAL matrix applied to the featurized test chunks before the classifier (target-side CORAL), or None
+#   train_fingerprint   sha256 of the featurized train set and labels the classifier was fitted on
+#   extra               anything else the runner wants to keep (e.g. the CORAL mode)
+#
+#it is written uncompressed, so joblib.load(mmap_mode='r') maps its numpy arrays (coefficients, CORAL matrices, ...) straight from
+#the file instead of reading and copying them (sklearn's trees still copy their node arrays into their own buffers when unpickled)
+#
+#a generic model serves every test subject of its bucket: the runners write it in the first test subject's bundle and the other
+#subjects' bundles refer to that one (classifier_bundle), so a bucket stores one copy of each forest. Bundles referring to the same
+#classifier share one loaded copy of it while any of them is alive
+
+import os
+import hashlib
+import threading
+import weakref
+
+import numpy as np
+import joblib
+
+BUNDLE_FORMAT_VERSION = 2
+#format 1: no classifier_bundle
+SUPPORTED_BUNDLE_FORMAT_VERSIONS = [1, 2]
+BUNDLE_FILENAME = 'model_bundle.joblib'
+
+#order of the 32 features returned by utils.featurize: per-column statistics of the 8 fNIRS columns, one block per statistic
+FEATURE_ORDER = ['mean', 'std', 'slope', 'intercept']
+
+
+def featurizer_config(classification_task, window_size, num_columns=8):
+    return {'function': 'utils.featurize', 'classification_task': classification_task, 'window_size': window_size, 'num_columns': num_columns, 'feature_order': FEATURE_ORDER}
+
+
+def data_fingerprint(*arrays):
+    '''
+    sha256 of the shapes, dtypes and bytes of the arrays
+    '''
+
+    fingerprint = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        fingerprint.update('{}{}'.format(array.shape, array.dtype.str).encode())
+        fingerprint.update(array.data)
+
+    return fingerprint.hexdigest()
+
+
+def save_model_bundle(checkpointdir, classifier, featurizer_config, train_fingerprint, alignment_matrix=None, extra=None, filename=BUNDLE_FILENAME, classifier_bundle_path=None):
+    '''
+    classifier_bundle_path: an already saved bundle holding the same classifier, which this bundle then refers to instead of storing
+    another copy. Returns the path of the bundle
+    '''
+
+    bundle = dict()
+    bundle['format_version'] = BUNDLE_FORMAT_VERSION
+    bundle['classifier'] = classifier if classifier_bundle_path is None else None
+    bundle['classifier_bundle'] = None if classifier_bundle_path is None else os.path.relpath(classifier_bundle_path, checkpointdir)
+    bundle['featurizer_config'] = featurizer_config
+    bundle['alignment_matrix'] = None if alignment_matrix is None else np.ascontiguousarray(alignment_matrix)
+    bundle['train_fingerprint'] = train_fingerprint
+    bundle['extra'] = dict() if extra is None else extra
+
+    path = os.path.join(checkpointdir, filename)
+    joblib.dump(bundle, path)
+
+    return path
+
+
+_shared_classifiers = weakref.WeakValueDictionary()
+_shared_classifiers_lock = threading.Lock()
+
+
+def _load_shared_classifier(path, mmap_mode):
+    key = (os.path.realpath(path), mmap_mode)
+
+    with _shared_classifiers_lock:
+        classifier = _shared_classifiers.get(key)
+        if classifier is None:
+            classifier = load_model_bundle(path, mmap_mode=mmap_mode)['classifier']
+            _shared_classifiers[key] = classifier
+
+    return classifier
+
+
+def load_model_bundle(path, mmap_mode='r', expected_featurizer_config=None):
+    bundle = joblib.load(path, mmap_mode=mmap_mode)
+
+    if bundle.get('format_version') not in SUPPORTED_BUNDLE_FORMAT_VERSIONS:
+        raise ValueError('{} has bundle format {}, expected one of {}'.format(path, bundle.get('format_version'), SUPPORTED_BUNDLE_FORMAT_VERSIONS))
+
+    if bundle.get('classifier_bundle') is not None:
+        bundle['classifier'] = _load_shared_classifier(os.path.join(os.path.dirname(path), bundle['classifier_bundle']), mmap_mode)
+
+    if expected_featurizer_config is not None:
+        for key, value in expected_featurizer_config.items():
+            if bundle['featurizer_config'].get(key) != value:
+                raise ValueError('{} was featurized with {}={}, expected {}'.format(path, key, bundle['featurizer_config'].get(key), value))
+
+    return bundle
+
+
+def bundle_featurize_function(bundle):
+    '''
+    raw chunks [num_chunks, window_size, 8] -> the features the bundle's classifier expects (featurize, then the CORAL alignment if any)
+    '''
+
+    from utils import featurize
+
+    classification_task = bundle['featurizer_config']['classification_task']
+    alignment_matrix = bundle['alignment_matrix']
+
+    if alignment_matrix is None:
+        return lambda feature_array: featurize(feature_array, classification_task)
+
+    return lambda feature_array: featurize(feature_array, classification_task) @ alignment_matrix
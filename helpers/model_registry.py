@@ -0,0 +1,156 @@
+#registry of per-subject checkpoints for serving: indexes the best checkpoint of every subject from the hypersearch summaries
+#(written by synthesizing_results/*/synthesize_hypersearch_*_for_a_subject.py), loads models lazily and keeps a bounded LRU of live models
+
+import os
+import time
+import threading
+import collections
+
+import pandas as pd
+import torch
+
+from streaming import LatencyRecorder
+
+
+def index_best_checkpoints(experiment_dir, experiment_name=None, checkpoint_filename='best_model.statedict'):
+    '''
+    Find <subject>/<experiment>/checkpoint/<checkpoint_filename> for every subject folder below experiment_dir
+    (a bucket folder of generic_models/generic_finetuning_models, or the subject_specific_models folder, or any folder above them).
+
+    experiment_name None: per subject, the experiment with the highest validation accuracy in hypersearch_summary/hypersearch_summary.csv
+    (same selection as synthesize_all_subjects.py); otherwise: that experiment for every subject that has it
+
+    returns dict subject_id -> {'checkpoint_path', 'experiment_name', 'validation_accuracy'}
+    '''
+
+    checkpoint_index = dict()
+
+    for dirpath, dirnames, filenames in os.walk(experiment_dir):
+        if experiment_name is not None:
+            checkpoint_path = os.path.join(dirpath, experiment_name, 'checkpoint', checkpoint_filename)
+            if experiment_name not in dirnames or not os.path.exists(checkpoint_path):
+                continue
+
+            subject_dir = dirpath
+            selected_experiment_name = experiment_name
+            validation_accuracy = float('nan')
+
+        else:
+            if os.path.basename(dirpath) != 'hypersearch_summary' or 'hypersearch_summary.csv' not in filenames:
+                continue
+
+            summary_df = pd.read_csv(os.path.join(dirpath, 'hypersearch_summary.csv'))
+            summary_df = summary_df[summary_df.status == 'Completed']
+            if len(summary_df) == 0:
+                continue
+
+            selected_setting = summary_df.sort_values(by=['validation_accuracy'], ascending=False).iloc[0]
+
+            #experiment_folder is an absolute path from the machine that ran the synthesizer, only its last part is used
+            subject_dir = os.path.dirname(dirpath)
+            selected_experiment_name = os.path.basename(os.path.normpath(selected_setting.experiment_folder))
+            checkpoint_path = os.path.join(subject_dir, selected_experiment_name, 'checkpoint', checkpoint_filename)
+            validation_accuracy = float(selected_setting.validation_accuracy)
+
+        subject_id = os.path.basename(os.path.normpath(subject_dir))
+        if subject_id in checkpoint_index:
+            print('subject {} is indexed twice, keeping {}'.format(subject_id, checkpoint_index[subject_id]['checkpoint_path']), flush=True)
+            continue
+
+        checkpoint_index[subject_id] = {'checkpoint_path': checkpoint_path, 'experiment_name': selected_experiment_name, 'validation_accuracy': validation_accuracy}
+
+    if len(checkpoint_index) == 0:
+        raise NameError('no checkpoint found below {} (run the hypersearch synthesizers first, or pass experiment_name)'.format(experiment_dir))
+
+    return checkpoint_index
+
+
+def load_state_dict(checkpoint_path):
+    '''
+    torch.load memory-mapping the checkpoint where the installed torch supports it (mmap needs torch>=2.1 and a zipfile-format checkpoint)
+    '''
+
+    try:
+        return torch.load(checkpoint_path, map_location=torch.device('cpu'), mmap=True, weights_only=True)
+    except (TypeError, RuntimeError):
+        return torch.load(checkpoint_path, map_location=torch.device('cpu'))
+
+
+class ModelRegistry():
+    '''
+    Bounded LRU of live models, with the get(key) interface micro_batching.MicroBatcher expects of its model_cache.
+    load_function(subject_id, checkpoint_path) returns the backend to serve for that subject.
+    Concurrent requests for a subject that is being loaded wait for that load instead of loading it again
+    '''
+
+    def __init__(self, checkpoint_index, load_function, max_models=8, max_latency_records=100000):
+        self.checkpoint_index = checkpoint_index
+        self.load_function = load_function
+        self.max_models = max_models
+
+        self.models = collections.OrderedDict()
+        self.loading = dict()
+        self.lock = threading.Lock()
+
+        self.num_hits = 0
+        self.num_misses = 0
+        self.num_evictions = 0
+        self.load_latency = LatencyRecorder(max_latency_records)
+
+    def get(self, subject_id):
+        while True:
+            with self.lock:
+                if subject_id in self.models:
+                    self.num_hits += 1
+                    self.models.move_to_end(subject_id)
+                    return self.models[subject_id]
+
+                if subject_id not in self.checkpoint_index:
+                    raise KeyError('subject {} has no indexed checkpoint'.format(subject_id))
+
+                loading_event = self.loading.get(subject_id)
+                if loading_event is None:
+                    self.num_misses += 1
+                    loading_event = self.loading[subject_id] = threading.Event()
+                    break
+
+            #another thread is loading this subject
+            loading_event.wait()
+
+        try:
+            load_start_time = time.perf_counter()
+            backend = self.load_function(subject_id, self.checkpoint_index[subject_id]['checkpoint_path'])
+            load_time = time.perf_counter() - load_start_time
+
+            with self.lock:
+                self.load_latency.update(load_time)
+                self.models[subject_id] = backend
+                while len(self.models) > self.max_models:
+                    self.models.popitem(last=False)
+                    self.num_evictions += 1
+        finally:
+            with self.lock:
+                del self.loading[subject_id]
+            loading_event.set()
+
+        return backend
+
+    def prefetch(self, subject_ids):
+        for subject_id in subject_ids:
+            self.get(subject_id)
+
+    def summary(self):
+        with self.lock:
+            num_lookups = self.num_hits + self.num_misses
+
+            summary_dict = dict()
+            summary_dict['num_indexed'] = len(self.checkpoint_index)
+            summary_dict['num_models'] = len(self.models)
+            summary_dict['max_models'] = self.max_models
+            summary_dict['num_hits'] = self.num_hits
+            summary_dict['num_misses'] = self.num_misses
+            summary_dict['num_evictions'] = self.num_evictions
+            summary_dict['hit_rate'] = self.num_hits / num_lookups if num_lookups > 0 else 0
+            summary_dict['load_latency'] = self.load_latency.summary()
+
+        return summary_dict
@@ -81,6 +81,19 @@ class EEGNet150(nn.Module):
 
         return normalized_probabilities #for EEGNet and DeepConvNet, directly use nn.NLLLoss() as criterion
     
+    #forward split in two, for training only the classifier on top of a frozen backbone: forward(x) == classify(embed(x))
+    def embed(self, x):
+        x = self.firstConv(x.unsqueeze(1).transpose(2,3))
+        x = self.depthwiseConv(x)
+        x = self.separableConv(x)
+        
+        return x.view(-1, x.size(1) * x.size(2) * x.size(3))
+    
+    def classify(self, embedding):
+        x = self.classifier(embedding)
+        
+        return F.log_softmax(x, dim = 1)
+    
 
 
 
@@ -137,9 +150,25 @@ class DeepConvNet150(nn.Module):
         x = self.block4(x)
         x = self.classifier(x)
         x = x.squeeze(dim=2).squeeze(dim=2)
-        print(x.shape)
+        # print(x.shape)
         normalized_probabilities = F.log_softmax(x, dim = 1)     
 
         return normalized_probabilities #for EEGNet and DeepConvNet, directly use nn.NLLLoss() as criterion
     
+    #forward split in two, for training only the classifier on top of a frozen backbone: forward(x) == classify(embed(x))
+    def embed(self, x):
+        x = self.block1(x.unsqueeze(1).transpose(2,3))
+        x = self.block2(x)
+        x = self.block3(x)
+        x = self.block4(x)
+        
+        return x.view(x.size(0), -1)
+    
+    def classify(self, embedding):
+        #the classifier conv spans the whole block4 output, so it is a linear layer on the flattened embedding
+        x = self.classifier(embedding.view(embedding.size(0), self.classifier[0].in_channels, 1, -1))
+        x = x.squeeze(dim=2).squeeze(dim=2)
+        
+        return F.log_softmax(x, dim = 1)
+    
     
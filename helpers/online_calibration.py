@@ -0,0 +1,67 @@
+#online calibration of a subject-specific Logistic Regression in a live session (run_OnlineLogisticRegression.py): the labeled
+#calibration windows are featurized with utils.featurize as they arrive and each batch is one partial_fit step of an SGD logistic
+#regression, so the classifier can score from the first update on instead of after the whole first half of the session.
+#
+#only O(num_features) state is kept: the running mean/variance of the features (StandardScaler.partial_fit) and the coefficients,
+#the calibration windows themselves are dropped after their update
+
+import numpy as np
+import sklearn
+
+from sklearn.linear_model import SGDClassifier
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+#the logistic loss of SGDClassifier was renamed from 'log' to 'log_loss' in sklearn 1.1
+LOG_LOSS = 'log_loss' if tuple(int(v) for v in sklearn.__version__.split('.')[:2]) >= (1, 1) else 'log'
+
+
+class OnlineLogisticRegression():
+    '''
+    SGD logistic regression on standardized features, updated batch by batch
+
+    partial_fit first updates the running feature scaling with the batch, then makes passes_per_update SGD passes over the scaled batch.
+    is_ready is False until a window of every class has been seen, predictions before that are not meaningful
+    '''
+
+    def __init__(self, classes=(0, 1), alpha=1e-4, passes_per_update=1, average=False, random_state=0):
+        self.classes = np.array(classes)
+        self.passes_per_update = passes_per_update
+
+        self.scaler = StandardScaler()
+        self.classifier = SGDClassifier(loss=LOG_LOSS, alpha=alpha, average=average, random_state=random_state)
+
+        self.num_windows_seen = 0
+        self.class_counts = np.zeros(len(self.classes), dtype=int)
+
+    @property
+    def is_ready(self):
+        return bool((self.class_counts > 0).all())
+
+    def partial_fit(self, X, y):
+        X = np.atleast_2d(X)
+        if len(X) == 0:
+            return self
+
+        self.scaler.partial_fit(X)
+        X_scaled = self.scaler.transform(X)
+        for _ in range(self.passes_per_update):
+            self.classifier.partial_fit(X_scaled, y, classes=self.classes)
+
+        self.num_windows_seen += len(X)
+        self.class_counts += (np.asarray(y)[:, None] == self.classes[None]).sum(0)
+
+        return self
+
+    def predict_proba(self, X):
+        return self.classifier.predict_proba(self.scaler.transform(X))
+
+    def score(self, X, y):
+        return (self.classes[self.predict_proba(X).argmax(1)] == y).mean()
+
+    def pipeline(self):
+        '''
+        the fitted scaler and classifier as one sklearn pipeline on the featurized windows, to be saved as a model bundle
+        '''
+
+        return make_pipeline(self.scaler, self.classifier)
@@ -0,0 +1,119 @@
+#export trained models to ONNX, so they can be scored with onnxruntime (see inference_backends.py) without PyTorch
+
+import io
+import copy
+import types
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+import models
+
+
+class FeaturizeModule(nn.Module):
+    '''
+    Torch version of utils.featurize: column means, stds, slopes and intercepts of each chunk (32 features for 8 channels).
+    Only used to put the featurization into the exported ONNX graph of the LR/RF pipelines.
+    '''
+
+    def __init__(self, num_timesteps=150):
+        super(FeaturizeModule, self).__init__()
+
+        tvec_T = np.linspace(0, 1, num_timesteps)
+        tdiff_T = tvec_T - np.mean(tvec_T)
+
+        self.register_buffer('tdiff', torch.tensor(tdiff_T, dtype=torch.float64).view(1, -1, 1))
+        self.tdiff_square_sum = float(np.sum(np.square(tdiff_T)))
+        self.tvec_mean = float(np.mean(tvec_T))
+
+    def forward(self, x):
+        #x: [batch_size, num_timesteps, num_features]
+        x = x.double()
+        column_means = x.mean(dim=1)
+        centered = x - column_means.unsqueeze(1)
+        column_stds = torch.sqrt((centered * centered).mean(dim=1))
+        column_slopes = (centered * self.tdiff).sum(dim=1) / self.tdiff_square_sum
+        column_intercepts = column_means - column_slopes * self.tvec_mean
+
+        return torch.cat([column_means, column_stds, column_slopes, column_intercepts], dim=1).float()
+
+
+def strip_weight_constraints(model):
+    '''
+    Return a copy of the model in eval mode where every Conv2dWithConstraint is a plain convolution with its max-norm already applied
+    (torch.renorm has no ONNX equivalent, and the constraint is a no-op at inference time anyway)
+    '''
+
+    model = copy.deepcopy(model).cpu().eval()
+
+    for module in model.modules():
+        if isinstance(module, models.Conv2dWithConstraint):
+            module.weight.data = torch.renorm(module.weight.data, p=2, dim=0, maxnorm=module.max_norm)
+            module.forward = types.MethodType(nn.Conv2d.forward, module)
+
+    return model
+
+
+def _export_module(module, num_timesteps, feature_size, output_name, opset_version, f):
+    dummy_input = torch.zeros(1, num_timesteps, feature_size, dtype=torch.float32)
+
+    torch.onnx.export(module, dummy_input, f, input_names=['window'], output_names=[output_name],
+                      dynamic_axes={'window': {0: 'batch_size'}, output_name: {0: 'batch_size'}}, opset_version=opset_version)
+
+
+def export_deep_model_to_onnx(model, onnx_path, num_timesteps=150, feature_size=8, opset_version=11):
+    '''
+    Export EEGNet150/DeepConvNet150.
+    The graph takes 'window' [batch_size, num_timesteps, feature_size] float32 and returns 'log_probabilities', same as model.forward
+    '''
+
+    export_model = strip_weight_constraints(model)
+
+    with torch.no_grad():
+        _export_module(export_model, num_timesteps, feature_size, 'log_probabilities', opset_version, onnx_path)
+
+    return onnx_path
+
+
+def export_sklearn_pipeline_to_onnx(classifier, onnx_path, num_timesteps=150, feature_size=8, opset_version=11):
+    '''
+    Export featurize + fitted sklearn classifier (LogisticRegression or RandomForestClassifier) as one graph.
+    The graph takes 'window' [batch_size, num_timesteps, feature_size] float32 and returns 'label' and 'probabilities' (same as predict_proba)
+
+    needs onnx (>=1.11, for onnx.compose) and skl2onnx, which are only imported here
+    '''
+
+    import onnx
+    import onnx.compose
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import FloatTensorType
+
+    #featurization part
+    featurize_buffer = io.BytesIO()
+    with torch.no_grad():
+        _export_module(FeaturizeModule(num_timesteps).eval(), num_timesteps, feature_size, 'features', opset_version, featurize_buffer)
+    featurize_onnx = onnx.load_from_string(featurize_buffer.getvalue())
+
+    #classifier part, converted with the same default opset the featurization graph ended up with (merge_models requires it)
+    featurize_opset_version = [opset.version for opset in featurize_onnx.opset_import if opset.domain in ('', 'ai.onnx')][0]
+    num_transformed_features = 4 * feature_size
+    classifier_onnx = convert_sklearn(classifier, initial_types=[('features', FloatTensorType([None, num_transformed_features]))],
+                                      options={id(classifier): {'zipmap': False}}, target_opset={'': featurize_opset_version, 'ai.onnx.ml': 1})
+    classifier_onnx.ir_version = featurize_onnx.ir_version
+
+    pipeline_onnx = onnx.compose.merge_models(featurize_onnx, classifier_onnx, io_map=[('features', 'features')], prefix2='classifier_')
+
+    #keep the public output names of the classifier
+    for output in pipeline_onnx.graph.output:
+        original_name = output.name
+        if original_name.startswith('classifier_'):
+            public_name = original_name[len('classifier_'):]
+            for node in pipeline_onnx.graph.node:
+                node.input[:] = [public_name if name == original_name else name for name in node.input]
+                node.output[:] = [public_name if name == original_name else name for name in node.output]
+            output.name = public_name
+
+    onnx.save(pipeline_onnx, onnx_path)
+
+    return onnx_path
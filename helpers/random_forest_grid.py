@@ -0,0 +1,92 @@
+#the 12-setting random forest grid of the RF runners, fitted in parallel
+#
+#the featurized arrays are dumped once to memory-mapped files that every worker opens read-only (instead of each worker receiving a
+#pickled copy), one forest is fitted per worker with n_jobs = cpu_budget // num_workers, and each forest calls predict_proba once per
+#evaluation set: the accuracies are derived from those probabilities instead of calling model.score and model.predict_proba separately
+
+import os
+import time
+import shutil
+import tempfile
+
+import numpy as np
+import joblib
+from joblib import Parallel, delayed
+from sklearn.ensemble import RandomForestClassifier as rfc
+
+
+def random_forest_hyper_settings(max_features_list=[0.166, 0.333, 0.667, 0.1], min_samples_leaf_list=[4, 16, 64]):
+    '''
+    [(experiment_name, rfc keyword arguments)], in the order of the RF runners' nested loops
+    '''
+
+    return [('MaxFeatures{}_MinSamplesLeaf{}'.format(max_features, min_samples_leaf), dict(max_features=max_features, min_samples_leaf=min_samples_leaf)) for max_features in max_features_list for min_samples_leaf in min_samples_leaf_list]
+
+
+def accuracy_from_probabilities(classes, probabilities, labels):
+    #same as model.score: model.predict is classes[argmax of predict_proba]
+    return (classes[probabilities.argmax(1)] == labels).mean() * 100
+
+
+def _fit_one_setting(experiment_name, hyper_setting, random_state, train_features, train_labels, eval_features_dict, n_jobs_per_forest, return_model):
+    start_time = time.time()
+
+    model = rfc(n_jobs=n_jobs_per_forest, random_state=random_state, **hyper_setting).fit(train_features, train_labels)
+    fit_time = time.time() - start_time
+
+    probabilities_dict = dict()
+    inference_time_dict = dict()
+    for eval_name, eval_features in eval_features_dict.items():
+        inference_start_time = time.time()
+        probabilities_dict[eval_name] = model.predict_proba(eval_features)
+        inference_time_dict[eval_name] = time.time() - inference_start_time
+
+    return experiment_name, model.classes_, probabilities_dict, fit_time, inference_time_dict, model if return_model else None
+
+
+def run_random_forest_grid(train_features, train_labels, eval_features_dict, hyper_settings=None, num_workers=0, cpu_budget=0, return_models=False):
+    '''
+    fit one forest per hyper setting, in parallel, and predict_proba every evaluation set (e.g. {'val': ..., '86': ...}) once per forest
+
+    num_workers 0: one worker per hyper setting up to the cpu budget; cpu_budget 0: all cpus
+
+    returns dict experiment_name -> {'classes', 'probabilities': {eval_name: predict_proba}, 'fit_time', 'inference_time': {eval_name: seconds},
+                                     'model' (if return_models)}
+    '''
+
+    if hyper_settings is None:
+        hyper_settings = random_forest_hyper_settings()
+
+    if cpu_budget <= 0:
+        cpu_budget = os.cpu_count()
+    if num_workers <= 0:
+        num_workers = min(len(hyper_settings), cpu_budget)
+    n_jobs_per_forest = max(1, cpu_budget // num_workers)
+
+    #the workers do not share the global numpy RNG that seed_everything seeded: draw one seed per forest here, so the grid is
+    #reproducible whatever num_workers is
+    random_states = np.random.randint(np.iinfo(np.int32).max, size=len(hyper_settings))
+
+    memmap_dir = tempfile.mkdtemp(prefix='random_forest_grid_')
+    try:
+        #float32: the dtype the forests use internally, so the workers do not convert (copy) the memory-mapped arrays
+        def memmap(name, array):
+            filename = os.path.join(memmap_dir, '{}.joblib'.format(name))
+            joblib.dump(np.ascontiguousarray(array, dtype=np.float32), filename)
+            return joblib.load(filename, mmap_mode='r')
+
+        train_features = memmap('train', train_features)
+        eval_features_dict = {eval_name: memmap('eval_{}'.format(eval_index), eval_features) for eval_index, (eval_name, eval_features) in enumerate(eval_features_dict.items())}
+
+        results = Parallel(n_jobs=num_workers)(delayed(_fit_one_setting)(experiment_name, hyper_setting, random_state, train_features, train_labels, eval_features_dict, n_jobs_per_forest, return_models) for (experiment_name, hyper_setting), random_state in zip(hyper_settings, random_states))
+
+    finally:
+        shutil.rmtree(memmap_dir, ignore_errors=True)
+
+    grid_results = dict()
+    for experiment_name, classes, probabilities_dict, fit_time, inference_time_dict, model in results:
+        grid_results[experiment_name] = {'classes': classes, 'probabilities': probabilities_dict, 'fit_time': fit_time, 'inference_time': inference_time_dict, 'model': model}
+
+    print('random forest grid: {} settings on {} workers x {} threads, slowest forest {} seconds'.format(len(hyper_settings), num_workers, n_jobs_per_forest, round(max(result['fit_time'] for result in grid_results.values()), 2)), flush=True)
+
+    return grid_results
@@ -0,0 +1,89 @@
+#bounded, stratified replay buffer of a generic pool, for updating a generic model when new subjects are enrolled (run_IncrementalUpdate.py)
+#
+#the buffer keeps at most replay_size raw chunks of the pool, the same number from every (subject, class) cell, with the number of chunks
+#each cell has in the pool: the replayed chunks of a cell can then be weighted by cell_count / replayed chunks of the cell, so the
+#replay sample stands for the whole pool in a weighted loss. It is saved next to the updated model, and the next enrollment replays it
+#instead of re-reading the pool's csv files
+
+import numpy as np
+
+
+class ReplayBuffer():
+    '''
+    feature_array [num_replayed, window_size, 8], label_array [num_replayed], subject_array [num_replayed] of the replayed chunks, and
+    cell_counts: dict (subject, label) -> number of chunks of the cell in the pool
+    '''
+
+    def __init__(self, feature_array, label_array, subject_array, cell_counts):
+        self.feature_array = feature_array
+        self.label_array = label_array
+        self.subject_array = subject_array
+        self.cell_counts = cell_counts
+
+    @property
+    def subjects(self):
+        return sorted(set(subject for subject, _ in self.cell_counts.keys()), key=int)
+
+    def sample_weights(self):
+        '''
+        weight of every replayed chunk: chunks of its cell in the pool / replayed chunks of its cell
+        '''
+
+        weights = np.zeros(len(self.label_array))
+        for (subject, label), cell_count in self.cell_counts.items():
+            cell_mask = (self.subject_array == subject) & (self.label_array == label)
+            weights[cell_mask] = cell_count / cell_mask.sum()
+
+        return weights
+
+    def save(self, path):
+        cell_keys = list(self.cell_counts.keys())
+        np.savez(path, feature_array=self.feature_array, label_array=self.label_array, subject_array=self.subject_array, cell_subjects=np.array([subject for subject, _ in cell_keys]), cell_labels=np.array([label for _, label in cell_keys]), cell_counts=np.array([self.cell_counts[key] for key in cell_keys]))
+
+
+def load_replay_buffer(path):
+    arrays = np.load(path)
+    cell_counts = {(str(subject), label.item()): int(count) for subject, label, count in zip(arrays['cell_subjects'], arrays['cell_labels'], arrays['cell_counts'])}
+
+    return ReplayBuffer(arrays['feature_array'], arrays['label_array'], arrays['subject_array'].astype(str), cell_counts)
+
+
+def build_replay_buffer(feature_array, label_array, subject_array, replay_size, random_state=0, cell_counts=None):
+    '''
+    stratified sample of at most replay_size chunks: replay_size // num_cells chunks per (subject, class) cell (all of a smaller cell), the
+    remaining replay_size % num_cells chunks go one each to randomly drawn cells. With more cells than replay_size some cells get no chunk
+
+    cell_counts: pool size of every cell if the chunks are already a sample of the pool (an older buffer), None: counted from the chunks
+    '''
+
+    subject_array = np.asarray(subject_array).astype(str)
+    rng = np.random.RandomState(random_state)
+
+    cells = sorted(set(zip(subject_array, label_array.tolist())), key=lambda cell: (int(cell[0]), cell[1]))
+    cell_quotas = np.full(len(cells), replay_size // len(cells))
+    cell_quotas[rng.permutation(len(cells))[:replay_size % len(cells)]] += 1
+
+    replay_indices = []
+    new_cell_counts = dict()
+    for (subject, label), cell_quota in zip(cells, cell_quotas):
+        cell_indices = np.flatnonzero((subject_array == subject) & (label_array == label))
+        replay_indices.append(np.sort(rng.choice(cell_indices, size=min(cell_quota, len(cell_indices)), replace=False)))
+        new_cell_counts[(subject, label)] = len(cell_indices) if cell_counts is None else cell_counts[(subject, label)]
+
+    replay_indices = np.concatenate(replay_indices)
+
+    return ReplayBuffer(feature_array[replay_indices], label_array[replay_indices], subject_array[replay_indices], new_cell_counts)
+
+
+def merge_replay_buffer(replay_buffer, feature_array, label_array, subject_array, replay_size, random_state=0):
+    '''
+    buffer of the pool grown by the new subjects' chunks, resampled to at most replay_size chunks
+    '''
+
+    subject_array = np.asarray(subject_array).astype(str)
+
+    cell_counts = dict(replay_buffer.cell_counts)
+    for cell in set(zip(subject_array, label_array.tolist())):
+        cell_counts[cell] = int(((subject_array == cell[0]) & (label_array == cell[1])).sum())
+
+    return build_replay_buffer(np.concatenate([replay_buffer.feature_array, feature_array]), np.concatenate([replay_buffer.label_array, label_array]), np.concatenate([replay_buffer.subject_array, subject_array]), replay_size, random_state, cell_counts)
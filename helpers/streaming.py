@@ -0,0 +1,250 @@
+#streaming inference: classify the latest window of a continuously arriving fNIRS recording every `stride` samples
+#
+#samples are text lines "subject_id,AB_I_O,AB_PHI_O,AB_I_DO,AB_PHI_DO,CD_I_O,CD_PHI_O,CD_I_DO,CD_PHI_DO" (same column order as brain_data.read_subject_csv_binary),
+#read from a local socket or by tailing a file. Scoring goes through any backend of inference_backends.py;
+#backends with create_stream (IncrementalBackend) keep their own per-subject state and reuse the conv outputs of the previous windows
+
+import os
+import time
+import socket
+import collections
+import numpy as np
+
+
+class RingBuffer():
+    '''
+    Fixed size buffer holding the latest `capacity` samples of one subject.
+    Every sample is written twice (at i and i + capacity), so the latest window is always a contiguous view and never needs a copy
+    '''
+
+    def __init__(self, capacity, num_features=8, dtype=np.float32):
+        self.capacity = capacity
+        self.buffer = np.zeros((2 * capacity, num_features), dtype=dtype)
+        self.position = 0
+        self.num_samples_seen = 0
+
+    def append(self, sample):
+        self.buffer[self.position] = sample
+        self.buffer[self.position + self.capacity] = sample
+        self.position = (self.position + 1) % self.capacity
+        self.num_samples_seen += 1
+
+    def __len__(self):
+        return min(self.num_samples_seen, self.capacity)
+
+    def latest(self, num_samples=None):
+        '''
+        view of the latest num_samples samples (default: all buffered samples), oldest first
+        '''
+        if num_samples is None:
+            num_samples = len(self)
+        assert num_samples <= len(self), 'only {} samples buffered'.format(len(self))
+
+        end = self.position + self.capacity
+        return self.buffer[end - num_samples:end]
+
+
+class LatencyRecorder():
+    '''
+    Keeps the latest `max_records` latencies (in seconds) and summarizes them
+    '''
+
+    def __init__(self, max_records=100000):
+        self.latencies = collections.deque(maxlen=max_records)
+
+    def update(self, latency):
+        self.latencies.append(latency)
+
+    def summary(self):
+        if len(self.latencies) == 0:
+            return {'num_windows': 0}
+
+        latency_array = np.array(self.latencies) * 1000
+        return {'num_windows': len(latency_array),
+                'mean_ms': float(np.mean(latency_array)),
+                'p50_ms': float(np.percentile(latency_array, 50)),
+                'p95_ms': float(np.percentile(latency_array, 95)),
+                'p99_ms': float(np.percentile(latency_array, 99)),
+                'max_ms': float(np.max(latency_array))}
+
+
+class StreamingClassifier():
+    '''
+    Per-subject ring buffers of the feature channels.
+    Once a subject has window_size samples, its latest window is classified, then again after every `stride` new samples
+    (stride 3 and window_size 150 reproduce the chunks of the size_30sec_150ts_stride_3ts data)
+    '''
+
+    def __init__(self, backend, window_size=150, stride=3, num_features=8, max_latency_records=100000):
+        self.backend = backend
+        self.window_size = window_size
+        self.stride = stride
+        self.num_features = num_features
+
+        self.buffers = dict()
+        self.samples_since_last_window = dict()
+        self.latency_recorder = LatencyRecorder(max_latency_records)
+
+    def push(self, subject_id, sample, arrival_time=None):
+        '''
+        add one sample; returns the prediction dict if a window was classified, else None
+        arrival_time: time.perf_counter() when the sample was received, used for the end-to-end latency
+        '''
+        if arrival_time is None:
+            arrival_time = time.perf_counter()
+
+        if subject_id not in self.buffers:
+            if hasattr(self.backend, 'create_stream'):
+                self.buffers[subject_id] = self.backend.create_stream()
+            else:
+                self.buffers[subject_id] = RingBuffer(self.window_size, self.num_features)
+            self.samples_since_last_window[subject_id] = 0
+
+        ring_buffer = self.buffers[subject_id]
+        ring_buffer.append(sample)
+        self.samples_since_last_window[subject_id] += 1
+
+        if ring_buffer.num_samples_seen < self.window_size:
+            return None
+
+        #the first full window is classified right away, then every stride samples
+        if ring_buffer.num_samples_seen > self.window_size and self.samples_since_last_window[subject_id] < self.stride:
+            return None
+
+        self.samples_since_last_window[subject_id] = 0
+
+        if isinstance(ring_buffer, RingBuffer):
+            window = ring_buffer.latest(self.window_size)
+            scores = self.backend.predict(window[np.newaxis])[0]
+        else:
+            scores = ring_buffer.score_latest()
+
+        latency = time.perf_counter() - arrival_time
+        self.latency_recorder.update(latency)
+
+        prediction_dict = dict()
+        prediction_dict['subject_id'] = subject_id
+        prediction_dict['window_end_sample'] = ring_buffer.num_samples_seen
+        prediction_dict['predicted_class'] = int(np.argmax(scores))
+        prediction_dict['scores'] = scores
+        prediction_dict['latency'] = latency
+
+        return prediction_dict
+
+    def run(self, sample_reader, callback=None):
+        '''
+        consume (subject_id, sample, arrival_time) tuples from a reader below until it is exhausted
+        '''
+        for subject_id, sample, arrival_time in sample_reader:
+            prediction_dict = self.push(subject_id, sample, arrival_time)
+
+            if prediction_dict is not None and callback is not None:
+                callback(prediction_dict)
+
+        return self.latency_recorder.summary()
+
+
+def parse_sample_line(line, num_features=8):
+    '''
+    raises ValueError for a line without subject_id plus num_features numeric values
+    '''
+    fields = line.strip().split(',')
+    if len(fields) != num_features + 1:
+        raise ValueError('expect subject_id plus {} feature values, got {} fields'.format(num_features, len(fields)))
+
+    return fields[0], np.array(fields[1:], dtype=np.float32)
+
+
+def parse_sample_line_or_skip(line, num_features=8):
+    '''
+    parse_sample_line for the readers below: a malformed line is logged and skipped (None) instead of ending the session of every subject
+    '''
+    try:
+        return parse_sample_line(line, num_features)
+    except ValueError as error:
+        print('skipping malformed sample line {!r}: {}'.format(line.strip(), error), flush=True)
+        return None
+
+
+def socket_sample_reader(address, num_features=8):
+    '''
+    Listen on a local socket and yield (subject_id, sample, arrival_time) for every line received.
+    address: 'host:port' for TCP, anything else is used as the path of a unix socket.
+    Producers connect one after another; the reader stops when a producer sends the line 'END'
+    '''
+
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server_socket.bind((host, int(port)))
+    else:
+        if os.path.exists(address):
+            os.remove(address)
+        server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server_socket.bind(address)
+
+    server_socket.listen(1)
+    print('waiting for samples on {}'.format(address), flush=True)
+
+    try:
+        while True:
+            connection, _ = server_socket.accept()
+            with connection, connection.makefile('r') as connection_file:
+                for line in connection_file:
+                    arrival_time = time.perf_counter()
+                    if line.strip() == 'END':
+                        return
+                    if line.strip() == '':
+                        continue
+
+                    parsed_line = parse_sample_line_or_skip(line, num_features)
+                    if parsed_line is None:
+                        continue
+
+                    subject_id, sample = parsed_line
+                    yield subject_id, sample, arrival_time
+    finally:
+        server_socket.close()
+
+
+def file_tail_reader(path, num_features=8, poll_interval=0.05, from_start=True, idle_timeout=None):
+    '''
+    Follow a growing text file (like tail -f) and yield (subject_id, sample, arrival_time) for every complete line.
+    Stops at a line 'END', or once no new line arrived for idle_timeout seconds (None: wait forever)
+    '''
+
+    with open(path, 'r') as f:
+        if not from_start:
+            f.seek(0, os.SEEK_END)
+
+        partial_line = ''
+        last_data_time = time.time()
+        while True:
+            line = f.readline()
+
+            if line == '':
+                if idle_timeout is not None and time.time() - last_data_time > idle_timeout:
+                    return
+                time.sleep(poll_interval)
+                continue
+
+            last_data_time = time.time()
+            partial_line += line
+            if not partial_line.endswith('\n'):
+                #the writer has not finished this line yet
+                continue
+
+            line, partial_line = partial_line, ''
+            arrival_time = time.perf_counter()
+            if line.strip() == 'END':
+                return
+            if line.strip() == '':
+                continue
+
+            parsed_line = parse_sample_line_or_skip(line, num_features)
+            if parsed_line is None:
+                continue
+
+            subject_id, sample = parsed_line
+            yield subject_id, sample, arrival_time
@@ -0,0 +1,150 @@
+#closed-form linear classifiers (ridge classifier, shrinkage LDA) on the 32 features of utils.featurize, solved from per-subject
+#sufficient statistics
+#
+#both models only see the train set through, per class k, the count n_k, the feature sum s_k = sum_i x_i and the gram matrix
+#G_k = sum_i x_i x_i^T. These are computed once per subject (SubjectStatistics); the statistics of any train pool (a bucket, a subgroup,
+#all subjects but one) are the sums of its subjects' statistics, and a fit is one [32, 32] solve per hyper setting instead of a pass over
+#the pool's chunks:
+#   ridge (RidgeClassifier, one +-1 target per class, centered)   (G - n mu mu^T + alpha I) W = T - n mu ybar^T
+#                                                                 with T[:, k] = 2 s_k - s and ybar_k = (2 n_k - n) / n
+#   shrinkage LDA (LinearDiscriminantAnalysis(solver='lsqr',     Sigma = sum_k n_k / n ((1 - shrinkage) C_k + shrinkage tr(C_k) / 32 I)
+#   shrinkage=float))                                             with C_k = G_k / n_k - m_k m_k^T, then Sigma W = [m_1 .. m_K]
+#
+#the weights are [32, num_classes] scores, predict is the argmax over the classes (for two classes, the same decisions as the single
+#logit of sklearn's binary models). Statistics are accumulated in float64
+
+import numpy as np
+
+
+class SubjectStatistics():
+    '''
+    per-subject, per-class counts [num_subjects, num_classes], sums [num_subjects, num_classes, 32] and grams
+    [num_subjects, num_classes, 32, 32] of the featurized chunks
+    '''
+
+    def __init__(self, subjects, classes, counts, sums, grams):
+        self.subjects = [str(subject) for subject in subjects]
+        self.classes = np.asarray(classes)
+        self.counts = counts
+        self.sums = sums
+        self.grams = grams
+        self.subject_index = {subject: index for index, subject in enumerate(self.subjects)}
+
+        #statistics of all the subjects, leave-one-subject-out pools are this minus one subject
+        self.total = (counts.sum(0), sums.sum(0), grams.sum(0))
+
+    @classmethod
+    def from_arrays(cls, feature_dict, label_dict, classes=None):
+        '''
+        feature_dict: subject -> featurized chunks [num_chunks, 32], label_dict: subject -> labels [num_chunks]
+        '''
+
+        subjects = list(feature_dict.keys())
+        if classes is None:
+            classes = np.unique(np.concatenate([label_dict[subject] for subject in subjects]))
+
+        num_features = feature_dict[subjects[0]].shape[1]
+        counts = np.zeros((len(subjects), len(classes)))
+        sums = np.zeros((len(subjects), len(classes), num_features))
+        grams = np.zeros((len(subjects), len(classes), num_features, num_features))
+
+        for subject_index, subject in enumerate(subjects):
+            features = np.asarray(feature_dict[subject], dtype=np.float64)
+            for class_index, label in enumerate(classes):
+                class_features = features[label_dict[subject] == label]
+                counts[subject_index, class_index] = len(class_features)
+                sums[subject_index, class_index] = class_features.sum(0)
+                grams[subject_index, class_index] = class_features.T @ class_features
+
+        return cls(subjects, classes, counts, sums, grams)
+
+    def pool(self, subjects):
+        '''
+        (counts, sums, grams) of a train pool
+        '''
+
+        indices = [self.subject_index[str(subject)] for subject in subjects]
+
+        return self.counts[indices].sum(0), self.sums[indices].sum(0), self.grams[indices].sum(0)
+
+    def subset(self, subjects):
+        '''
+        SubjectStatistics of some of the subjects, e.g. to take leave-one-subject-out pools within them
+        '''
+
+        indices = [self.subject_index[str(subject)] for subject in subjects]
+
+        return SubjectStatistics([self.subjects[index] for index in indices], self.classes, self.counts[indices], self.sums[indices], self.grams[indices])
+
+    def leave_one_out(self, subject):
+        '''
+        (counts, sums, grams) of all the subjects but one
+        '''
+
+        index = self.subject_index[str(subject)]
+        total_counts, total_sums, total_grams = self.total
+
+        return total_counts - self.counts[index], total_sums - self.sums[index], total_grams - self.grams[index]
+
+
+def solve_ridge(pool_statistics, alpha_list):
+    '''
+    RidgeClassifier(alpha) of a pool, for every alpha -> weights [num_alphas, 32, num_classes], intercepts [num_alphas, num_classes]
+    '''
+
+    counts, sums, grams = pool_statistics
+    num_samples = counts.sum()
+    num_features = grams.shape[-1]
+
+    feature_means = sums.sum(0) / num_samples
+    centered_gram = grams.sum(0) - num_samples * np.outer(feature_means, feature_means)
+
+    #+1 for the chunks of the class, -1 for the others
+    target_means = (2 * counts - num_samples) / num_samples
+    centered_cross = (2 * sums - sums.sum(0)).T - num_samples * np.outer(feature_means, target_means)
+
+    weights = np.stack([np.linalg.solve(centered_gram + alpha * np.eye(num_features), centered_cross) for alpha in alpha_list])
+    intercepts = target_means - feature_means @ weights
+
+    return weights, intercepts
+
+
+def solve_shrinkage_lda(pool_statistics, shrinkage_list):
+    '''
+    LinearDiscriminantAnalysis(solver='lsqr', shrinkage) of a pool, for every shrinkage in [0, 1] -> weights [num_shrinkages, 32, num_classes],
+    intercepts [num_shrinkages, num_classes]
+    '''
+
+    counts, sums, grams = pool_statistics
+    num_features = grams.shape[-1]
+    priors = counts / counts.sum()
+
+    class_means = sums / counts[:, None]
+    class_covariances = grams / counts[:, None, None] - class_means[:, :, None] * class_means[:, None, :]
+    #shrunk_covariance shrinks each class covariance towards its mean variance
+    class_mean_variances = np.trace(class_covariances, axis1=1, axis2=2) / num_features
+
+    pooled_covariance = np.einsum('k,kij->ij', priors, class_covariances)
+    pooled_mean_variance = priors @ class_mean_variances
+
+    weights = []
+    for shrinkage in shrinkage_list:
+        covariance = (1 - shrinkage) * pooled_covariance + shrinkage * pooled_mean_variance * np.eye(num_features)
+        weights.append(np.linalg.lstsq(covariance, class_means.T, rcond=None)[0])
+    weights = np.stack(weights)
+
+    intercepts = -0.5 * np.einsum('kd,sdk->sk', class_means, weights) + np.log(priors)
+
+    return weights, intercepts
+
+
+def predict_linear(weights, intercepts, classes, features):
+    '''
+    predictions [num_settings, num_chunks] of every setting's weights [num_settings, 32, num_classes], in one matrix product
+    '''
+
+    num_settings, num_features, num_classes = weights.shape
+    scores = np.asarray(features, dtype=np.float64) @ weights.transpose(1, 0, 2).reshape(num_features, -1)
+    scores = scores.reshape(len(features), num_settings, num_classes) + intercepts
+
+    return classes[scores.argmax(2).T]
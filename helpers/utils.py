@@ -49,7 +49,6 @@ def seed_everything(seed):
 def get_slope_and_intercept(column_values, return_value = 'w'):
     
     num_timesteps = len(column_values)
-    print('num_timesteps: {}'.format(num_timesteps))
     tvec_T = np.linspace(0, 1, num_timesteps) #already asserted len(column_values) = 10
     tdiff_T = tvec_T - np.mean(tvec_T)
     
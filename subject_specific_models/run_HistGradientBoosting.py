@@ -0,0 +1,215 @@
+import os
+import sys
+import numpy as np
+import argparse
+
+import time
+
+from easydict import EasyDict as edict
+
+YOUR_PATH = os.environ['YOUR_PATH']
+sys.path.insert(0, os.path.join(YOUR_PATH, 'fNIRS-mental-workload-classifiers/helpers'))
+import brain_data
+from model_bundles import featurizer_config, data_fingerprint, save_model_bundle
+from random_forest_grid import accuracy_from_probabilities
+from hist_gradient_boosting_grid import subject_specific_hist_gradient_boosting_hyper_settings, run_hist_gradient_boosting_grid
+from utils import seed_everything, featurize, makedir_if_not_exist, plot_confusion_matrix, save_pickle, write_performance_info_FixedTrainValSplit, write_program_time
+
+#subject-specific Histogram Gradient Boosting, for several subjects in one job: per subject the features are binned once for the whole
+#grid, with early stopping on the subject's cv val split (see hist_gradient_boosting_grid.py)
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--seed', default=0, type=int, help='random seed')
+parser.add_argument('--data_dir', default='../data/Leon/Visual/size_40sec_200ts_stride_3ts/', help='folder to the dataset')
+parser.add_argument('--window_size', default=200, type=int, help='window size')
+parser.add_argument('--result_save_rootdir', default='./experiments', help='folder to the result')
+parser.add_argument('--SubjectIds_of_interest', default=['1'], nargs='+', help='training personal models for which subjects')
+parser.add_argument('--classification_task', default='four_class', help='binary or four-class classification')
+parser.add_argument('--max_iter', default=500, type=int, help='max boosting iterations')
+parser.add_argument('--eval_every', default=10, type=int, help='boosting iterations between two checks of the validation log loss')
+parser.add_argument('--patience', default=5, type=int, help='early stopping after this many checks without improvement of the validation log loss')
+parser.add_argument('--num_workers', default=0, type=int, help='models fitted in parallel, 0: one per hyper setting up to the cpu budget')
+parser.add_argument('--cpu_budget', default=0, type=int, help='cpus shared by the parallel models, 0: all cpus')
+
+
+def train_classifier(args_dict):
+
+    #parse args:
+    data_dir = args_dict.data_dir
+    window_size = args_dict.window_size
+    result_save_rootdir = args_dict.result_save_rootdir
+    SubjectIds_of_interest = args_dict.SubjectIds_of_interest
+    classification_task = args_dict.classification_task
+
+    num_chunk_this_window_size = 1488
+
+    if classification_task == 'binary':
+        data_loading_function = brain_data.read_subject_csv_binary
+        confusion_matrix_figure_labels = ['0back', '2back']
+
+    else:
+        raise NameError('not supported classification type')
+
+    #same 1-fold cross validation split as run_EEGNet.py/run_DeepConvNet.py
+    if classification_task == 'binary':
+        if window_size == 200:
+            total_number_train_chunks = 304
+            total_index = np.arange(total_number_train_chunks)
+            train_index = total_index[:152]
+            val_index = total_index[152:]
+
+        elif window_size == 150:
+            total_number_train_chunks = 368
+            total_index = np.arange(total_number_train_chunks)
+            train_index = total_index[:184]
+            val_index = total_index[184:]
+
+        elif window_size == 100:
+            total_number_train_chunks = 436
+            total_index = np.arange(total_number_train_chunks)
+            train_index = total_index[:218]
+            val_index = total_index[218:]
+
+        elif window_size == 50:
+            total_number_train_chunks = 504
+            total_index = np.arange(total_number_train_chunks)
+            train_index = total_index[:252]
+            val_index = total_index[252:]
+
+        elif window_size == 25:
+            total_number_train_chunks = 536
+            total_index = np.arange(total_number_train_chunks)
+            train_index = total_index[:268]
+            val_index = total_index[268:]
+
+        elif window_size == 10:
+            total_number_train_chunks = 556
+            total_index = np.arange(total_number_train_chunks)
+            train_index = total_index[:278]
+            val_index = total_index[278:]
+
+        else:
+            raise NameError('not supported window size')
+    else:
+        raise NameError('not implemented classification task')
+
+
+    bundle_featurizer_config = featurizer_config(classification_task, window_size)
+
+    for SubjectId_of_interest in SubjectIds_of_interest:
+        start_time = time.time()
+
+        sub_feature_array, sub_label_array = data_loading_function(os.path.join(data_dir, 'sub_{}.csv'.format(SubjectId_of_interest)), num_chunk_this_window_size=num_chunk_this_window_size)
+
+        sub_data_len = len(sub_label_array)
+        #use 1st half as train, 2nd half as test
+        half_sub_data_len = int(sub_data_len/2)
+
+        transformed_sub_train_feature_array = featurize(sub_feature_array[:half_sub_data_len], classification_task)
+        sub_train_label_array = sub_label_array[:half_sub_data_len]
+
+        transformed_sub_test_feature_array = featurize(sub_feature_array[half_sub_data_len:], classification_task)
+        sub_test_label_array = sub_label_array[half_sub_data_len:]
+
+        #only do 1 fold cross validation:
+        sub_cv_train_feature_array = transformed_sub_train_feature_array[train_index]
+        sub_cv_train_label_array = sub_train_label_array[train_index]
+
+        sub_cv_val_feature_array = transformed_sub_train_feature_array[val_index]
+        sub_cv_val_label_array = sub_train_label_array[val_index]
+
+        train_fingerprint = data_fingerprint(sub_cv_train_feature_array, sub_cv_train_label_array)
+
+        #cross validation: all the hyper settings on the binned features of this subject, one predict_proba per model and evaluation set
+        grid_results = run_hist_gradient_boosting_grid(sub_cv_train_feature_array, sub_cv_train_label_array, {'val': sub_cv_val_feature_array, 'test': transformed_sub_test_feature_array}, sub_cv_val_label_array, subject_specific_hist_gradient_boosting_hyper_settings(), max_iter=args_dict.max_iter, eval_every=args_dict.eval_every, patience=args_dict.patience, num_workers=args_dict.num_workers, cpu_budget=args_dict.cpu_budget, return_models=True)
+
+        for experiment_name, _ in subject_specific_hist_gradient_boosting_hyper_settings():
+            #derived args
+            result_save_subjectdir = os.path.join(result_save_rootdir, SubjectId_of_interest, experiment_name)
+            result_save_subject_checkpointdir = os.path.join(result_save_subjectdir, 'checkpoint')
+            result_save_subject_predictionsdir = os.path.join(result_save_subjectdir, 'predictions')
+            result_save_subject_resultanalysisdir = os.path.join(result_save_subjectdir, 'result_analysis')
+            result_save_subject_trainingcurvedir = os.path.join(result_save_subjectdir, 'trainingcurve')
+
+            makedir_if_not_exist(result_save_subjectdir)
+            makedir_if_not_exist(result_save_subject_checkpointdir)
+            makedir_if_not_exist(result_save_subject_predictionsdir)
+            makedir_if_not_exist(result_save_subject_resultanalysisdir)
+            makedir_if_not_exist(result_save_subject_trainingcurvedir)
+
+            result_save_dict = dict()
+
+            classes = grid_results[experiment_name]['classes']
+            probabilities_dict = grid_results[experiment_name]['probabilities']
+
+            # val performance
+            val_accuracy = accuracy_from_probabilities(classes, probabilities_dict['val'], sub_cv_val_label_array)
+            result_save_dict['bestepoch_val_accuracy'] = val_accuracy
+
+            # test performance
+            test_logits = probabilities_dict['test']
+            test_accuracy = accuracy_from_probabilities(classes, test_logits, sub_test_label_array)
+            test_class_predictions = test_logits.argmax(1)
+
+            result_save_dict['bestepoch_test_accuracy'] = test_accuracy
+            result_save_dict['bestepoch_test_logits'] = test_logits.copy()
+            result_save_dict['bestepoch_test_class_labels'] = sub_test_label_array.copy()
+
+            plot_confusion_matrix(test_class_predictions, sub_test_label_array, confusion_matrix_figure_labels, result_save_subject_resultanalysisdir, 'test_confusion_matrix.png')
+
+            save_pickle(result_save_subject_predictionsdir, 'result_save_dict.pkl', result_save_dict)
+
+            #write performance to txt file
+            write_performance_info_FixedTrainValSplit('NA', result_save_subject_resultanalysisdir, val_accuracy, test_accuracy)
+
+            #save the fitted pipeline (see model_bundles.py)
+            save_model_bundle(result_save_subject_checkpointdir, grid_results[experiment_name]['model'], bundle_featurizer_config, train_fingerprint)
+
+        write_program_time(os.path.join(result_save_rootdir, SubjectId_of_interest), time.time() - start_time)
+
+
+
+
+if __name__=='__main__':
+
+    #parse args
+    args = parser.parse_args()
+
+    seed = args.seed
+    data_dir = args.data_dir
+    window_size = args.window_size
+    result_save_rootdir = args.result_save_rootdir
+    SubjectIds_of_interest = args.SubjectIds_of_interest
+    classification_task = args.classification_task
+    max_iter = args.max_iter
+    eval_every = args.eval_every
+    patience = args.patience
+    num_workers = args.num_workers
+    cpu_budget = args.cpu_budget
+
+    #sanity check
+    print('type(data_dir): {}'.format(type(data_dir)))
+    print('type(window_size): {}'.format(type(window_size)))
+    print('type(SubjectIds_of_interest): {}'.format(type(SubjectIds_of_interest)))
+    print('type(result_save_rootdir): {}'.format(type(result_save_rootdir)))
+    print('type(classification_task): {}'.format(type(classification_task)))
+    print('type(max_iter): {}'.format(type(max_iter)))
+    print('type(eval_every): {}'.format(type(eval_every)))
+    print('type(patience): {}'.format(type(patience)))
+    print('type(num_workers): {}'.format(type(num_workers)))
+    print('type(cpu_budget): {}'.format(type(cpu_budget)))
+
+    args_dict = edict()
+    args_dict.data_dir = data_dir
+    args_dict.window_size = window_size
+    args_dict.result_save_rootdir = result_save_rootdir
+    args_dict.SubjectIds_of_interest = SubjectIds_of_interest
+    args_dict.classification_task = classification_task
+    args_dict.max_iter = max_iter
+    args_dict.eval_every = eval_every
+    args_dict.patience = patience
+    args_dict.num_workers = num_workers
+    args_dict.cpu_budget = cpu_budget
+
+    seed_everything(seed)
+    train_classifier(args_dict)
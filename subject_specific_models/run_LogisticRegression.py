@@ -0,0 +1,218 @@
+import os
+import sys
+import numpy as np
+import argparse
+
+import time
+
+from easydict import EasyDict as edict
+from sklearn.linear_model import LogisticRegression
+
+YOUR_PATH = os.environ['YOUR_PATH']
+sys.path.insert(0, os.path.join(YOUR_PATH, 'fNIRS-mental-workload-classifiers/helpers'))
+import brain_data
+from model_bundles import featurizer_config, data_fingerprint, save_model_bundle
+from batched_logistic_regression import fit_batched_logistic_regression, batched_predict_proba
+from utils import seed_everything, featurize, makedir_if_not_exist, plot_confusion_matrix, save_pickle, write_performance_info_FixedTrainValSplit, write_program_time
+
+#subject-specific Logistic Regression for all the subjects and all the Cs at once: the 32-feature problems of every (subject, C) are
+#stacked and solved together (see batched_logistic_regression.py) instead of one sklearn fit per subject x C, one process per subject
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--seed', default=0, type=int, help='random seed')
+parser.add_argument('--data_dir', default='../data/Leon/Visual/size_40sec_200ts_stride_3ts/', help='folder to the dataset')
+parser.add_argument('--window_size', default=200, type=int, help='window size')
+parser.add_argument('--result_save_rootdir', default='./experiments', help='folder to the result')
+parser.add_argument('--SubjectIds_of_interest', default=['1'], nargs='+', help='training personal models for which subjects')
+parser.add_argument('--classification_task', default='four_class', help='binary or four-class classification')
+
+
+def train_classifier(args_dict):
+
+    #parse args:
+    data_dir = args_dict.data_dir
+    window_size = args_dict.window_size
+    result_save_rootdir = args_dict.result_save_rootdir
+    SubjectIds_of_interest = args_dict.SubjectIds_of_interest
+    classification_task = args_dict.classification_task
+
+    num_chunk_this_window_size = 1488
+
+    if classification_task == 'binary':
+        data_loading_function = brain_data.read_subject_csv_binary
+        confusion_matrix_figure_labels = ['0back', '2back']
+
+    else:
+        raise NameError('not supported classification type')
+
+    #same 1-fold cross validation split as run_EEGNet.py/run_DeepConvNet.py
+    if classification_task == 'binary':
+        if window_size == 200:
+            total_number_train_chunks = 304
+            total_index = np.arange(total_number_train_chunks)
+            train_index = total_index[:152]
+            val_index = total_index[152:]
+
+        elif window_size == 150:
+            total_number_train_chunks = 368
+            total_index = np.arange(total_number_train_chunks)
+            train_index = total_index[:184]
+            val_index = total_index[184:]
+
+        elif window_size == 100:
+            total_number_train_chunks = 436
+            total_index = np.arange(total_number_train_chunks)
+            train_index = total_index[:218]
+            val_index = total_index[218:]
+
+        elif window_size == 50:
+            total_number_train_chunks = 504
+            total_index = np.arange(total_number_train_chunks)
+            train_index = total_index[:252]
+            val_index = total_index[252:]
+
+        elif window_size == 25:
+            total_number_train_chunks = 536
+            total_index = np.arange(total_number_train_chunks)
+            train_index = total_index[:268]
+            val_index = total_index[268:]
+
+        elif window_size == 10:
+            total_number_train_chunks = 556
+            total_index = np.arange(total_number_train_chunks)
+            train_index = total_index[:278]
+            val_index = total_index[278:]
+
+        else:
+            raise NameError('not supported window size')
+    else:
+        raise NameError('not implemented classification task')
+
+
+    #load every subject's data
+    sub_cv_train_feature_list = []
+    sub_cv_train_label_list = []
+    sub_cv_val_feature_list = []
+    sub_cv_val_label_list = []
+    sub_test_feature_list = []
+    sub_test_label_list = []
+
+    for SubjectId_of_interest in SubjectIds_of_interest:
+        sub_feature_array, sub_label_array = data_loading_function(os.path.join(data_dir, 'sub_{}.csv'.format(SubjectId_of_interest)), num_chunk_this_window_size=num_chunk_this_window_size)
+
+        sub_data_len = len(sub_label_array)
+        #use 1st half as train, 2nd half as test
+        half_sub_data_len = int(sub_data_len/2)
+
+        transformed_sub_train_feature_array = featurize(sub_feature_array[:half_sub_data_len], classification_task)
+        sub_train_label_array = sub_label_array[:half_sub_data_len]
+
+        sub_cv_train_feature_list.append(transformed_sub_train_feature_array[train_index])
+        sub_cv_train_label_list.append(sub_train_label_array[train_index])
+        sub_cv_val_feature_list.append(transformed_sub_train_feature_array[val_index])
+        sub_cv_val_label_list.append(sub_train_label_array[val_index])
+        sub_test_feature_list.append(featurize(sub_feature_array[half_sub_data_len:], classification_task))
+        sub_test_label_list.append(sub_label_array[half_sub_data_len:])
+
+
+    #cross validation
+    Cs = np.logspace(-5,5,11)
+
+    start_time = time.time()
+
+    #[num_subjects, len(Cs), ...]: every subject x C at once
+    coef, intercept = fit_batched_logistic_regression(np.stack(sub_cv_train_feature_list), np.stack(sub_cv_train_label_list), Cs)
+    val_logits = batched_predict_proba(np.stack(sub_cv_val_feature_list), coef, intercept)
+    test_logits_array = batched_predict_proba(np.stack(sub_test_feature_list), coef, intercept)
+
+    total_time = time.time() - start_time
+    print('{} subjects x {} Cs fitted in {} seconds'.format(len(SubjectIds_of_interest), len(Cs), round(total_time, 3)), flush=True)
+
+    bundle_featurizer_config = featurizer_config(classification_task, window_size)
+
+    for subject_index, SubjectId_of_interest in enumerate(SubjectIds_of_interest):
+        sub_cv_val_label_array = sub_cv_val_label_list[subject_index]
+        sub_test_label_array = sub_test_label_list[subject_index]
+        train_fingerprint = data_fingerprint(sub_cv_train_feature_list[subject_index], sub_cv_train_label_list[subject_index])
+
+        for C_index, C in enumerate(Cs):
+            experiment_name = 'C{}'.format(C)
+
+            #derived args
+            result_save_subjectdir = os.path.join(result_save_rootdir, SubjectId_of_interest, experiment_name)
+            result_save_subject_checkpointdir = os.path.join(result_save_subjectdir, 'checkpoint')
+            result_save_subject_predictionsdir = os.path.join(result_save_subjectdir, 'predictions')
+            result_save_subject_resultanalysisdir = os.path.join(result_save_subjectdir, 'result_analysis')
+            result_save_subject_trainingcurvedir = os.path.join(result_save_subjectdir, 'trainingcurve')
+
+            makedir_if_not_exist(result_save_subjectdir)
+            makedir_if_not_exist(result_save_subject_checkpointdir)
+            makedir_if_not_exist(result_save_subject_predictionsdir)
+            makedir_if_not_exist(result_save_subject_resultanalysisdir)
+            makedir_if_not_exist(result_save_subject_trainingcurvedir)
+
+            result_save_dict = dict()
+
+            # val performance
+            val_accuracy = (val_logits[subject_index, C_index].argmax(1) == sub_cv_val_label_array).mean() * 100
+            result_save_dict['bestepoch_val_accuracy'] = val_accuracy
+
+            # test performance
+            test_logits = test_logits_array[subject_index, C_index]
+            test_class_predictions = test_logits.argmax(1)
+            test_accuracy = (test_class_predictions == sub_test_label_array).mean() * 100
+
+            result_save_dict['bestepoch_test_accuracy'] = test_accuracy
+            result_save_dict['bestepoch_test_logits'] = test_logits.copy()
+            result_save_dict['bestepoch_test_class_labels'] = sub_test_label_array.copy()
+
+            plot_confusion_matrix(test_class_predictions, sub_test_label_array, confusion_matrix_figure_labels, result_save_subject_resultanalysisdir, 'test_confusion_matrix.png')
+
+            save_pickle(result_save_subject_predictionsdir, 'result_save_dict.pkl', result_save_dict)
+
+            #write performance to txt file
+            write_performance_info_FixedTrainValSplit('NA', result_save_subject_resultanalysisdir, val_accuracy, test_accuracy)
+
+            #save the batched solution as the LogisticRegression(C=C) it stands for (see model_bundles.py)
+            model = LogisticRegression(C=C)
+            model.classes_ = np.array([0, 1])
+            model.coef_ = coef[subject_index, C_index][None].copy()
+            model.intercept_ = intercept[subject_index, C_index][None].copy()
+            model.n_features_in_ = model.coef_.shape[1]
+            model.n_iter_ = np.zeros(1, dtype=np.int32)
+            save_model_bundle(result_save_subject_checkpointdir, model, bundle_featurizer_config, train_fingerprint)
+
+        #each subject's share of the batched fit
+        write_program_time(os.path.join(result_save_rootdir, SubjectId_of_interest), total_time / len(SubjectIds_of_interest))
+
+
+
+
+if __name__=='__main__':
+
+    #parse args
+    args = parser.parse_args()
+
+    seed = args.seed
+    data_dir = args.data_dir
+    window_size = args.window_size
+    result_save_rootdir = args.result_save_rootdir
+    SubjectIds_of_interest = args.SubjectIds_of_interest
+    classification_task = args.classification_task
+
+    #sanity check
+    print('type(data_dir): {}'.format(type(data_dir)))
+    print('type(window_size): {}'.format(type(window_size)))
+    print('type(SubjectIds_of_interest): {}'.format(type(SubjectIds_of_interest)))
+    print('type(result_save_rootdir): {}'.format(type(result_save_rootdir)))
+    print('type(classification_task): {}'.format(type(classification_task)))
+
+    args_dict = edict()
+    args_dict.data_dir = data_dir
+    args_dict.window_size = window_size
+    args_dict.result_save_rootdir = result_save_rootdir
+    args_dict.SubjectIds_of_interest = SubjectIds_of_interest
+    args_dict.classification_task = classification_task
+
+    seed_everything(seed)
+    train_classifier(args_dict)
@@ -0,0 +1,195 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import argparse
+
+import time
+
+from easydict import EasyDict as edict
+
+YOUR_PATH = os.environ['YOUR_PATH']
+sys.path.insert(0, os.path.join(YOUR_PATH, 'fNIRS-mental-workload-classifiers/helpers'))
+import brain_data
+from model_bundles import featurizer_config, data_fingerprint, save_model_bundle
+from online_calibration import OnlineLogisticRegression
+from utils import seed_everything, featurize, makedir_if_not_exist, plot_confusion_matrix, save_pickle, write_performance_info_FixedTrainValSplit, write_program_time, write_inference_time
+
+#online-calibration counterpart of run_LogisticRegression.py: the first half of the subject's session (the calibration windows) arrives
+#windows_per_update windows at a time, in recording order, and every batch is one partial_fit step of an SGD logistic regression (see
+#online_calibration.py). Each batch is scored before the update (prequential accuracy, reported as the val accuracy) and the test set
+#(2nd half) is scored after every update, which gives test accuracy as a function of the calibration windows seen
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--seed', default=0, type=int, help='random seed')
+parser.add_argument('--data_dir', default='../data/Leon/Visual/size_40sec_200ts_stride_3ts/', help='folder to the dataset')
+parser.add_argument('--window_size', default=200, type=int, help='window size')
+parser.add_argument('--result_save_rootdir', default='./experiments', help='folder to the result')
+parser.add_argument('--SubjectIds_of_interest', default=['1'], nargs='+', help='training personal models for which subjects')
+parser.add_argument('--classification_task', default='four_class', help='binary or four-class classification')
+
+#parameter for online calibration
+parser.add_argument('--windows_per_update', default=8, type=int, help='number of calibration windows arriving together')
+parser.add_argument('--passes_per_update', default=1, type=int, help='SGD passes over each arriving batch')
+parser.add_argument('--alpha_list', default=[1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0], nargs='+', type=float, help='L2 penalties of the SGD logistic regression')
+parser.add_argument('--average', default=0, type=int, help='1: averaged SGD')
+
+
+def train_classifier(args_dict):
+
+    #parse args:
+    data_dir = args_dict.data_dir
+    window_size = args_dict.window_size
+    result_save_rootdir = args_dict.result_save_rootdir
+    SubjectIds_of_interest = args_dict.SubjectIds_of_interest
+    classification_task = args_dict.classification_task
+    windows_per_update = args_dict.windows_per_update
+    passes_per_update = args_dict.passes_per_update
+    alpha_list = args_dict.alpha_list
+    average = bool(args_dict.average)
+
+    num_chunk_this_window_size = 1488
+
+    if classification_task == 'binary':
+        data_loading_function = brain_data.read_subject_csv_binary
+        confusion_matrix_figure_labels = ['0back', '2back']
+
+    else:
+        raise NameError('not supported classification type')
+
+    bundle_featurizer_config = featurizer_config(classification_task, window_size)
+
+    for SubjectId_of_interest in SubjectIds_of_interest:
+        sub_feature_array, sub_label_array = data_loading_function(os.path.join(data_dir, 'sub_{}.csv'.format(SubjectId_of_interest)), num_chunk_this_window_size=num_chunk_this_window_size)
+
+        sub_data_len = len(sub_label_array)
+        #use 1st half as the calibration stream, 2nd half as test
+        half_sub_data_len = int(sub_data_len/2)
+
+        sub_calibration_feature_array = sub_feature_array[:half_sub_data_len]
+        sub_calibration_label_array = sub_label_array[:half_sub_data_len]
+
+        transformed_sub_test_feature_array = featurize(sub_feature_array[half_sub_data_len:], classification_task)
+        sub_test_label_array = sub_label_array[half_sub_data_len:]
+
+        for alpha in alpha_list:
+            experiment_name = 'alpha{}'.format(alpha)
+
+            #derived args
+            result_save_subjectdir = os.path.join(result_save_rootdir, SubjectId_of_interest, experiment_name)
+            result_save_subject_checkpointdir = os.path.join(result_save_subjectdir, 'checkpoint')
+            result_save_subject_predictionsdir = os.path.join(result_save_subjectdir, 'predictions')
+            result_save_subject_resultanalysisdir = os.path.join(result_save_subjectdir, 'result_analysis')
+            result_save_subject_trainingcurvedir = os.path.join(result_save_subjectdir, 'trainingcurve')
+
+            makedir_if_not_exist(result_save_subjectdir)
+            makedir_if_not_exist(result_save_subject_checkpointdir)
+            makedir_if_not_exist(result_save_subject_predictionsdir)
+            makedir_if_not_exist(result_save_subject_resultanalysisdir)
+            makedir_if_not_exist(result_save_subject_trainingcurvedir)
+
+            result_save_dict = dict()
+
+            model = OnlineLogisticRegression(classes=[0, 1], alpha=alpha, passes_per_update=passes_per_update, average=average, random_state=0)
+
+            online_curve = []
+            num_prequential_correct = 0
+            num_prequential_scored = 0
+            calibration_time = 0.0
+            for start in range(0, half_sub_data_len, windows_per_update):
+                #featurize the windows as they arrive
+                update_start_time = time.time()
+                transformed_batch_feature_array = featurize(sub_calibration_feature_array[start:start + windows_per_update], classification_task)
+                batch_label_array = sub_calibration_label_array[start:start + windows_per_update]
+
+                #score the batch before learning from it
+                if model.is_ready:
+                    num_prequential_correct += (model.predict_proba(transformed_batch_feature_array).argmax(1) == batch_label_array).sum()
+                    num_prequential_scored += len(batch_label_array)
+
+                model.partial_fit(transformed_batch_feature_array, batch_label_array)
+                calibration_time += time.time() - update_start_time
+
+                if model.is_ready:
+                    online_curve.append(dict(num_calibration_windows=model.num_windows_seen, test_accuracy=model.score(transformed_sub_test_feature_array, sub_test_label_array) * 100))
+
+            # val performance: prequential accuracy on the calibration stream
+            val_accuracy = num_prequential_correct / max(num_prequential_scored, 1) * 100
+            result_save_dict['bestepoch_val_accuracy'] = val_accuracy
+
+            # test performance
+            inference_start_time = time.time()
+            test_logits = model.predict_proba(transformed_sub_test_feature_array)
+            inference_time = time.time() - inference_start_time
+
+            test_class_predictions = test_logits.argmax(1)
+            test_accuracy = (test_class_predictions == sub_test_label_array).mean() * 100
+
+            result_save_dict['bestepoch_test_accuracy'] = test_accuracy
+            result_save_dict['bestepoch_test_logits'] = test_logits.copy()
+            result_save_dict['bestepoch_test_class_labels'] = sub_test_label_array.copy()
+
+            plot_confusion_matrix(test_class_predictions, sub_test_label_array, confusion_matrix_figure_labels, result_save_subject_resultanalysisdir, 'test_confusion_matrix.png')
+
+            save_pickle(result_save_subject_predictionsdir, 'result_save_dict.pkl', result_save_dict)
+
+            #test accuracy after each update
+            pd.DataFrame(online_curve).to_csv(os.path.join(result_save_subject_trainingcurvedir, 'online_curve.csv'), index=False)
+
+            #write performance to txt file
+            write_performance_info_FixedTrainValSplit('NA', result_save_subject_resultanalysisdir, val_accuracy, test_accuracy)
+
+            #save the fitted pipeline (scaler + SGD classifier), fingerprinted with the whole featurized calibration stream
+            train_fingerprint = data_fingerprint(featurize(sub_calibration_feature_array, classification_task), sub_calibration_label_array)
+            save_model_bundle(result_save_subject_checkpointdir, model.pipeline(), bundle_featurizer_config, train_fingerprint, extra={'calibration_mode': 'online', 'num_calibration_windows': model.num_windows_seen, 'windows_per_update': windows_per_update, 'passes_per_update': passes_per_update})
+
+            #write the time spent on the calibration stream (featurize + updates) to txt file
+            write_program_time(result_save_subject_resultanalysisdir, calibration_time)
+            write_inference_time(result_save_subject_resultanalysisdir, inference_time)
+
+            first_ready = online_curve[0] if len(online_curve) > 0 else dict(num_calibration_windows='NA', test_accuracy='NA')
+            print('subject {} {}: test accuracy {} after {} windows -> {} after {} windows ({} seconds of calibration)'.format(SubjectId_of_interest, experiment_name, first_ready['test_accuracy'], first_ready['num_calibration_windows'], test_accuracy, model.num_windows_seen, round(calibration_time, 3)), flush=True)
+
+
+
+
+if __name__=='__main__':
+
+    #parse args
+    args = parser.parse_args()
+
+    seed = args.seed
+    data_dir = args.data_dir
+    window_size = args.window_size
+    result_save_rootdir = args.result_save_rootdir
+    SubjectIds_of_interest = args.SubjectIds_of_interest
+    classification_task = args.classification_task
+    windows_per_update = args.windows_per_update
+    passes_per_update = args.passes_per_update
+    alpha_list = args.alpha_list
+    average = args.average
+
+    #sanity check
+    print('type(data_dir): {}'.format(type(data_dir)))
+    print('type(window_size): {}'.format(type(window_size)))
+    print('type(SubjectIds_of_interest): {}'.format(type(SubjectIds_of_interest)))
+    print('type(result_save_rootdir): {}'.format(type(result_save_rootdir)))
+    print('type(classification_task): {}'.format(type(classification_task)))
+    print('windows_per_update: {} type: {}'.format(windows_per_update, type(windows_per_update)))
+    print('passes_per_update: {} type: {}'.format(passes_per_update, type(passes_per_update)))
+    print('alpha_list: {} type: {}'.format(alpha_list, type(alpha_list)))
+    print('average: {} type: {}'.format(average, type(average)))
+
+    args_dict = edict()
+    args_dict.data_dir = data_dir
+    args_dict.window_size = window_size
+    args_dict.result_save_rootdir = result_save_rootdir
+    args_dict.SubjectIds_of_interest = SubjectIds_of_interest
+    args_dict.classification_task = classification_task
+    args_dict.windows_per_update = windows_per_update
+    args_dict.passes_per_update = passes_per_update
+    args_dict.alpha_list = alpha_list
+    args_dict.average = average
+
+    seed_everything(seed)
+    train_classifier(args_dict)
@@ -0,0 +1,41 @@
+import os
+import argparse
+import pandas as pd
+
+#side by side comparison of the two CORAL modes of the domain_adaptation runners (--coral_mode source / target), from the
+#AllSubjects_summary.csv that synthesize_all_subjects.py writes for each of them
+
+def main(source_summary_csv, target_summary_csv, summary_save_dir):
+
+    columns = ['subject_id', 'bucket', 'max_validation_accuracy', 'corresponding_test_accuracy', 'experiment_folder']
+
+    source_df = pd.read_csv(source_summary_csv)[columns]
+    target_df = pd.read_csv(target_summary_csv)[columns]
+
+    comparison_df = source_df.merge(target_df, on=['subject_id', 'bucket'], how='outer', suffixes=('_source_mode', '_target_mode'))
+    comparison_df['test_accuracy_target_minus_source'] = comparison_df['corresponding_test_accuracy_target_mode'] - comparison_df['corresponding_test_accuracy_source_mode']
+    comparison_df = comparison_df.sort_values(by=['bucket', 'subject_id'])
+
+    comparison_df.to_csv(os.path.join(summary_save_dir, 'CORAL_modes_comparison.csv'), index=False)
+
+    print(comparison_df.drop(columns=['experiment_folder_source_mode', 'experiment_folder_target_mode']).to_string(index=False))
+    print('\nmean test accuracy, source mode: {}, target mode: {} ({} subjects)'.format(comparison_df['corresponding_test_accuracy_source_mode'].mean(), comparison_df['corresponding_test_accuracy_target_mode'].mean(), len(comparison_df)))
+
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--source_experiment_dir', help='experiment_dir passed to synthesize_all_subjects.py for the --coral_mode source runs')
+    parser.add_argument('--target_experiment_dir', help='experiment_dir passed to synthesize_all_subjects.py for the --coral_mode target runs')
+
+    #parse args
+    args = parser.parse_args()
+
+    source_summary_csv = os.path.join(args.source_experiment_dir + '_summary', 'AllSubjects_summary.csv')
+    target_summary_csv = os.path.join(args.target_experiment_dir + '_summary', 'AllSubjects_summary.csv')
+    assert os.path.exists(source_summary_csv), 'The summary {} does not exist, run synthesize_all_subjects.py first'.format(source_summary_csv)
+    assert os.path.exists(target_summary_csv), 'The summary {} does not exist, run synthesize_all_subjects.py first'.format(target_summary_csv)
+
+    summary_save_dir = args.target_experiment_dir + '_summary'
+
+    main(source_summary_csv, target_summary_csv, summary_save_dir)